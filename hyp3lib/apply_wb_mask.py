@@ -7,6 +7,8 @@ from tempfile import NamedTemporaryFile
 
 from osgeo import gdal, ogr
 
+from hyp3lib import gdal_config
+
 
 def get_water_mask(upper_left, lower_right, res, gcs=True, mask_value=1):
     mask_location = '/vsicurl/https://asf-dem-west.s3.amazonaws.com/WATER_MASK'
@@ -46,7 +48,7 @@ def get_water_mask(upper_left, lower_right, res, gcs=True, mask_value=1):
 
         coords = [xmin, ymax, xmax, ymin]
         with NamedTemporaryFile() as tmpfile:
-            gdal.Translate(tmpfile.name, mask_file, projWin=coords, xRes=res, yRes=res)
+            gdal_config.translate(tmpfile.name, mask_file, projWin=coords, xRes=res, yRes=res)
             srs_ds = gdal.Open(tmpfile.name)
             mask = srs_ds.GetRasterBand(1).ReadAsArray()
             del srs_ds
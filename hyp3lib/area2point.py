@@ -2,8 +2,8 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import glob
 import os
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
-from osgeo import gdal
 
 
 # Gamma program data2geotiff shifts the corner coordinates
@@ -30,7 +30,7 @@ def fix_geotiff_locations(dir="PRODUCT"):
             saa.write_gdal_file_byte(tmpfile,t1,p1,data)
         else:
             saa.write_gdal_file_float(tmpfile,t1,p1,data,nodata=0)
-        gdal.Translate(myfile,tmpfile,metadataOptions=['AREA_OR_POINT=Point'],noData="0")
+        gdal_config.translate(myfile,tmpfile,metadataOptions=['AREA_OR_POINT=Point'],noData="0")
         os.remove(tmpfile)
     os.chdir(back)
 
@@ -1,5 +1,6 @@
 import csv
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from osgeo import gdal, ogr, osr
@@ -7,6 +8,8 @@ from osgeo.gdalconst import GA_ReadOnly
 from scipy import ndimage
 
 from hyp3lib import GeometryError
+from hyp3lib import gdal_config
+from hyp3lib.envelope_index import EnvelopeIndex
 from hyp3lib.saa_func_lib import get_zone
 
 
@@ -43,7 +46,8 @@ def geotiff2polygon(geotiff):
   return polygon
 
 
-def geotiff2boundary_mask(inGeotiff, tsEPSG, threshold, use_closing=True):
+def geotiff2boundary_mask(inGeotiff, tsEPSG, threshold, use_closing=True,
+  decimation=1):
 
   inRaster = gdal.Open(inGeotiff)
   proj = osr.SpatialReference()
@@ -61,7 +65,20 @@ def geotiff2boundary_mask(inGeotiff, tsEPSG, threshold, use_closing=True):
   geoTrans = inRaster.GetGeoTransform()
   inBand = inRaster.GetRasterBand(1)
   noDataValue = inBand.GetNoDataValue()
-  data = inBand.ReadAsArray()
+
+  ### Read a decimated image (from overviews, if there are any), with the
+  ### pixel size scaled to cover the same extent
+  iterations = 10
+  if decimation > 1:
+    cols = max(int(np.ceil(inRaster.RasterXSize / decimation)), 1)
+    rows = max(int(np.ceil(inRaster.RasterYSize / decimation)), 1)
+    data = inBand.ReadAsArray(buf_xsize=cols, buf_ysize=rows,
+      resample_alg=gdal.GRIORA_NearestNeighbour)
+    geoTrans = (geoTrans[0], geoTrans[1]*inRaster.RasterXSize/cols, 0,
+      geoTrans[3], 0, geoTrans[5]*inRaster.RasterYSize/rows)
+    iterations = max(int(np.ceil(iterations / decimation)), 1)
+  else:
+    data = inBand.ReadAsArray()
   minValue = np.min(data)
 
   ### Check for black fill
@@ -73,14 +90,13 @@ def geotiff2boundary_mask(inGeotiff, tsEPSG, threshold, use_closing=True):
     data[np.isnan(data)==True] = noDataValue
     if threshold is not None:
       print('Applying threshold ({0}) ...'.format(threshold))
-      data[data<np.float(threshold)] = noDataValue
+      data[data<float(threshold)] = noDataValue
     if noDataValue == np.nan or noDataValue == -np.nan:
       data[np.isnan(data)==False] = 1
     else:
       data[data>noDataValue] = 1
     if use_closing:
-      data = ndimage.binary_closing(data, iterations=10,
-        structure=np.ones((3,3))).astype(data.dtype)
+      data = edge_band_closing(data, iterations=iterations).astype(data.dtype)
     inRaster = None
 
     (data, colFirst, rowFirst, geoTrans) = cut_blackfill(data, geoTrans)
@@ -88,6 +104,33 @@ def geotiff2boundary_mask(inGeotiff, tsEPSG, threshold, use_closing=True):
   return (data, colFirst, rowFirst, geoTrans, proj)
 
 
+def edge_band_closing(data, iterations=10, tileSize=256):
+
+  ### Binary closing (3x3 structure) computed only in the band along the
+  ### edges of the mask: tiles whose neighborhood is all background, or all
+  ### foreground away from the image border, are left as they are. Each
+  ### tile is closed with a halo covering the reach of the closing, so the
+  ### result is identical to closing the whole image at once
+  mask = data != 0
+  (rows, cols) = mask.shape
+  halo = 2*iterations
+  closed = mask.copy()
+  for row in range(0, rows, tileSize):
+    for col in range(0, cols, tileSize):
+      (r0, r1) = (max(row - halo, 0), min(row + tileSize + halo, rows))
+      (c0, c1) = (max(col - halo, 0), min(col + tileSize + halo, cols))
+      window = mask[r0:r1,c0:c1]
+      border = r0 == 0 or c0 == 0 or r1 == rows or c1 == cols
+      if not window.any() or (window.all() and not border):
+        continue
+      tile = ndimage.binary_closing(window, iterations=iterations,
+        structure=np.ones((3,3)))
+      closed[row:row+tileSize,col:col+tileSize] = \
+        tile[row-r0:row-r0+tileSize,col-c0:col-c0+tileSize]
+
+  return closed
+
+
 def reproject2grid(inRaster, tsEPSG, xRes = None ):
 
   # Read basic metadata
@@ -103,7 +146,7 @@ def reproject2grid(inRaster, tsEPSG, xRes = None ):
   resampleAlg = gdal.GRA_Bilinear
   options = ['COMPRESS=DEFLATE']
 
-  outRaster = gdal.Warp('', inRaster, format=rasterFormat, dstSRS=proj,
+  outRaster = gdal_config.warp('', inRaster, format=rasterFormat, dstSRS=proj,
     targetAlignedPixels=True, xRes=xRes, yRes=yRes, resampleAlg=resampleAlg,
     options=options)
   inRaster = None
@@ -113,19 +156,19 @@ def reproject2grid(inRaster, tsEPSG, xRes = None ):
 
 def cut_blackfill(data, geoTrans):
 
-  originX = geoTrans[0]
-  originY = geoTrans[3]
-  pixelSize = geoTrans[1]
-  colProfile = list(data.max(axis=1))
-  rows = colProfile.count(1)
-  rowFirst = colProfile.index(1)
-  rowProfile = list(data.max(axis=0))
-  cols = rowProfile.count(1)
-  colFirst = rowProfile.index(1)
-  originX += colFirst*pixelSize
-  originY -= rowFirst*pixelSize
-  data = data[rowFirst:rows+rowFirst,colFirst:cols+colFirst]
-  geoTrans = (originX, pixelSize, 0, originY, 0, -pixelSize)
+  ### Extent of the valid data (value of one)
+  valid = data == 1
+  validRows = np.flatnonzero(valid.any(axis=1))
+  validCols = np.flatnonzero(valid.any(axis=0))
+  if validRows.size == 0:
+    raise GeometryError('Could not find any valid data outside the black fill')
+  (rowFirst, rowLast) = (int(validRows[0]), int(validRows[-1]))
+  (colFirst, colLast) = (int(validCols[0]), int(validCols[-1]))
+
+  originX = geoTrans[0] + colFirst*geoTrans[1]
+  originY = geoTrans[3] + rowFirst*geoTrans[5]
+  data = data[rowFirst:rowLast+1,colFirst:colLast+1]
+  geoTrans = (originX, geoTrans[1], 0, originY, 0, geoTrans[5])
 
   return (data, colFirst, rowFirst, geoTrans)
 
@@ -232,7 +275,7 @@ def shape2geometry_ext(shapeFile):
 
 
 # Save geometry with fields to shapefile
-def geometry2shape(fields, values, spatialRef, merge, shapeFile):
+def geometry2shape(fields, values, spatialRef, merge, shapeFile, processes=1):
 
   driver = ogr.GetDriverByName('ESRI Shapefile')
   if os.path.exists(shapeFile):
@@ -249,9 +292,8 @@ def geometry2shape(fields, values, spatialRef, merge, shapeFile):
     outLayer.CreateField(fieldDefinition)
   featureDefinition = outLayer.GetLayerDefn()
   if merge == True:
-    combine = ogr.Geometry(ogr.wkbMultiPolygon)
-    for value in values:
-      combine = combine.Union(value['geometry'])
+    combine = union_geometries([value['geometry'] for value in values],
+      processes=processes)
     outFeature = ogr.Feature(featureDefinition)
     for field in fields:
       name = field['name']
@@ -417,16 +459,82 @@ def raster2csv(fields, values, csvFile):
     writer.writerow(line)
 
 
+# Collect the 2D polygons of a geometry, flattening multi-polygons and
+# collections; returns False for geometries that are not (only) polygons
+def _collect_polygons(geometry, collection):
+
+  geometryType = ogr.GT_Flatten(geometry.GetGeometryType())
+  if geometryType == ogr.wkbPolygon:
+    polygon = geometry.Clone()
+    polygon.FlattenTo2D()
+    collection.AddGeometry(polygon)
+    return True
+  if geometryType in (ogr.wkbMultiPolygon, ogr.wkbGeometryCollection):
+    return all([_collect_polygons(geometry.GetGeometryRef(ii), collection)
+      for ii in range(geometry.GetGeometryCount())])
+  return False
+
+
 # Combine all geometries in a list
-def union_geometries(geometries):
+def _cascaded_union(geometries):
+
+  ### Collect the polygons and union them all at once; GEOS reduces them in
+  ### a balanced tree, so each union works on geometries of similar size
+  collection = ogr.Geometry(ogr.wkbMultiPolygon)
+  if not all([_collect_polygons(geometry, collection) for geometry in geometries]):
+    ### Points, lines, and curves can't be collected as polygons, so union
+    ### them one by one instead
+    combine = ogr.Geometry(ogr.wkbMultiPolygon)
+    for geometry in geometries:
+      combine = combine.Union(geometry)
+    return combine
+  if collection.IsEmpty():
+    return collection
+
+  return collection.UnionCascaded()
+
 
-  combine = ogr.Geometry(ogr.wkbMultiPolygon)
-  for geometry in geometries:
-    combine = combine.Union(geometry)
+def _cascaded_union_wkb(wkbs):
+
+  geometries = [ogr.CreateGeometryFromWkb(bytes(wkb)) for wkb in wkbs]
+  return bytes(_cascaded_union(geometries).ExportToWkb())
+
+
+def union_geometries(geometries, processes=1, chunkSize=256):
+
+  geometries = list(geometries)
+  if not geometries:
+    return ogr.Geometry(ogr.wkbMultiPolygon)
+
+  ### Union chunks of geometries in a pool of processes (as WKB), then
+  ### union the partial results
+  if processes > 1 and len(geometries) > chunkSize:
+    chunks = [[bytes(geometry.ExportToWkb()) for geometry in
+      geometries[ii:ii+chunkSize]] for ii in range(0, len(geometries), chunkSize)]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+      partial = list(executor.map(_cascaded_union_wkb, chunks))
+    combine = ogr.CreateGeometryFromWkb(_cascaded_union_wkb(partial))
+  else:
+    combine = _cascaded_union(geometries)
+
+  spatialRef = geometries[0].GetSpatialReference()
+  if spatialRef is not None:
+    combine.AssignSpatialReference(spatialRef)
 
   return combine
 
 
+def envelope_index(geometries):
+
+  return EnvelopeIndex([geometry.GetEnvelope() for geometry in geometries])
+
+
+def envelope_candidates(index, geometry):
+
+  ### Indices of the geometries whose envelopes overlap the geometry's envelope
+  return index.candidates(geometry.GetEnvelope())
+
+
 def spatial_query(source, reference, function):
 
   # Extract information from tiles and boundary shapefiles
@@ -437,19 +545,27 @@ def spatial_query(source, reference, function):
   if boundary is None:
     raise GeometryError(f'Could not extract information (granule) out of shapefile {source}')
 
-  # Perform the spatial analysis
-  i = 0
+  # Index the tile envelopes, and only test the tiles whose envelopes overlap
+  # a boundary; tiles intersect a boundary if their interiors overlap
+  tiles = list(geoTile)
+  index = envelope_index(tiles)
+  selected = set()
+  if function == 'intersects':
+    for bound in boundary:
+      for ii in envelope_candidates(index, bound):
+        if ii not in selected and tiles[ii].Intersects(bound) and \
+          not tiles[ii].Touches(bound):
+          selected.add(ii)
+
+  # Keep the first part of each tile, in tile order
   tile = []
+  names = set()
   multipolygon = ogr.Geometry(ogr.wkbMultiPolygon)
-  for geo in geoTile:
-    for bound in boundary:
-      if function == 'intersects':
-        intersection = bound.Intersection(geo)
-        if intersection.GetGeometryName() == 'POLYGON':
-          if nameTile[i] not in tile:
-            tile.append(nameTile[i])
-            multipolygon.AddGeometry(geo)
-    i = i + 1
+  for ii in sorted(selected):
+    if nameTile[ii] not in names:
+      names.add(nameTile[ii])
+      tile.append(nameTile[ii])
+      multipolygon.AddGeometry(tiles[ii])
 
   return (multipolygon, tile)
 
@@ -572,7 +688,24 @@ def raster_meta(rasterFile):
   return (spatialRef, gt, shape, pixel)
 
 
-def overlapMask(meta, maskShape, invert, outFile):
+def local_mask_copy(maskShape, localFile):
+
+  ### Copy a (possibly remote) mask to a local GeoPackage, which keeps an
+  ### R-tree spatial index of its features; an existing copy that is newer
+  ### than a local mask is reused
+  if os.path.exists(localFile):
+    if not os.path.exists(maskShape) or \
+      os.path.getmtime(localFile) >= os.path.getmtime(maskShape):
+      return localFile
+  tempFile = '{0}.{1}.gpkg'.format(os.path.splitext(localFile)[0], os.getpid())
+  gdal.VectorTranslate(tempFile, maskShape, format='GPKG',
+    layerCreationOptions=['SPATIAL_INDEX=YES'])
+  os.replace(tempFile, localFile)
+
+  return localFile
+
+
+def overlapMask(meta, maskShape, invert, outFile, localFile=None):
 
   ### Extract metadata
   posting = meta['pixelSize']
@@ -583,11 +716,14 @@ def overlapMask(meta, maskShape, invert, outFile):
   dataCols = meta['cols']
   geoEPSG = 4326
 
-  ### Extract mask polygon
-  ogrDriver = ogr.GetDriverByName('ESRI Shapefile')
-  inShape = ogrDriver.Open(maskShape)
-  outLayer = inShape.GetLayer()
-  outProj = outLayer.GetSpatialRef()
+  ### Extract mask polygon, from a local indexed copy (if requested)
+  if localFile is not None:
+    maskShape = local_mask_copy(maskShape, localFile)
+  inShape = ogr.Open(maskShape)
+  if inShape is None:
+    raise GeometryError(f'Could not open mask file {maskShape}')
+  inLayer = inShape.GetLayer()
+  outProj = inLayer.GetSpatialRef()
   outEPSG = int(outProj.GetAttrValue('AUTHORITY', 1))
   if geoEPSG != outEPSG:
     raise GeometryError(f'Expecting mask file with EPSG code: {geoEPSG}')
@@ -597,31 +733,53 @@ def overlapMask(meta, maskShape, invert, outFile):
   inProj.ImportFromEPSG(4326)
   outProj = osr.SpatialReference()
   outProj.ImportFromEPSG(imageEPSG)
+  if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+    inProj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    outProj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
   transform = osr.CoordinateTransformation(inProj, outProj)
 
-  ### Loop through features
+  ### Fetch only the features near each boundary with a spatial filter,
+  ### which uses the spatial index of the mask (if it has one), and clip each
+  ### of them to the boundaries once
+  boundaries = union_geometries(list(multiBoundary))
+  candidates = {}
   for boundary in multiBoundary:
-    for feature in outLayer:
-      outMultipolygon = ogr.Geometry(ogr.wkbMultiPolygon)
-      inMultiPolygon = feature.GetGeometryRef()
-      for polygon in inMultiPolygon:
-        overlap = boundary.Intersection(polygon)
-        if 'POLYGON' in overlap.ExportToWkt():
-          overlap.Transform(transform)
-          outMultipolygon.AddGeometry(overlap)
+    inLayer.SetSpatialFilter(boundary)
+    for feature in inLayer:
+      if feature.GetFID() not in candidates:
+        candidates[feature.GetFID()] = feature.GetGeometryRef().Clone()
+  inLayer.SetSpatialFilter(None)
+  inShape = None
+
+  outMultipolygon = ogr.Geometry(ogr.wkbMultiPolygon)
+  for fid in sorted(candidates):
+    overlap = candidates[fid].Intersection(boundaries)
+    overlapType = ogr.GT_Flatten(overlap.GetGeometryType())
+    if overlapType == ogr.wkbPolygon:
+      overlap = [overlap]
+    elif overlapType in (ogr.wkbMultiPolygon, ogr.wkbGeometryCollection):
+      overlap = [overlap.GetGeometryRef(ii) for ii in range(overlap.GetGeometryCount())]
+    else:
+      continue
+    for polygon in overlap:
+      if ogr.GT_Flatten(polygon.GetGeometryType()) == ogr.wkbPolygon:
+        polygon = polygon.Clone()
+        polygon.Transform(transform)
+        outMultipolygon.AddGeometry(polygon)
+  if outMultipolygon.IsEmpty():
+    raise GeometryError(f'Mask file {maskShape} does not overlap the boundary')
 
   ### Save intersection polygon in memory
   spatialRef = osr.SpatialReference()
   spatialRef.ImportFromEPSG(imageEPSG)
   memDriver = ogr.GetDriverByName('Memory')
   outVector = memDriver.CreateDataSource('mem')
-  outLayer = outVector.CreateLayer('', spatialRef, ogr.wkbMultiPolygon)
+  outLayer = outVector.CreateLayer('overlap', spatialRef, ogr.wkbMultiPolygon)
   outLayer.CreateField(ogr.FieldDefn('id', ogr.OFTInteger))
   definition = outLayer.GetLayerDefn()
   outFeature = ogr.Feature(definition)
   outFeature.SetField('id', 0)
-  geometry = ogr.CreateGeometryFromWkb(outMultipolygon.ExportToWkb())
-  outFeature.SetGeometry(geometry)
+  outFeature.SetGeometry(outMultipolygon)
   outLayer.CreateFeature(outFeature)
   outFeature = None
 
@@ -631,14 +789,11 @@ def overlapMask(meta, maskShape, invert, outFile):
   aoiSamples = int(np.rint((aoiMaxX - aoiMinX)/posting))
   maskGeoTrans = (aoiMinX, posting, 0, aoiMaxY, 0, -posting)
 
-  ### Rasterize mask polygon
+  ### Rasterize mask polygon straight into the mask grid
   gdalDriver = gdal.GetDriverByName('MEM')
   outRaster = gdalDriver.Create('', aoiSamples, aoiLines, 1, gdal.GDT_Float32)
-  outRaster.SetGeoTransform((aoiMinX, posting, 0, aoiMaxY, 0, -posting))
-  outRaster.SetProjection(outProj.ExportToWkt())
-  outBand = outRaster.GetRasterBand(1)
-  outBand.SetNoDataValue(0)
-  outBand.FlushCache()
+  outRaster.SetGeoTransform(maskGeoTrans)
+  outRaster.SetProjection(spatialRef.ExportToWkt())
   gdal.RasterizeLayer(outRaster, [1], outLayer, burn_values=[1])
   mask = outRaster.GetRasterBand(1).ReadAsArray()
   outVector = None
@@ -673,19 +828,19 @@ def apply_mask(data, dataGeoTrans, mask, maskGeoTrans):
   return data
 
 
-def geotiff2boundary_ext(inGeotiff, maskFile, geographic):
+def geotiff2boundary_ext(inGeotiff, maskFile, geographic, decimation=1):
 
   # Extract metadata
   (spatialRef, gt, shape, pixel) = raster_meta(inGeotiff)
   epsg = int(spatialRef.GetAttrValue('AUTHORITY', 1))
   (data, colFirst, rowsFirst, geoTrans, proj) = \
-    geotiff2boundary_mask(inGeotiff, epsg, None)
+    geotiff2boundary_mask(inGeotiff, epsg, None, decimation=decimation)
   (rows, cols) = data.shape
 
   # Save in mask file (if defined)
   if maskFile is not None:
     gdalDriver = gdal.GetDriverByName('GTiff')
-    outRaster = gdalDriver.Create(maskFile, rows, cols, 1, gdal.GDT_Byte)
+    outRaster = gdalDriver.Create(maskFile, cols, rows, 1, gdal.GDT_Byte)
     outRaster.SetGeoTransform(geoTrans)
     outRaster.SetProjection(proj.ExportToWkt())
     outBand = outRaster.GetRasterBand(1)
@@ -694,7 +849,7 @@ def geotiff2boundary_ext(inGeotiff, maskFile, geographic):
 
   # Save in memory
   gdalDriver = gdal.GetDriverByName('Mem')
-  outRaster = gdalDriver.Create('out', rows, cols, 1, gdal.GDT_Byte)
+  outRaster = gdalDriver.Create('out', cols, rows, 1, gdal.GDT_Byte)
   outRaster.SetGeoTransform(geoTrans)
   outRaster.SetProjection(proj.ExportToWkt())
   outBand = outRaster.GetRasterBand(1)
@@ -729,14 +884,14 @@ def geotiff2boundary_ext(inGeotiff, maskFile, geographic):
     return (multipolygon, inSpatialRef)
 
 
-def geotiff2boundary(inGeotiff, maskFile):
+def geotiff2boundary(inGeotiff, maskFile, decimation=1):
 
-  return geotiff2boundary_ext(inGeotiff, maskFile, False)
+  return geotiff2boundary_ext(inGeotiff, maskFile, False, decimation)
 
 
-def geotiff2boundary_geo(inGeotiff, maskFile):
+def geotiff2boundary_geo(inGeotiff, maskFile, decimation=1):
 
-  return geotiff2boundary_ext(inGeotiff, maskFile, True)
+  return geotiff2boundary_ext(inGeotiff, maskFile, True, decimation)
 
 
 # Get polygon for a tile
@@ -842,7 +997,7 @@ def generate_tile_shape(shapeFile, minLat, maxLat, minLon, maxLon, step):
 
 
 # Generate a shapefile from a CSV list file
-def list2shape(csvFile, shapeFile):
+def list2shape(csvFile, shapeFile, decimation=1):
 
   # Set up shapefile attributes
   fields = []
@@ -861,7 +1016,7 @@ def list2shape(csvFile, shapeFile):
       print('Reading %s ...' % file)
       # Generate GeoTIFF boundary geometry
       data = None
-      (geometry, spatialRef) = geotiff2boundary(file, None)
+      (geometry, spatialRef) = geotiff2boundary(file, None, decimation)
 
       # Simplify the geometry - only works with GDAL 1.8.0
       #geometry = geometry.Simplify(float(tolerance))
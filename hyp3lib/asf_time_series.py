@@ -1,21 +1,49 @@
 import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import netCDF4 as nc
 import numpy as np
 import statsmodels.api as sm
 from osgeo import gdal, ogr, osr
+from pyproj import Transformer
 from scipy import ndimage
-from scipy.interpolate import interp1d
 from statsmodels.tsa.seasonal import seasonal_decompose
 
-from hyp3lib import GeometryError
+from hyp3lib import GeometryError, gdal_config
 from hyp3lib.asf_geometry import geometry_proj2geo, raster_meta
 
 tolerance = 0.00005
 
 
-def initializeNetcdf(ncFile, meta):
+def netcdf_chunk_sizes(rows, cols, layout='image', timeChunk=32):
+
+  ### Chunk shapes for the image variable: whole-image access reads
+  ### single time steps of large spatial tiles, pixel-history access reads
+  ### many time steps of small spatial tiles
+  if layout == 'image':
+    return (1, min(rows, 1024), min(cols, 1024))
+  elif layout == 'pixel':
+    return (timeChunk, min(rows, 32), min(cols, 32))
+  else:
+    raise ValueError('Unknown chunk layout {0}; expected image or pixel'.format(layout))
+
+
+def _create_validity_variable(dataset):
+
+  validity = dataset.createVariable('validity', np.uint8, ('ygrid', 'xgrid'),
+    zlib=True, fill_value=False)
+  validity.long_name = ('pixels with valid data at any time')
+  validity.flag_values = np.array([0, 1], dtype=np.uint8)
+  validity.flag_meanings = ('no_data valid')
+  validity[:] = 0
+
+  return validity
+
+
+def initializeNetcdf(ncFile, meta, layout='image', timeChunk=32, complevel=4,
+  shuffle=True, validityMask=False):
 
   dataset = nc.Dataset(ncFile, 'w', format='NETCDF4')
 
@@ -86,11 +114,17 @@ def initializeNetcdf(ncFile, meta):
 
   ## image
   image = dataset.createVariable('image', np.float32, \
-    ('time', 'ygrid', 'xgrid'), zlib=True)
+    ('time', 'ygrid', 'xgrid'), zlib=complevel > 0, complevel=max(complevel, 1),
+    shuffle=shuffle, chunksizes=netcdf_chunk_sizes(meta['rows'], meta['cols'],
+    layout, timeChunk))
   image.long_name = meta['imgLongName']
   image.units = meta['imgUnits']
   image.fill_value = meta['imgNoData']
 
+  ## validity mask: pixels with valid data at any time
+  if validityMask:
+    _create_validity_variable(dataset)
+
   ## name
   name = dataset.createVariable('granule', 'S1', ('time', 'nchar'))
   name.long_name = 'name of the granule'
@@ -165,50 +199,208 @@ def nc2meta(ncFile):
   return meta
 
 
+def valid_pixels(image):
+
+  ### Valid data is finite and non-zero
+  image = np.ma.filled(image, np.nan)
+  return (np.isfinite(image) & (image != 0)).astype(np.uint8)
+
+
+def add_validity_mask(ncFile, chunkRows=256):
+
+  ### Store the pixels with valid data at any time as a 'validity' variable,
+  ### reading the cube a strip of rows at a time
+  with nc.Dataset(ncFile, 'a') as dataset:
+    image = dataset.variables['image']
+    if 'validity' in dataset.variables:
+      validity = dataset.variables['validity']
+    else:
+      validity = _create_validity_variable(dataset)
+    rows = image.shape[1]
+    for row in range(0, rows, chunkRows):
+      strip = image[:, row:row+chunkRows, :]
+      validity[row:row+chunkRows, :] = valid_pixels(strip).any(axis=0)
+
+
+class NetcdfStackWriter:
+  """Append images to a time series cube created by initializeNetcdf
+
+  The dataset stays open between images, and images are buffered and written
+  several time steps at a time, so each chunk of a pixel-history layout is
+  written once per buffer rather than once per image.
+  """
+
+  def __init__(self, ncFile, bufferSize=None, chunkCache=256*1024**2,
+    bufferMemory=512*1024**2):
+
+    self.dataset = nc.Dataset(ncFile, 'a')
+    self.time = self.dataset.variables['time']
+    self.name = self.dataset.variables['granule']
+    self.data = self.dataset.variables['image']
+    self.validity = self.dataset.variables.get('validity')
+
+    ### Buffer the time chunk depth or 16 images, whichever is larger, as far
+    ### as the buffer memory allows
+    if bufferSize is None:
+      chunking = self.data.chunking()
+      timeChunk = chunking[0] if chunking != 'contiguous' else 1
+      imageBytes = self.data.shape[1] * self.data.shape[2] * 4
+      bufferSize = min(max(timeChunk, 16), bufferMemory // max(imageBytes, 1))
+    self.bufferSize = max(bufferSize, 1)
+    self.data.set_var_chunk_cache(size=chunkCache)
+    self.images = []
+    self.granules = []
+    self.times = []
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+
+  def add(self, image, granule, imgTime):
+
+    self.images.append(np.asarray(image, dtype=np.float32))
+    self.granules.append(granule)
+    self.times.append(imgTime)
+    if len(self.images) >= self.bufferSize:
+      self.flush()
+
+  def flush(self):
+
+    if not self.images:
+      return
+    first = self.time.shape[0]
+    last = first + len(self.images)
+    self.time[first:last] = nc.date2num(self.times, units=self.time.units,
+      calendar=self.time.calendar)
+    self.name[first:last] = \
+      np.array(self.granules, 'S100').view('S1').reshape(len(self.granules), 100)
+    self.data[first:last,:,:] = np.stack(self.images)
+    if self.validity is not None:
+      valid = np.logical_or.reduce([valid_pixels(image) for image in self.images])
+      self.validity[:] = self.validity[:] | valid
+    self.images = []
+    self.granules = []
+    self.times = []
+
+  def close(self):
+
+    if self.dataset is None:
+      return
+    self.flush()
+    self.dataset.close()
+    self.dataset = None
+
+
 def addImage2netcdf(image, ncFile, granule, imgTime):
 
-  dataset = nc.Dataset(ncFile, 'a')
+  with NetcdfStackWriter(ncFile, bufferSize=1) as writer:
+    writer.add(image, granule, imgTime)
 
-  ### Updating time
-  time = dataset.variables['time']
-  name = dataset.variables['granule']
-  data = dataset.variables['image']
-  numGranules = time.shape[0]
-  time[numGranules] = nc.date2num(imgTime, units=time.units,
-    calendar=time.calendar)
-  name[numGranules] = nc.stringtochar(np.array(granule, 'S100'))
-  data[numGranules,:,:] = image
 
-  dataset.close()
+def cube_grid(meta):
 
+  ### Output bounds and size of the cube grid, as defined by the metadata
+  ### passed to initializeNetcdf (grid coordinates are upper left corners)
+  (cols, rows) = (int(meta['cols']), int(meta['rows']))
+  minX = meta['minX']
+  maxY = meta['maxY']
+  bounds = (minX, maxY - rows*meta['pixelSize'], minX + cols*meta['pixelSize'],
+    maxY)
 
-def filter_change(image, kernelSize, iterations):
-
-  (cols, rows) = image.shape
-  positiveChange = np.zeros((rows,cols), dtype=np.uint8)
-  negativeChange = np.zeros((rows,cols), dtype=np.uint8)
-  noChange = np.zeros((rows,cols), dtype=np.uint8)
-  for ii in range(int(cols)):
-    for kk in range(int(rows)):
-      if image[ii,kk] == 1:
-        negativeChange[ii,kk] = 1
-      elif image[ii,kk] == 2:
-        noChange = 1
-      elif image[ii,kk] == 3:
-        positiveChange[ii,kk] = 1
-  image = None
-  positiveChange = ndimage.binary_opening(positiveChange,
-    iterations=iterations, structure=np.ones(kernelSize)).astype(np.uint8)
-  negativeChange = ndimage.binary_opening(negativeChange,
-    iterations=iterations, structure=np.ones(kernelSize)).astype(np.uint8)
-  change = np.full((rows,cols), 2, dtype=np.uint8)
-  for ii in range(int(cols)):
-    for kk in range(int(rows)):
-      if negativeChange[ii,kk] == 1:
-        change[ii,kk] = 1
-      elif positiveChange[ii,kk] == 1:
-        change[ii,kk] = 3
-  change *= noChange
+  return (bounds, cols, rows)
+
+
+def _warp_to_grid(inFile, bounds, cols, rows, wkt, noData, resampling):
+
+  ### Reproject and crop one image onto the cube grid, in memory
+  raster = gdal_config.warp('', inFile, format='MEM', outputBounds=bounds,
+    width=cols, height=rows, dstSRS=wkt, resampleAlg=resampling,
+    outputType=gdal.GDT_Float32, dstNodata=noData)
+  image = raster.GetRasterBand(1).ReadAsArray()
+  raster = None
+
+  return image
+
+
+def geotiffs2netcdf(inFiles, times, ncFile, meta, granules=None, processes=None,
+  resampling='bilinear', **kwargs):
+
+  ### Granules default to the file names, and are added in time order
+  if granules is None:
+    granules = [os.path.splitext(os.path.basename(inFile))[0]
+      for inFile in inFiles]
+  if not len(inFiles) == len(times) == len(granules):
+    raise ValueError('Expected one time and granule name for every file')
+  order = sorted(range(len(inFiles)), key=lambda ii: times[ii])
+
+  ### Cube grid and map projection
+  initializeNetcdf(ncFile, meta, **kwargs)
+  (bounds, cols, rows) = cube_grid(meta)
+  proj = osr.SpatialReference()
+  proj.ImportFromEPSG(int(meta['epsg']))
+  wkt = proj.ExportToWkt()
+
+  ### Warp images in a pool of processes, writing them in time order; only a
+  ### few images per process are held in memory at once
+  processes = processes or os.cpu_count() or 1
+  with NetcdfStackWriter(ncFile) as writer, \
+    ProcessPoolExecutor(max_workers=processes) as executor:
+    queueSize = 2 * processes
+    pending = deque()
+    for ii in order:
+      pending.append((ii, executor.submit(_warp_to_grid, inFiles[ii], bounds,
+        cols, rows, wkt, meta['imgNoData'], resampling)))
+      if len(pending) > queueSize:
+        (jj, future) = pending.popleft()
+        writer.add(future.result(), granules[jj], times[jj])
+    while pending:
+      (jj, future) = pending.popleft()
+      writer.add(future.result(), granules[jj], times[jj])
+
+  return [granules[ii] for ii in order]
+
+
+def filter_change_window(image, kernelSize, iterations):
+
+  ### Split classes: 1 - negative change, 2 - no change, 3 - positive change
+  structure = np.ones(kernelSize)
+  negativeChange = ndimage.binary_opening(image == 1, iterations=iterations,
+    structure=structure)
+  positiveChange = ndimage.binary_opening(image == 3, iterations=iterations,
+    structure=structure)
+
+  ### Recombine, keeping pixels without a change class (no data) at zero
+  change = np.full(image.shape, 2, dtype=np.uint8)
+  change[positiveChange] = 3
+  change[negativeChange] = 1
+  change[(image < 1) | (image > 3)] = 0
+
+  return change
+
+
+def filter_change(image, kernelSize, iterations, workers=1, chunkRows=2048):
+
+  ### Filter small window of rows at once, each with a halo covering the
+  ### reach of the opening (erosion followed by dilation)
+  kernelSize = np.broadcast_to(kernelSize, (image.ndim,))
+  halo = 2*iterations*int(np.max(kernelSize))
+  kernelSize = tuple(int(size) for size in kernelSize)
+  rows = image.shape[0]
+  if workers <= 1:
+    chunkRows = rows
+  change = np.zeros(image.shape, dtype=np.uint8)
+
+  def filter_rows(start):
+    stop = min(start + chunkRows, rows)
+    lo = max(start - halo, 0)
+    hi = min(stop + halo, rows)
+    window = filter_change_window(image[lo:hi], kernelSize, iterations)
+    change[start:stop] = window[start-lo:stop-lo]
+
+  with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+    list(executor.map(filter_rows, range(0, rows, max(chunkRows, 1))))
 
   return change
 
@@ -309,7 +501,7 @@ def raster_metadata(input):
   return (fields, values, outSpatialRef)
 
 
-def netcdf2boundary_mask(ncFile, geographic):
+def netcdf2boundary_mask(ncFile, geographic, useValidity=False):
 
   ### Extract metadata
   meta = nc2meta(ncFile)
@@ -320,21 +512,25 @@ def netcdf2boundary_mask(ncFile, geographic):
   geoTrans = \
     (meta['minX'], meta['pixelSize'], 0, meta['maxY'], 0, -meta['pixelSize'])
 
-  ### Reading time series
+  ### Reading the footprint: the stored validity mask, or the first image
   dataset = nc.Dataset(ncFile, 'r')
-  image = dataset.variables['image'][:]
+  if useValidity:
+    if 'validity' not in dataset.variables:
+      dataset.close()
+      raise GeometryError('Could not find a validity mask in {0}!'.format(ncFile))
+    data = np.ma.filled(dataset.variables['validity'][:], 0).astype(np.uint8)
+  else:
+    data = valid_pixels(dataset.variables['image'][0,:,:])
   dataset.close()
 
   ### Save in memory
-  data = image[0,:,:]/image[0,:,:]
-  image = None
   gdalDriver = gdal.GetDriverByName('Mem')
-  outRaster = gdalDriver.Create('out', rows, cols, 1, gdal.GDT_Byte)
+  outRaster = gdalDriver.Create('out', cols, rows, 1, gdal.GDT_Byte)
   outRaster.SetGeoTransform(geoTrans)
   outRaster.SetProjection(proj.ExportToWkt())
   outBand = outRaster.GetRasterBand(1)
   outBand.WriteArray(data)
-  inBand = None
+  outBand = None
   data = None
 
   ### Polygonize the raster image
@@ -365,87 +561,369 @@ def netcdf2boundary_mask(ncFile, geographic):
     return (multipolygon, inSpatialRef)
 
 
-def time_series_slice(ncFile, x, y, typeXY):
+def rasterize_zones(geometries, geoTrans, rows, cols, wkt):
 
-  timeSeries = nc.Dataset(ncFile, 'r')
+  ### Burn each geometry into a label raster: 0 outside every geometry,
+  ### ii+1 inside geometry ii (later geometries win where they overlap)
+  proj = osr.SpatialReference()
+  proj.ImportFromWkt(wkt)
+  ogrDriver = ogr.GetDriverByName('Memory')
+  vector = ogrDriver.CreateDataSource('zones')
+  layer = vector.CreateLayer('zones', srs=proj)
+  layer.CreateField(ogr.FieldDefn('zone', ogr.OFTInteger))
+  for ii, geometry in enumerate(geometries):
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetField('zone', ii + 1)
+    feature.SetGeometry(geometry)
+    layer.CreateFeature(feature)
+    feature = None
+
+  gdalDriver = gdal.GetDriverByName('MEM')
+  raster = gdalDriver.Create('zones', cols, rows, 1, gdal.GDT_Int32)
+  raster.SetGeoTransform(geoTrans)
+  raster.SetProjection(wkt)
+  gdal.RasterizeLayer(raster, [1], layer, options=['ATTRIBUTE=zone'])
+  zones = raster.GetRasterBand(1).ReadAsArray()
+  raster = None
+  vector = None
+
+  return zones
+
+
+class TimeSeriesReader:
+  """Read pixel histories from a time series cube created by initializeNetcdf
+
+  The dataset stays open between reads, and map or geographic coordinates
+  are converted to grid indices arithmetically from the grid origin and
+  posting, so many points, or every pixel of many polygons, are extracted
+  in a single pass over the cube.
+  """
+
+  def __init__(self, ncFile, stripRows=256):
+
+    self.dataset = nc.Dataset(ncFile, 'r')
+    self.stripRows = stripRows
+    self.data = self.dataset.variables['image']
+    xGrid = self.dataset.variables['xgrid']
+    yGrid = self.dataset.variables['ygrid']
+    (self.rows, self.cols) = (yGrid.shape[0], xGrid.shape[0])
+    (self.originX, self.originY) = (float(xGrid[0]), float(yGrid[0]))
+    ### Posting over the whole grid, in double precision: the float32
+    ### coordinates are only resolved to about half a meter at UTM northings
+    xGrid = np.asarray(xGrid[[0, -1]], dtype=np.float64)
+    yGrid = np.asarray(yGrid[[0, -1]], dtype=np.float64)
+    self.posting = ((xGrid[1] - xGrid[0]) / max(self.cols - 1, 1),
+      (yGrid[1] - yGrid[0]) / max(self.rows - 1, 1))
+    self.pixelSize = self.posting[0]
+    self.geoTrans = (self.originX, self.posting[0], 0,
+      self.originY, 0, self.posting[1])
+    if 'Transverse_Mercator' not in self.dataset.variables:
+      raise GeometryError('Could not find map projection information!')
+    self.wkt = self.dataset.variables['Transverse_Mercator'].getncattr('crs_wkt')
+
+    time = self.dataset.variables['time']
+    timeRef = datetime.strptime(time.getncattr('units')[14:],
+      '%Y-%m-%d %H:%M:%S')
+    self.timeRef = timeRef
+    self.time = np.asarray(time[:], dtype=np.float64)
+    self.timestamps = [timeRef + timedelta(seconds=t) for t in self.time.tolist()]
+    self.granules = nc.chartostring(self.dataset.variables['granule'][:])
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+
+  def close(self):
+
+    if self.dataset is not None:
+      self.dataset.close()
+      self.dataset = None
+
+  def indices(self, x, y, typeXY='mapXY'):
+
+    ### Work out line/sample from various input types
+    x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+    y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+    if typeXY == 'pixel':
+      (sample, line) = (x, y)
+    elif typeXY in ('latlon', 'mapXY'):
+      if typeXY == 'latlon':
+        transformer = Transformer.from_crs('EPSG:4326', self.wkt, always_xy=True)
+        (x, y) = transformer.transform(x, y)
+      sample = (np.asarray(x) - self.originX) / self.posting[0]
+      line = (np.asarray(y) - self.originY) / self.posting[1]
+    else:
+      raise ValueError('Unknown coordinate type {0}'.format(typeXY))
+    sample = np.rint(sample).astype(np.int64)
+    line = np.rint(line).astype(np.int64)
+
+    outside = (sample < 0) | (sample >= self.cols) | (line < 0) | (line >= self.rows)
+    if outside.any():
+      raise ValueError('{0} of {1} points are outside the time series grid'.format(
+        np.count_nonzero(outside), outside.size))
+
+    return (line, sample)
+
+  def read_pixels(self, line, sample):
+
+    ### Read the pixel histories in strips of rows, each covering only the
+    ### columns needed by the points in that strip
+    values = np.empty((self.data.shape[0], len(line)), dtype=np.float32)
+    order = np.argsort(line, kind='stable')
+    strips = line[order] // self.stripRows
+    for strip in np.unique(strips):
+      points = order[strips == strip]
+      (r0, r1) = (line[points].min(), line[points].max() + 1)
+      (c0, c1) = (sample[points].min(), sample[points].max() + 1)
+      block = np.ma.filled(self.data[:, r0:r1, c0:c1], np.nan)
+      values[:, points] = block[:, line[points] - r0, sample[points] - c0]
+
+    return values
+
+  def extract(self, x, y, typeXY='mapXY'):
+
+    (line, sample) = self.indices(x, y, typeXY)
+    return self.read_pixels(line, sample)
+
+  def polygon_pixels(self, geometries, typeXY='mapXY'):
+
+    ### Convert polygons to the cube's map projection (if needed)
+    geometries = [ogr.CreateGeometryFromWkt(geometry) if isinstance(geometry, str)
+      else geometry.Clone() for geometry in geometries]
+    if typeXY == 'latlon':
+      inProj = osr.SpatialReference()
+      inProj.ImportFromEPSG(4326)
+      outProj = osr.SpatialReference()
+      outProj.ImportFromWkt(self.wkt)
+      if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+        inProj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        outProj.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+      transform = osr.CoordinateTransformation(inProj, outProj)
+      for geometry in geometries:
+        geometry.Transform(transform)
+    elif typeXY != 'mapXY':
+      raise ValueError('Unknown coordinate type {0}'.format(typeXY))
+
+    ### Gather the pixels of all polygons and read them at once; labels are
+    ### the index of the polygon each pixel falls in, plus one
+    zones = rasterize_zones(geometries, self.geoTrans, self.rows, self.cols,
+      self.wkt)
+    (line, sample) = np.nonzero(zones)
+    labels = zones[line, sample]
+    values = self.read_pixels(line, sample)
+
+    return (labels, values)
+
+  def extract_polygons(self, geometries, typeXY='mapXY'):
+
+    (labels, values) = self.polygon_pixels(geometries, typeXY)
+    return [values[:, labels == ii + 1] for ii in range(len(geometries))]
+
+  def zonal_statistics(self, geometries, typeXY='mapXY'):
+
+    (labels, values) = self.polygon_pixels(geometries, typeXY)
+    return zonal_reductions(values, labels, len(geometries))
+
+
+def zonal_reductions(values, labels, zoneCount):
+
+  ### Pixel count, mean and median of every zone at every time step (rows of
+  ### values), ignoring missing data. Labels run from 1 to zoneCount, and
+  ### pixels labelled 0 are in no zone and ignored; zone and time are folded
+  ### into a single bincount index, and the median is found in one sort of
+  ### the pixels by zone and value
+  (timeCount, pixelCount) = values.shape
+  values = np.asarray(values, dtype=np.float64)
+  labels = np.asarray(labels, dtype=np.int64)
+  if pixelCount > 0 and (labels.min() < 0 or labels.max() > zoneCount):
+    raise ValueError('Zone labels must run from 0 (no zone) to {0}'.format(
+      zoneCount))
+  valid = np.isfinite(values)
+  binCount = timeCount * (zoneCount + 1)
+  index = labels + (zoneCount + 1)*np.arange(timeCount)[:, np.newaxis]
+  count = np.bincount(index[valid], minlength=binCount)
+  count = count.reshape(timeCount, zoneCount + 1)[:, 1:]
+  total = np.bincount(index[valid], weights=values[valid], minlength=binCount)
+  total = total.reshape(timeCount, zoneCount + 1)[:, 1:]
+  mean = np.full(count.shape, np.nan)
+  np.divide(total, count, out=mean, where=count > 0)
+
+  median = np.full(count.shape, np.nan)
+  if pixelCount > 0:
+    ### Missing data sorts to the end of each zone, and pixels in no zone
+    ### sort before all zones
+    order = np.lexsort((values, np.broadcast_to(labels, values.shape)), axis=-1)
+    ordered = np.take_along_axis(values, order, axis=1)
+    zoneSize = np.bincount(labels, minlength=zoneCount + 1)
+    start = (np.cumsum(zoneSize) - zoneSize)[1:]
+    some = count > 0
+    lower = np.where(some, start + (count - 1)//2, 0)
+    upper = np.where(some, start + count//2, 0)
+    middle = (np.take_along_axis(ordered, lower, axis=1) +
+      np.take_along_axis(ordered, upper, axis=1)) / 2
+    median[some] = middle[some]
+
+  return {'count': count.T, 'mean': mean.T, 'median': median.T}
+
+
+def zonal_statistics(ncFile, geometries, typeXY='mapXY', csvFile=None,
+  stripRows=256):
+
+  ### Statistics of every zone (polygon) at every time step, rasterizing the
+  ### polygons once and reading the cube in a single pass
+  with TimeSeriesReader(ncFile, stripRows=stripRows) as reader:
+    statistics = reader.zonal_statistics(geometries, typeXY)
+    timestamps = reader.timestamps
+
+  ### Table keyed by zone (index of the polygon) and time
+  table = {}
+  for zone in range(len(geometries)):
+    for ii, timestamp in enumerate(timestamps):
+      table[(zone, timestamp)] = {key: value[zone, ii].item()
+        for key, value in statistics.items()}
+
+  if csvFile is not None:
+    outF = open(csvFile, 'w')
+    outF.write('zone,time,count,mean,median\n')
+    for (zone, timestamp), row in table.items():
+      outF.write('%d,%s,%d,%s,%s\n' % (zone, timestamp.isoformat(),
+        row['count'], repr(row['mean']), repr(row['median'])))
+    outF.close()
+
+  return table
+
+
+def gap_fill_weights(timestamps, timeRef, interval=12):
+
+  ### Reference dates every `interval` days from the first acquisition, and
+  ### for each the two acquisitions and the linear weight that fill it:
+  ### acquired dates use their acquisition, missing dates interpolate
+  ### between their neighbors (or repeat the nearest one beyond the ends)
+  time = np.array([(t - timeRef).total_seconds() for t in timestamps])
+  datestamp = [t.date() for t in timestamps]
+  startDate = datestamp[0]
+  stopDate = datestamp[-1]
+  refDates = np.arange(startDate, stopDate + timedelta(days=interval),
+    interval).tolist()
+
+  order = np.argsort(time, kind='stable')
+  sortedTime = time[order]
+  lower = np.zeros(len(refDates), dtype=np.int64)
+  upper = np.zeros(len(refDates), dtype=np.int64)
+  weight = np.zeros(len(refDates))
+  refType = []
+  for ii, refDate in enumerate(refDates):
+    if refDate in datestamp:
+      lower[ii] = upper[ii] = datestamp.index(refDate)
+      refType.append('acquired')
+      continue
+    refTime = (refDate - timeRef.date()).total_seconds()
+    after = min(max(np.searchsorted(sortedTime, refTime), 1), len(time) - 1)
+    (lower[ii], upper[ii]) = (order[after-1], order[after])
+    span = time[upper[ii]] - time[lower[ii]]
+    if span > 0:
+      weight[ii] = np.clip((refTime - time[lower[ii]]) / span, 0, 1)
+    refType.append('interpolated')
+
+  return (refDates, refType, lower, upper, weight)
+
+
+def fill_gaps(values, lower, upper, weight):
+
+  ### Linear interpolation along the first (time) axis, for every pixel at once
+  weight = weight.reshape((-1,) + (1,) * (values.ndim - 1))
+  return values[lower] * (1 - weight) + values[upper] * weight
+
+
+def lowess_weights(count, frac=0.08):
+
+  ### Without robustness iterations, LOWESS of evenly spaced samples is linear
+  ### in the samples: column jj is the smoothed response to the jj-th sample
+  lowess = sm.nonparametric.lowess
+  x = np.arange(count)
+  return np.column_stack([lowess(np.eye(count)[jj], x, frac=frac, it=0)[:,1]
+    for jj in range(count)])
+
+
+def _smooth_rows(ncFile, firstRow, lastRow, lower, upper, weight, smoothing):
+
+  with nc.Dataset(ncFile, 'r') as dataset:
+    values = np.ma.filled(dataset.variables['image'][:, firstRow:lastRow, :],
+      np.nan).astype(np.float32)
+  filled = fill_gaps(values, lower, upper, weight)
+  smooth = np.tensordot(smoothing, filled, axes=(1, 0))
+
+  return smooth.astype(np.float32)
+
+
+def smooth_time_series(ncFile, outFile, frac=0.08, interval=12, chunkRows=256,
+  processes=1, layout='image'):
+
+  ### Reference dates, gap filling weights and smoothing operator
+  with TimeSeriesReader(ncFile) as reader:
+    timeRef = reader.timeRef
+    granules = list(reader.granules)
+    (refDates, refType, lower, upper, weight) = \
+      gap_fill_weights(reader.timestamps, timeRef, interval)
+  smoothing = lowess_weights(len(refDates), frac)
+
+  ### Output cube on the same grid; bounds are given half a pixel inside the
+  ### grid edges so initializeNetcdf reproduces the input coordinates exactly
+  meta = nc2meta(ncFile)
+  meta['maxX'] = meta['minX'] + (meta['cols'] - 0.5) * meta['pixelSize']
+  meta['minY'] = meta['maxY'] - (meta['rows'] - 0.5) * meta['pixelSize']
+  meta['comment'] = 'gap filled every {0} days and smoothed (LOWESS, frac={1})'.format(
+    interval, frac)
+  initializeNetcdf(outFile, meta, layout=layout)
+
+  with nc.Dataset(outFile, 'a') as dataset:
+    time = dataset.variables['time']
+    refTimes = [datetime.combine(refDate, datetime.min.time())
+      for refDate in refDates]
+    time[:] = nc.date2num(refTimes, units=time.units, calendar=time.calendar)
+    names = [granules[lower[ii]] if refType[ii] == 'acquired' else 'interpolated'
+      for ii in range(len(refDates))]
+    dataset.variables['granule'][:] = \
+      np.array(names, 'S100').view('S1').reshape(len(names), 100)
+
+    ### Smooth chunks of rows in a pool of processes, writing them in order
+    image = dataset.variables['image']
+    rows = meta['rows']
+    chunks = [(row, min(row + chunkRows, rows)) for row in range(0, rows, chunkRows)]
+    with ProcessPoolExecutor(max_workers=max(processes, 1)) as executor:
+      pending = deque()
+      for (firstRow, lastRow) in chunks:
+        pending.append((firstRow, lastRow, executor.submit(_smooth_rows, ncFile,
+          firstRow, lastRow, lower, upper, weight, smoothing)))
+        if len(pending) > 2 * max(processes, 1):
+          (r0, r1, future) = pending.popleft()
+          image[:, r0:r1, :] = future.result()
+      while pending:
+        (r0, r1, future) = pending.popleft()
+        image[:, r0:r1, :] = future.result()
+
+  return (refDates, refType)
+
+
+def time_series_slice(ncFile, x, y, typeXY):
 
   ### Extract information for variables: image, time, granule
-  timeRef = timeSeries.variables['time'].getncattr('units')[14:]
-  timeRef = datetime.strptime(timeRef, '%Y-%m-%d %H:%M:%S')
-  time = timeSeries.variables['time'][:].tolist()
-  timestamp = []
-  for t in time:
-    timestamp.append(timeRef + timedelta(seconds=t))
-  xGrid = timeSeries.variables['xgrid'][:]
-  yGrid = timeSeries.variables['ygrid'][:]
-  granules = timeSeries.variables['granule']
-  granule = nc.chartostring(granules[:])
-  data = timeSeries.variables['image']
-  # numGranules = len(time)
-
-  ### Define geo transformation and map proejction
-  # originX = xGrid[0]
-  # originY = yGrid[0]
-  pixelSize = xGrid[1] - xGrid[0]
-  # gt = (originX, pixelSize, 0, originY, 0, -pixelSize)
-  var = timeSeries.variables.keys()
-  if 'Transverse_Mercator' in var:
-    wkt = timeSeries.variables['Transverse_Mercator'].getncattr('crs_wkt')
-  else:
-    raise GeometryError('Could not find map projection information!')
-
-  ### Work out line/sample from various input types
-  if typeXY == 'pixel':
-    sample = x
-    line = y
-  elif typeXY == 'latlon':
-    inProj = osr.SpatialReference()
-    inProj.ImportFromEPSG(4326)
-    outProj = osr.SpatialReference()
-    outProj.ImportFromWkt(wkt)
-    transform = osr.CoordinateTransformation(inProj, outProj)
-    coord = ogr.Geometry(ogr.wkbPoint)
-    coord.AddPoint(x,y)
-    coord.Transform(transform)
-    coordX = np.rint(coord.GetX()/pixelSize)*pixelSize
-    coordY = np.rint(coord.GetY()/pixelSize)*pixelSize
-    sample = xGrid.tolist().index(coordX)
-    line = yGrid.tolist().index(coordY)
-  elif typeXY == 'mapXY':
-    sample = xGrid.tolist().index(x)
-    line = yGrid.tolist().index(y)
-  value = data[:,sample,line]
+  with TimeSeriesReader(ncFile) as reader:
+    timeRef = reader.timeRef
+    timestamp = reader.timestamps
+    granule = reader.granules
+    value = reader.extract(x, y, typeXY)[:,0]
 
   ### Work on time series
   ## Fill in gaps by interpolation
-  startDate = timestamp[0].date()
-  stopDate = timestamp[len(timestamp)-1].date()
-  refDates = np.arange(startDate, stopDate + timedelta(days=12), 12).tolist()
-  datestamp = []
-  for t in time:
-    datestamp.append((timeRef + timedelta(seconds=t)).date())
-  missingDates = list(set(refDates) - set(datestamp))
-  f = interp1d(time, value)
-  missingTime = []
-  for missingDate in missingDates:
-    missingTime.append((missingDate - timeRef.date()).total_seconds())
-  missingValues = f(missingTime)
-  allValues = []
-  refType = []
-  for ii in range(len(refDates)):
-    if refDates[ii] in missingDates:
-      index = missingDates.index(refDates[ii])
-      allValues.append(missingValues[index])
-      refType.append('interpolated')
-    else:
-      index = datestamp.index(refDates[ii])
-      allValues.append(value[index])
-      refType.append('acquired')
-  allValues = np.asarray(allValues)
+  (refDates, refType, lower, upper, weight) = \
+    gap_fill_weights(timestamp, timeRef)
+  allValues = fill_gaps(np.asarray(value, dtype=np.float64), lower, upper, weight)
 
   ## Smoothing the time line with localized regression (LOESS)
-  lowess = sm.nonparametric.lowess
-  smooth = lowess(allValues, np.arange(len(allValues)), frac=0.08, it=0)[:,1]
+  smooth = lowess_weights(len(allValues), frac=0.08) @ allValues
 
   sd = seasonal_decompose(x=smooth, model='additive', freq=4)
 
@@ -4,6 +4,7 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import os
 import argparse
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
 import numpy as np
 from osgeo import gdal
@@ -25,7 +26,7 @@ def get2sigmacutoffs(fi):
 def byteSigmaScale(infile,outfile):
     lo,hi = get2sigmacutoffs(infile)
     print("2-sigma cutoffs are {} {}".format(lo, hi))
-    gdal.Translate(outfile,infile,outputType=gdal.GDT_Byte,scaleParams=[[lo,hi,1,255]],resampleAlg="average",noData="0")
+    gdal_config.translate(outfile,infile,outputType=gdal.GDT_Byte,scaleParams=[[lo,hi,1,255]],resampleAlg="average",noData="0")
 
     # For some reason, I'm still getting zeros in my byte images eventhough I'm using 1,255 scaling!
     # The following in an attempt to fix that!
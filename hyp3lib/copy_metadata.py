@@ -4,8 +4,8 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import os
 import argparse
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
-from osgeo import gdal
 
 
 def copy_metadata(infile, outfile):
@@ -22,9 +22,9 @@ def copy_metadata(infile, outfile):
 
     ds = saa.open_gdal_file(outfile)
     for item in md:
-        ds1 = gdal.Translate('',ds,format='MEM',metadataOptions = ['{}={}'.format(item,md[item])])
+        ds1 = gdal_config.translate('',ds,format='MEM',metadataOptions = ['{}={}'.format(item,md[item])])
         ds = ds1
-    gdal.Translate(outfile,ds1)
+    gdal_config.translate(outfile,ds1)
  
 
 def main():
@@ -9,10 +9,11 @@ import os
 
 
 def createAmp(fi,nodata=None):
-    (x,y,trans,proj,data) = saa.read_gdal_file(saa.open_gdal_file(fi))
-    ampdata = np.sqrt(data)
+    raster = saa.Raster(fi)
     outfile = fi.replace('.tif','_amp.tif')
-    saa.write_gdal_file_float(outfile,trans,proj,ampdata,nodata=nodata)
+    with saa.GeoTiffWriter(outfile,raster.xsize,raster.ysize,raster.geotransform,raster.projection,
+                           nodata=nodata) as writer:
+        writer.write_blocks((block.window,np.sqrt(block.data)) for block in raster.blocks())
     return outfile
 
 
@@ -2,6 +2,7 @@
 
 from __future__ import print_function, absolute_import, division, unicode_literals
 
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
 import re
 import os
@@ -87,7 +88,7 @@ def cutFiles(arg):
                 print("    reprojecting post image")
                 print("    proj is %s" % proj)
                 name = file2.replace(".tif","_reproj.tif")
-                gdal.Warp(name,file2,dstSRS=proj,xRes=pixSize,yRes=pixSize)
+                gdal_config.warp(name,file2,dstSRS=proj,xRes=pixSize,yRes=pixSize)
                 arg[x+1] = name
 
     # Find the overlap between all scenes
@@ -115,7 +116,7 @@ def cutFiles(arg):
         file1_new = file1.replace('.tif','_clip.tif')
         print("    clipping file {} to create file {}".format(file1, file1_new))
         #        dst_d1 = gdal.Translate(file1_new,file1,projWin=coords,xRes=pixSize,yRes=pixSize,creationOptions = ['COMPRESS=LZW'])
-        gdal.Warp(file1_new,file1,outputBounds=coords,xRes=pixSize,yRes=-1*pixSize,creationOptions = ['COMPRESS=LZW'])
+        gdal_config.warp(file1_new,file1,outputBounds=coords,xRes=pixSize,yRes=-1*pixSize,creationOptions = ['COMPRESS=LZW'])
 
 
 def main():
@@ -4,7 +4,7 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import argparse
 import os
-from osgeo import gdal
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
 import numpy as np
 
@@ -73,7 +73,7 @@ def cutGeotiffsByLine(files,all_coords=None,all_pixsize=None):
         if all_coords is not None:
             outfile = os.path.basename(outfile)
         print("Processing file {} to create file {}".format(files[i], outfile))
-        gdal.Translate(outfile,files[i],srcWin=[diff_ul[0,i],diff_ul[1,i],lenx,leny],noData=0)
+        gdal_config.translate(outfile,files[i],srcWin=[diff_ul[0,i],diff_ul[1,i],lenx,leny],noData=0)
         outfiles.append(outfile)
 
     return(outfiles)
@@ -0,0 +1,63 @@
+"""A grid index over geometry envelopes, to find the geometries that may overlap a query without testing every one"""
+
+import math
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+Envelope = Tuple[float, float, float, float]
+
+
+class EnvelopeIndex:
+    """A grid index over `(x_min, x_max, y_min, y_max)` envelopes, as returned by OGR's `Geometry.GetEnvelope`
+
+    Envelopes are bucketed into square grid cells about the size of a typical envelope, so a query only checks the
+    envelopes in the cells it covers; a query covering more cells than there are envelopes checks all of them.
+    """
+
+    def __init__(self, envelopes: Iterable[Envelope]):
+        """
+        Args:
+            envelopes: The envelope of each geometry, in order
+        """
+        self.envelopes = np.array(list(envelopes), dtype=float).reshape(-1, 4)
+
+        self.cell_size = 1.0
+        if len(self.envelopes):
+            widths = self.envelopes[:, 1] - self.envelopes[:, 0]
+            heights = self.envelopes[:, 3] - self.envelopes[:, 2]
+            self.cell_size = max(float(np.median(widths)), float(np.median(heights))) or 1.0
+
+        self.grid = defaultdict(list)
+        for ii, envelope in enumerate(self.envelopes):
+            for cell in self._cells(*envelope):
+                self.grid[cell].append(ii)
+
+    def __len__(self):
+        return len(self.envelopes)
+
+    def _cell_range(self, low, high):
+        return range(math.floor(low / self.cell_size), math.floor(high / self.cell_size) + 1)
+
+    def _cells(self, x_min, x_max, y_min, y_max):
+        for col in self._cell_range(x_min, x_max):
+            for row in self._cell_range(y_min, y_max):
+                yield col, row
+
+    def candidates(self, envelope: Envelope) -> List[int]:
+        """Indices, in order, of the envelopes that overlap an envelope"""
+        x_min, x_max, y_min, y_max = envelope
+        cell_count = len(self._cell_range(x_min, x_max)) * len(self._cell_range(y_min, y_max))
+        if cell_count > len(self):
+            indices = np.arange(len(self))
+        else:
+            indices = np.array(sorted({ii for cell in self._cells(x_min, x_max, y_min, y_max)
+                                       for ii in self.grid.get(cell, [])}), dtype=int)
+        if not len(indices):
+            return []
+
+        envelopes = self.envelopes[indices]
+        overlaps = (envelopes[:, 0] <= x_max) & (envelopes[:, 1] >= x_min) \
+            & (envelopes[:, 2] <= y_max) & (envelopes[:, 3] >= y_min)
+        return indices[overlaps].tolist()
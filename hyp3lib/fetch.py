@@ -2,7 +2,7 @@
 
 import logging
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 import requests
 from requests.adapters import HTTPAdapter
@@ -22,7 +22,33 @@ def write_credentials_to_netrc_file(username: str, password: str,
             f.write(f'machine {domain} login {username} password {password}\n')
 
 
-def download_file(url: str, directory: Union[Path, str] = '.', chunk_size=None, retries=2, backoff_factor=1) -> str:
+def get_session(retries=2, backoff_factor=1, pool_maxsize=10) -> requests.Session:
+    """Create a requests session that retries failed requests and pools connections
+
+    Args:
+        retries: Number of retries to attempt
+        backoff_factor: Factor for calculating time between retries
+        pool_maxsize: Number of connections to keep open to each host; should be at least the number of threads
+            sharing the session
+
+    Returns:
+        session: The configured session
+    """
+    session = requests.Session()
+    retry_strategy = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+    )
+
+    adapter = HTTPAdapter(max_retries=retry_strategy, pool_maxsize=pool_maxsize)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def download_file(url: str, directory: Union[Path, str] = '.', chunk_size=None, retries=2, backoff_factor=1,
+                  session: Optional[requests.Session] = None) -> str:
     """Download a file
 
     Args:
@@ -31,6 +57,8 @@ def download_file(url: str, directory: Union[Path, str] = '.', chunk_size=None,
         chunk_size: Size to chunk the download into
         retries: Number of retries to attempt
         backoff_factor: Factor for calculating time between retries
+        session: A session (see `get_session`) to reuse connections from; if provided, `retries` and
+            `backoff_factor` are ignored in favor of the session's configuration
 
     Returns:
         download_path: The path to the downloaded file
@@ -42,15 +70,9 @@ def download_file(url: str, directory: Union[Path, str] = '.', chunk_size=None,
     except AttributeError:
         raise requests.exceptions.InvalidURL(f'Invalid URL provided: {url}')
 
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-
-    session.mount('https://', HTTPAdapter(max_retries=retry_strategy))
-    session.mount('http://', HTTPAdapter(max_retries=retry_strategy))
+    own_session = session is None
+    if own_session:
+        session = get_session(retries=retries, backoff_factor=backoff_factor)
 
     with session.get(url, stream=True) as s:
         s.raise_for_status()
@@ -58,6 +80,7 @@ def download_file(url: str, directory: Union[Path, str] = '.', chunk_size=None,
             for chunk in s.iter_content(chunk_size=chunk_size):
                 if chunk:
                     f.write(chunk)
-    session.close()
+    if own_session:
+        session.close()
 
     return str(download_path)
@@ -0,0 +1,188 @@
+"""A central GDAL performance profile for hyp3lib raster operations
+
+The profile controls GDAL's thread counts, block cache, VSI/HTTP caches, warp memory, and the default creation
+options of GeoTIFF outputs for every `warp` and `translate` made by hyp3lib. It is read from the environment when
+hyp3lib is imported, and can be replaced with `set_profile` or temporarily with `use_profile`:
+
+    with use_profile(num_threads='ALL_CPUS', cache_max=2048, creation_options=['TILED=YES', 'COMPRESS=DEFLATE']):
+        get_dem(...)
+
+The environment variables, all optional, are:
+    HYP3_GDAL_NUM_THREADS: Number of threads for warping and compression, or `ALL_CPUS`
+    HYP3_GDAL_CACHEMAX: Size of the GDAL block cache, in MB
+    HYP3_GDAL_WARP_MEMORY: Memory each warp may use, in MB
+    HYP3_GDAL_VSI_CACHE_SIZE: Size of the per-file VSI read cache, in MB
+    HYP3_GDAL_HTTP_CACHE_SIZE: Size of the global `/vsicurl/` block cache, in MB
+    HYP3_GDAL_CREATION_OPTIONS: Comma-separated default creation options for GeoTIFF outputs
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import List, Optional, Union
+
+from osgeo import gdal
+
+_GTIFF_EXTENSIONS = ('.tif', '.tiff')
+
+_cache_lock = threading.Lock()
+
+
+def reserve_cache(cache_max: int):
+    """Grow GDAL's block cache to at least `cache_max` MB
+
+    The block cache is shared by the whole process, so it is only ever grown, never shrunk or restored; concurrent
+    callers can't take cache away from each other.
+    """
+    with _cache_lock:
+        if gdal.GetCacheMax() < cache_max * 1024 ** 2:
+            gdal.SetCacheMax(cache_max * 1024 ** 2)
+
+
+@contextmanager
+def config_options(options: dict):
+    """Temporarily set GDAL configuration options for the calling thread
+
+    Options are set thread-locally, so GDAL calls made at the same time by other threads neither see them nor have
+    their own options undone.
+
+    Args:
+        options: GDAL configuration options; `GDAL_CACHEMAX` (in MB) grows the process-wide block cache, see
+            `reserve_cache`
+    """
+    options = dict(options)
+    cache_max = options.pop('GDAL_CACHEMAX', None)
+    if cache_max is not None:
+        reserve_cache(int(cache_max))
+    previous = {key: gdal.GetThreadLocalConfigOption(key, None) for key in options}
+    try:
+        for key, value in options.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetThreadLocalConfigOption(key, value)
+
+
+class GdalProfile:
+    """GDAL performance settings applied to hyp3lib raster operations; settings left as None use GDAL's defaults"""
+
+    def __init__(self, num_threads: Optional[Union[int, str]] = None, cache_max: Optional[int] = None,
+                 warp_memory: Optional[int] = None, vsi_cache_size: Optional[int] = None,
+                 http_cache_size: Optional[int] = None, creation_options: Optional[List[str]] = None):
+        """
+        Args:
+            num_threads: Number of threads for warping and compression, or `ALL_CPUS`
+            cache_max: Size of the GDAL block cache, in MB
+            warp_memory: Memory each warp may use, in MB
+            vsi_cache_size: Size of the per-file VSI read cache, in MB
+            http_cache_size: Size of the global `/vsicurl/` block cache, in MB
+            creation_options: Default creation options for GeoTIFF outputs
+        """
+        self.num_threads = num_threads
+        self.cache_max = cache_max
+        self.warp_memory = warp_memory
+        self.vsi_cache_size = vsi_cache_size
+        self.http_cache_size = http_cache_size
+        self.creation_options = list(creation_options) if creation_options else []
+
+    def __repr__(self):
+        settings = ', '.join(f'{key}={value!r}' for key, value in vars(self).items())
+        return f'{type(self).__name__}({settings})'
+
+    @classmethod
+    def from_environment(cls) -> 'GdalProfile':
+        def _int(name):
+            value = os.getenv(name)
+            return int(value) if value else None
+
+        creation_options = os.getenv('HYP3_GDAL_CREATION_OPTIONS')
+        return cls(
+            num_threads=os.getenv('HYP3_GDAL_NUM_THREADS') or None,
+            cache_max=_int('HYP3_GDAL_CACHEMAX'),
+            warp_memory=_int('HYP3_GDAL_WARP_MEMORY'),
+            vsi_cache_size=_int('HYP3_GDAL_VSI_CACHE_SIZE'),
+            http_cache_size=_int('HYP3_GDAL_HTTP_CACHE_SIZE'),
+            creation_options=creation_options.split(',') if creation_options else None,
+        )
+
+    def config_options(self) -> dict:
+        """GDAL configuration options for this profile"""
+        options = {}
+        if self.num_threads is not None:
+            options['GDAL_NUM_THREADS'] = str(self.num_threads)
+        if self.cache_max is not None:
+            options['GDAL_CACHEMAX'] = str(self.cache_max)
+        if self.vsi_cache_size is not None:
+            options['VSI_CACHE'] = 'TRUE'
+            options['VSI_CACHE_SIZE'] = str(self.vsi_cache_size * 1024 ** 2)
+        if self.http_cache_size is not None:
+            options['CPL_VSIL_CURL_CACHE_SIZE'] = str(self.http_cache_size * 1024 ** 2)
+        return options
+
+    def warp_kwargs(self, destination, kwargs: dict) -> dict:
+        """Keyword arguments for `gdal.Warp` with this profile's defaults added; explicit arguments take precedence"""
+        kwargs = self.translate_kwargs(destination, kwargs)
+        if self.num_threads is not None:
+            warp_options = list(kwargs.get('warpOptions') or [])
+            if not any(option.upper().startswith('NUM_THREADS=') for option in warp_options):
+                kwargs['warpOptions'] = warp_options + [f'NUM_THREADS={self.num_threads}']
+            kwargs.setdefault('multithread', True)
+        if self.warp_memory is not None:
+            kwargs.setdefault('warpMemoryLimit', self.warp_memory * 1024 ** 2)
+        return kwargs
+
+    def translate_kwargs(self, destination, kwargs: dict) -> dict:
+        """Keyword arguments for `gdal.Translate` with this profile's defaults added"""
+        kwargs = dict(kwargs)
+        if self.creation_options and 'creationOptions' not in kwargs and _is_gtiff(destination, kwargs.get('format')):
+            kwargs['creationOptions'] = list(self.creation_options)
+        return kwargs
+
+
+def _is_gtiff(destination, output_format: Optional[str]) -> bool:
+    if output_format is not None:
+        return output_format.lower() in ('gtiff', 'cog')
+    return isinstance(destination, (str, os.PathLike)) and str(destination).lower().endswith(_GTIFF_EXTENSIONS)
+
+
+_profile = GdalProfile.from_environment()
+
+
+def get_profile() -> GdalProfile:
+    return _profile
+
+
+def set_profile(profile: GdalProfile):
+    global _profile
+    _profile = profile
+
+
+@contextmanager
+def use_profile(profile: Optional[GdalProfile] = None, **settings):
+    """Temporarily replace the GDAL performance profile
+
+    Args:
+        profile: The profile to use; if not provided, a profile is created from `settings`
+        settings: Keyword arguments for `GdalProfile`
+    """
+    previous = get_profile()
+    set_profile(profile if profile is not None else GdalProfile(**settings))
+    try:
+        yield get_profile()
+    finally:
+        set_profile(previous)
+
+
+def warp(destination, source, **kwargs):
+    """`gdal.Warp` with the current GDAL performance profile applied"""
+    profile = get_profile()
+    with config_options(profile.config_options()):
+        return gdal.Warp(destination, source, **profile.warp_kwargs(destination, kwargs))
+
+
+def translate(destination, source, **kwargs):
+    """`gdal.Translate` with the current GDAL performance profile applied"""
+    profile = get_profile()
+    with config_options(profile.config_options()):
+        return gdal.Translate(destination, source, **profile.translate_kwargs(destination, kwargs))
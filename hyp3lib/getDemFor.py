@@ -5,8 +5,7 @@ import logging
 import os
 import shutil
 
-from osgeo import gdal
-
+from hyp3lib import gdal_config
 from hyp3lib.get_dem import get_dem
 from hyp3lib.execute import execute
 from hyp3lib.getSubSwath import get_bounding_box_file
@@ -25,7 +24,7 @@ def getDemFile(infile, outfile: str, use_opentopo=False, in_utm=True, post=None,
         if in_utm:
             proj = get_utm_proj(lon_min, lon_max, lat_min, lat_max)
             tmpdem = 'tmpdem_getDemFile_utm.tif'
-            gdal.Warp(tmpdem, outfile, dstSRS=proj, resampleAlg='cubic')
+            gdal_config.warp(tmpdem, outfile, dstSRS=proj, resampleAlg='cubic')
             shutil.move(tmpdem, outfile)
     else:
         dem_type = 'utm' if in_utm else 'latlon'
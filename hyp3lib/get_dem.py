@@ -1,13 +1,18 @@
 """Get a DEM file in .tif format from the ASF DEM heap"""
 
 import argparse
+import json
 import logging
 import math
-import multiprocessing as mp
 import os
 import shutil
 import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
+from uuid import uuid4
 
 import lxml.etree as et
 import numpy as np
@@ -21,7 +26,15 @@ from hyp3lib import DemError
 from hyp3lib import dem2isce
 from hyp3lib import saa_func_lib as saa
 from hyp3lib.asf_geometry import raster_meta
-from hyp3lib.fetch import download_file
+from hyp3lib.envelope_index import EnvelopeIndex
+from hyp3lib.fetch import download_file, get_session
+from hyp3lib.gdal_config import config_options, translate, warp
+from hyp3lib.tile_cache import DEFAULT_CACHE_SIZE, TileCache
+
+COVERAGE_INDEX_DIR_ENV = 'HYP3_DEM_INDEX_DIR'
+DEFAULT_BLOCK_CACHE = 512
+
+_coverage_indexes = {}
 
 
 def reproject_wkt(wkt, in_epsg, out_epsg):
@@ -39,6 +52,25 @@ def reproject_wkt(wkt, in_epsg, out_epsg):
     return geom.ExportToWkt()
 
 
+def get_stream_options(block_cache=DEFAULT_BLOCK_CACHE):
+    """GDAL configuration options for reading windows of remote DEM tiles with HTTP range requests
+
+    Args:
+        block_cache: Size of the GDAL block cache, in MB
+
+    Returns:
+        options: Dictionary of GDAL configuration options
+    """
+    return {
+        'GDAL_CACHEMAX': str(block_cache),
+        'GDAL_DISABLE_READDIR_ON_OPEN': 'EMPTY_DIR',
+        'CPL_VSIL_CURL_ALLOWED_EXTENSIONS': '.tif',
+        'GDAL_HTTP_MULTIRANGE': 'YES',
+        'GDAL_HTTP_MERGE_CONSECUTIVE_RANGES': 'YES',
+        'VSI_CACHE': 'TRUE',
+    }
+
+
 def get_dem_list():
     try:
         config_file = Path.home() / '.hyp3' / 'get_dem.cfg'
@@ -65,8 +97,128 @@ def get_dem_list():
     return dem_list
 
 
-def get_best_dem(y_min, y_max, x_min, x_max, dem_name=None):
-    dem_list = get_dem_list()
+class CoverageIndex:
+    """A grid index over the tile footprints in a DEM coverage shapefile
+
+    Footprint envelopes are indexed with an `EnvelopeIndex`, so a query only computes exact intersections for the
+    tiles whose envelopes overlap the query geometry.
+    """
+
+    def __init__(self, tiles, wkts, source=None):
+        """
+        Args:
+            tiles: Names of the tiles, in coverage shapefile order
+            wkts: WKT footprint of each tile
+            source: Signature of the coverage shapefile the index was built from, see `coverage_signature`
+        """
+        self.tiles = list(tiles)
+        self.wkts = list(wkts)
+        self.source = source
+        self.geometries = [ogr.CreateGeometryFromWkt(wkt) for wkt in self.wkts]
+        self.index = EnvelopeIndex([geometry.GetEnvelope() for geometry in self.geometries])
+
+    @property
+    def cell_size(self):
+        return self.index.cell_size
+
+    @classmethod
+    def from_shapefile(cls, shape_file):
+        driver = ogr.GetDriverByName('ESRI Shapefile')
+        dataset = driver.Open(shape_file, 0)
+        if dataset is None:
+            raise DemError(f'Unable to open DEM coverage shapefile {shape_file}')
+        layer = dataset.GetLayer()
+
+        tiles = []
+        wkts = []
+        for feature in layer:
+            tiles.append(feature['tile'])
+            wkts.append(feature.geometry().ExportToWkt())
+        return cls(tiles, wkts, source=coverage_signature(shape_file))
+
+    @classmethod
+    def load(cls, index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+        return cls(index['tiles'], index['wkts'], source=index.get('source'))
+
+    def save(self, index_file):
+        temp_file = f'{index_file}.{os.getpid()}'
+        with open(temp_file, 'w') as f:
+            json.dump({'tiles': self.tiles, 'wkts': self.wkts, 'source': self.source}, f)
+        os.replace(temp_file, index_file)
+
+    def candidates(self, geometry):
+        """Indices, in coverage order, of the tiles whose envelopes overlap the geometry's envelope"""
+        return self.index.candidates(geometry.GetEnvelope())
+
+    def intersecting(self, geometry):
+        """List the `(tile, wkt, area)` of each tile that intersects the geometry, in coverage order"""
+        matches = []
+        for ii in self.candidates(geometry):
+            area = self.geometries[ii].Intersection(geometry).GetArea()
+            if area > 0:
+                matches.append((self.tiles[ii], self.wkts[ii], area))
+        return matches
+
+
+def coverage_signature(shape_file):
+    """The `[size, mtime]` of a coverage shapefile's `.shp` and `.dbf` files, or None if they can't be found
+
+    Local files and `/vsicurl/` URLs are both supported; an index saved with a different signature is out of date.
+    """
+    signature = []
+    for path in (shape_file, f'{os.path.splitext(shape_file)[0]}.dbf'):
+        stat = gdal.VSIStatL(path)
+        if stat is None:
+            return None
+        signature.append([stat.size, stat.mtime])
+    return signature
+
+
+def get_coverage_index(dem, index_dir=None):
+    """Get the coverage index for a DEM, building it at most once per process
+
+    An index loaded from `index_dir` is only used if the coverage shapefile hasn't changed since it was saved.
+
+    Args:
+        dem: A DEM description, as returned by `get_dem_list`
+        index_dir: Directory to load the index from, or save it to once built
+            (default: `$HYP3_DEM_INDEX_DIR`, if set)
+
+    Returns:
+        coverage_index: A `CoverageIndex` of the DEM's coverage shapefile
+    """
+    coverage = dem['coverage']
+    if coverage in _coverage_indexes:
+        return _coverage_indexes[coverage]
+
+    if index_dir is None:
+        index_dir = os.getenv(COVERAGE_INDEX_DIR_ENV)
+    index_file = os.path.join(index_dir, f"{dem['name'].lower()}_coverage.json") if index_dir else None
+
+    coverage_index = None
+    if index_file and os.path.isfile(index_file):
+        logging.info(f'Loading DEM coverage index {index_file}')
+        coverage_index = CoverageIndex.load(index_file)
+        if coverage_index.source is None or coverage_index.source != coverage_signature(coverage):
+            logging.info(f'DEM coverage index {index_file} is out of date')
+            coverage_index = None
+
+    if coverage_index is None:
+        logging.info(f'Building DEM coverage index for {coverage}')
+        coverage_index = CoverageIndex.from_shapefile(coverage)
+        if index_file:
+            os.makedirs(index_dir, exist_ok=True)
+            coverage_index.save(index_file)
+
+    _coverage_indexes[coverage] = coverage_index
+    return coverage_index
+
+
+def get_best_dem(y_min, y_max, x_min, x_max, dem_name=None, index_dir=None, dem_list=None):
+    if dem_list is None:
+        dem_list = get_dem_list()
     if dem_name:
         dem_list = [dem for dem in dem_list if dem['name'] == dem_name]
 
@@ -77,7 +229,6 @@ def get_best_dem(y_min, y_max, x_min, x_max, dem_name=None):
     best_epsg = ''
     best_tile_list = []
     best_poly_list = []
-    driver = ogr.GetDriverByName('ESRI Shapefile')
     for dem in dem_list:
         if dem['epsg'] != 4326:
             logging.info(f"Reprojecting corners into projection {dem['epsg']}")
@@ -86,23 +237,13 @@ def get_best_dem(y_min, y_max, x_min, x_max, dem_name=None):
             proj_wkt = scene_wkt
         poly = ogr.CreateGeometryFromWkt(proj_wkt)
 
-        dataset = driver.Open(dem['coverage'], 0)
-        layer = dataset.GetLayer()
-
         coverage = 0
         tile_list = []
         poly_list = []
-        while True:
-            feature = layer.GetNextFeature()
-            if not feature:
-                break
-
-            intersection = feature.geometry().Intersection(poly)
-            area = intersection.GetArea()
-            if area > 0:
-                coverage += area
-                tile_list.append(feature['tile'])
-                poly_list.append(feature.geometry().ExportToWkt())
+        for tile, wkt, area in get_coverage_index(dem, index_dir=index_dir).intersecting(poly):
+            coverage += area
+            tile_list.append(tile)
+            poly_list.append(wkt)
 
         total_area = poly.GetArea()
         pct = coverage / total_area
@@ -125,27 +266,105 @@ def get_best_dem(y_min, y_max, x_min, x_max, dem_name=None):
     return best_name, best_epsg, best_tile_list, best_poly_list
 
 
+def fetch_tile(dem, tile_name, tile_dir='DEM', tile_cache=None, session=None):
+    """Fetch a DEM tile into a directory, or into a tile cache if one is provided
+
+    Args:
+        dem: A DEM description, as returned by `get_dem_list`
+        tile_name: Name of the tile, without extension
+        tile_dir: Directory to fetch the tile into when not using a tile cache
+        tile_cache: A `TileCache` to fetch the tile into
+        session: A session to download the tile with, see `hyp3lib.fetch.get_session`
+
+    Returns:
+        tile_path: Location of the fetched tile
+    """
+    source_file = os.path.join(dem['location'], tile_name) + '.tif'
+
+    if tile_cache is not None:
+        return tile_cache.put(dem['name'], tile_name, source_file, session=session, evict=False)
+    elif source_file.startswith('http'):
+        return download_file(source_file, directory=tile_dir, session=session)
+    else:
+        return shutil.copy(source_file, tile_dir)
+
+
 def get_tile_for(args):
-    dem_name, tile_name = args
-    output_dir = 'DEM'
+    """Fetch a DEM tile into the `DEM` directory, or into a tile cache if one is provided
+
+    Args:
+        args: Tuple of `(dem, tile_name)` or `(dem, tile_name, tile_cache)`, where `dem` is a DEM description, as
+            returned by `get_dem_list`, or the name of a DEM; pass descriptions when fetching many tiles, so the DEM
+            config isn't read for every tile
+
+    Returns:
+        tile_path: Location of the fetched tile
+    """
+    dem, tile_name, *cache = args
+    tile_cache = cache[0] if cache else None
+
+    if not isinstance(dem, dict):
+        dem = next((item for item in get_dem_list() if item['name'] == dem), None)
+        if dem is None:
+            return None
+
+    tile_path = fetch_tile(dem, tile_name, tile_cache=tile_cache)
+    if tile_cache is not None:
+        tile_cache.evict(keep=[tile_path])
+    return tile_path
+
+
+def _timed_fetch_tile(*args, **kwargs):
+    start = time.monotonic()
+    tile_path = fetch_tile(*args, **kwargs)
+    return tile_path, time.monotonic() - start
+
+
+def fetch_tiles(dem, tile_list, threads=1, tile_dir='DEM', tile_cache=None):
+    """Fetch DEM tiles concurrently, sharing one pool of HTTP connections between threads
+
+    Args:
+        dem: A DEM description, as returned by `get_dem_list`
+        tile_list: Names of the tiles to fetch, without extensions
+        threads: Number of tiles to fetch at once
+        tile_dir: Directory to fetch the tiles into when not using a tile cache
+        tile_cache: A `TileCache` to fetch the tiles into
+
+    Returns:
+        tile_paths: Location of each fetched tile, in `tile_list` order
+    """
+    tile_paths = {}
+    total_bytes = 0
+    start = time.monotonic()
+    with get_session(pool_maxsize=threads) as session, ThreadPoolExecutor(max_workers=threads) as executor:
+        futures = {
+            executor.submit(_timed_fetch_tile, dem, tile, tile_dir=tile_dir, tile_cache=tile_cache, session=session):
+                tile for tile in tile_list
+        }
+        for count, future in enumerate(as_completed(futures), start=1):
+            tile = futures[future]
+            tile_path, seconds = future.result()
+            tile_paths[tile] = tile_path
 
-    dem_list = get_dem_list()
-    for dem in dem_list:
-        if dem['name'] == dem_name:
-            source_file = os.path.join(dem['location'], tile_name) + '.tif'
+            tile_bytes = os.path.getsize(tile_path)
+            total_bytes += tile_bytes
+            megabytes = tile_bytes / 1024 ** 2
+            total_megabytes = total_bytes / 1024 ** 2
+            logging.info(f'Fetched DEM tile {tile} ({count}/{len(tile_list)}): {megabytes:.1f} MB in {seconds:.1f} s '
+                         f'({megabytes / max(seconds, 1e-6):.1f} MB/s; '
+                         f'{total_megabytes / max(time.monotonic() - start, 1e-6):.1f} MB/s overall)')
 
-            if source_file.startswith('http'):
-                download_file(source_file, directory=output_dir)
-            else:
-                shutil.copy(source_file, output_dir)
+    return [tile_paths[tile] for tile in tile_list]
 
 
-def write_vrt(dem_proj, nodata, tile_list, poly_list, out_file):
+def write_vrt(dem_proj, nodata, tile_list, poly_list, out_file, tile_dir='DEM'):
     # Get dimensions and pixel size from first DEM in tile ListCommand
-    dem_file = os.path.join('DEM', f'{tile_list[0]}.tif')
+    dem_file = os.path.join(tile_dir, f'{tile_list[0]}.tif')
     spatial_ref, gt, shape, pixel = raster_meta(dem_file)
     rows, cols = shape
     pix_size = gt[1]
+    # Advertise the tiles' real block layout so windowed reads of remote tiles only fetch the blocks needed
+    block_x_size, block_y_size = gdal.Open(dem_file).GetRasterBand(1).GetBlockSize()
 
     # Determine coverage
     min_lon = 360
@@ -190,16 +409,17 @@ def write_vrt(dem_proj, nodata, tile_list, poly_list, out_file):
     tile_count = len(tile_list)
     for ii in range(tile_count):
         source = et.SubElement(bands, 'ComplexSource')
-        dem_file = os.path.join('DEM', f'{tile_list[ii]}.tif')
-        et.SubElement(source, 'SourceFilename', relativeToVRT='1').text = \
+        dem_file = os.path.join(tile_dir, f'{tile_list[ii]}.tif')
+        relative = '0' if os.path.isabs(dem_file) else '1'
+        et.SubElement(source, 'SourceFilename', relativeToVRT=relative).text = \
             dem_file
         et.SubElement(source, 'SourceBand').text = '1'
         properties = et.SubElement(source, 'SourceProperties')
         properties.set('RasterXSize', str(cols))
         properties.set('RasterYSize', str(rows))
         properties.set('DataType', 'Float32')
-        properties.set('BlockXSize', str(cols))
-        properties.set('BlockYSize', '1')
+        properties.set('BlockXSize', str(block_x_size))
+        properties.set('BlockYSize', str(block_y_size))
         src = et.SubElement(source, 'SrcRect')
         src.set('xOff', '0')
         src.set('yOff', '0')
@@ -218,10 +438,8 @@ def write_vrt(dem_proj, nodata, tile_list, poly_list, out_file):
                                pretty_print=True))
 
 
-def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_name=None, leave=False, dem_type='utm'):
-    if post is not None:
-        logging.info(f"Snapping to grid at posting of {post} meters")
-
+def check_bounds(x_min, y_min, x_max, y_max):
+    """Validate a geographic bounding box, swapping any reversed bounds"""
     if y_min < -90 or y_max > 90:
         raise ValueError(f"Please use latitude in range (-90, 90) ({y_min}, {y_max})")
 
@@ -233,11 +451,11 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
         logging.warning("WARNING: minimum northing > maximum northing - swapping")
         (y_min, y_max) = (y_max, y_min)
 
-    # Figure out which DEM and get the tile list
-    (demname, demproj, tile_list, poly_list) = get_best_dem(y_min, y_max, x_min, x_max, dem_name=dem_name)
-    demproj = int(demproj)
-    logging.info(f"demproj is {demproj}")
+    return x_min, y_min, x_max, y_max
+
 
+def buffer_bounds(demname, x_min, y_min, x_max, y_max):
+    """Buffer a geographic bounding box as needed for a DEM"""
     # Add buffer for REMA
     if 'REMA' in demname or 'GIMP' in demname:
         x_min -= 4
@@ -245,55 +463,127 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
     if 'EU_DEM' in demname:
         y_min -= 2
         y_max += 2
+    return x_min, y_min, x_max, y_max
 
-    # Copy the files into a dem directory
-    if not os.path.isdir("DEM"):
-        os.mkdir("DEM")
 
-    # Download tiles in parallel
-    logging.info("Fetching DEM tiles to local storage")
-    p = mp.Pool(processes=processes)
-    p.map(
-        get_tile_for,
-        [(demname, fi) for fi in tile_list]
-    )
-    p.close()
-    p.join()
-
-    # os.system("gdalbuildvrt temp.vrt DEM/*.tif")
+def get_nodata(demname):
     if "SRTMGL" in demname:
-        nodata = -32768
+        return -32768
     elif "GIMP" in demname:
-        nodata = None
+        return None
     elif "REMA" in demname:
-        nodata = 0
+        return 0
     elif "NED" in demname or "EU_DEM_V11" in demname:
-        nodata = -3.4028234663852886e+38
+        return -3.4028234663852886e+38
     else:
         raise DemError(f'Unable to determine NoData value for DEM {demname}')
 
-    write_vrt(demproj, nodata, tile_list, poly_list, 'temp.vrt')
 
-    #
-    # Set the output projection to either NPS, SPS, or UTM
-    #
+def get_pixel_sizes(demname):
+    """Output pixel size, in meters, and tile pixel size, in degrees, of a DEM"""
+    pixsize = 30.0
+    gcssize = 0.00027777777778
+
+    if demname == "SRTMGL3":
+        pixsize = 90.
+        gcssize *= 3
+    if demname == "NED2":
+        pixsize = 60.
+        gcssize *= 2
+
+    return pixsize, gcssize
+
+
+def get_output_epsg(demproj, x_min, y_min, x_max, y_max):
+    """Get the output projection, either NPS, SPS, or UTM, of a DEM covering a geographic bounding box"""
     if demproj == 3413:  # North Polar Stereo
-        outproj = 'EPSG:3413'
-        outproj_num = 3413
+        return 3413
     elif demproj == 3031:  # South Polar Stereo
-        outproj = 'EPSG:3031'
-        outproj_num = 3031
+        return 3031
+
+    lon = (x_max + x_min) / 2
+    zone = math.floor((lon + 180) / 6 + 1)
+    if zone > 60:
+        zone -= 60
+    if (y_min + y_max) / 2 > 0:
+        return int("326%02d" % int(zone))
     else:
-        lon = (x_max + x_min) / 2
-        zone = math.floor((lon + 180) / 6 + 1)
-        if zone > 60:
-            zone -= 60
-        if (y_min + y_max) / 2 > 0:
-            outproj = ('EPSG:326%02d' % int(zone))
-            outproj_num = int("326%02d" % int(zone))
+        return int("327%02d" % int(zone))
+
+
+def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_name=None, leave=False, dem_type='utm',
+            tile_cache=None, single_warp=False, stream_tiles=False, block_cache=DEFAULT_BLOCK_CACHE, warp_processes=1,
+            warp_memory=None):
+    """Create a DEM covering a bounding box from the best available DEM on the ASF DEM heap
+
+    If `tile_cache` is not provided, a tile cache will be used if the `HYP3_DEM_CACHE_DIR` environment variable is
+    set; otherwise, tiles are fetched into a `DEM` directory in the current working directory.
+
+    If `single_warp` is True, the output grid is computed up front and the DEM tiles are resampled onto it with a
+    single warp (see `warp_dem`), instead of through a series of intermediate GeoTIFFs.
+
+    If `stream_tiles` is True and the DEM is hosted over HTTP, the mosaic VRT references the tiles through
+    `/vsicurl/` so only the windows needed are read with HTTP range requests, through a GDAL block cache of
+    `block_cache` MB. Otherwise, or if the tiles cannot be streamed, whole tiles are fetched as usual.
+
+    If `warp_processes` is greater than one, the reprojection and the warps onto the output grid are split into strips
+    of rows which are warped in parallel (see `warp_strips`). `warp_memory` sets the memory, in MB, each warp may use.
+    """
+    if post is not None:
+        logging.info(f"Snapping to grid at posting of {post} meters")
+
+    x_min, y_min, x_max, y_max = check_bounds(x_min, y_min, x_max, y_max)
+
+    # Figure out which DEM and get the tile list
+    dem_list = get_dem_list()
+    (demname, demproj, tile_list, poly_list) = get_best_dem(y_min, y_max, x_min, x_max, dem_name=dem_name,
+                                                            dem_list=dem_list)
+    demproj = int(demproj)
+    logging.info(f"demproj is {demproj}")
+
+    x_min, y_min, x_max, y_max = buffer_bounds(demname, x_min, y_min, x_max, y_max)
+
+    # os.system("gdalbuildvrt temp.vrt DEM/*.tif")
+    nodata = get_nodata(demname)
+
+    dem = next(dem for dem in dem_list if dem['name'] == demname)
+
+    stream_options = {}
+    if stream_tiles and dem['location'].startswith('http'):
+        logging.info("Streaming DEM tiles with HTTP range requests")
+        try:
+            with config_options(get_stream_options(block_cache)):
+                write_vrt(demproj, nodata, tile_list, poly_list, 'temp.vrt', tile_dir='/vsicurl/' + dem['location'])
+            stream_options = get_stream_options(block_cache)
+        except (AttributeError, RuntimeError) as e:
+            logging.warning(f"Unable to stream DEM tiles; falling back to fetching them: {e}")
+
+    if not stream_options:
+        if tile_cache is None:
+            tile_cache = TileCache.from_environment()
+
+        if tile_cache is None:
+            # Copy the files into a dem directory
+            tile_dir = 'DEM'
+            if not os.path.isdir(tile_dir):
+                os.mkdir(tile_dir)
+            missing_tiles = tile_list
         else:
-            outproj = ('EPSG:327%02d' % int(zone))
-            outproj_num = int("327%02d" % int(zone))
+            tile_dir = str(tile_cache.tile_dir(demname).resolve())
+            missing_tiles = [fi for fi in tile_list if tile_cache.get(demname, fi) is None]
+
+        # Download tiles in parallel
+        logging.info("Fetching DEM tiles to local storage")
+        fetch_tiles(dem, missing_tiles, threads=processes, tile_dir=tile_dir, tile_cache=tile_cache)
+
+        if tile_cache is not None:
+            tile_cache.evict(keep=[tile_cache.path_for(demname, tile) for tile in tile_list])
+            logging.info(f"DEM tile cache: {tile_cache.stats()}")
+
+        write_vrt(demproj, nodata, tile_list, poly_list, 'temp.vrt', tile_dir=tile_dir)
+
+    outproj_num = get_output_epsg(demproj, x_min, y_min, x_max, y_max)
+    outproj = f'EPSG:{outproj_num}'
 
     tmpdem = "xxyyzz_img.tif"
     tmpdem2 = "aabbcc_img.tif"
@@ -305,15 +595,15 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
         logging.info("Removing old file projected dem file")
         os.remove(tmpproj)
 
-    pixsize = 30.0
-    gcssize = 0.00027777777778
+    pixsize, gcssize = get_pixel_sizes(demname)
 
-    if demname == "SRTMGL3":
-        pixsize = 90.
-        gcssize *= 3
-    if demname == "NED2":
-        pixsize = 60.
-        gcssize *= 2
+    if single_warp:
+        with config_options(stream_options):
+            warp_dem("temp.vrt", outfile, demname, x_min, y_min, x_max, y_max, outproj_num, pixsize, gcssize,
+                     post=post, dem_type=dem_type, workers=warp_processes, warp_memory=warp_memory)
+        report_min(outfile)
+        logging.info("Successful Completion!")
+        return demname
 
     logging.info("Creating initial raster file")
     logging.info(f"    tmpdem {tmpdem}")
@@ -332,15 +622,16 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
         res = gcssize
     else:
         res = pixsize
-    gdal.Warp(tmpdem, "temp.vrt", xRes=res, yRes=res, outputBounds=[x_min, y_min, x_max, y_max],
-              resampleAlg="cubic", dstNodata=-32767)
+    with config_options(stream_options):
+        warp(tmpdem, "temp.vrt", xRes=res, yRes=res, outputBounds=[x_min, y_min, x_max, y_max],
+                  resampleAlg="cubic", dstNodata=-32767)
 
     # If DEM is from NED collection, then it will have a NAD83 ellipse -
     # need to convert to WGS84
     # Also, need to convert from pixel as area to pixel as point
     if "NED" in demname:
         logging.info("Converting to WGS84")
-        gdal.Warp("temp_dem_wgs84.tif", tmpdem, dstSRS="EPSG:4326")
+        warp("temp_dem_wgs84.tif", tmpdem, dstSRS="EPSG:4326")
         logging.info("Converting to pixel as point")
         x1, y1, t1, p1, data = \
             saa.read_gdal_file(saa.open_gdal_file("temp_dem_wgs84.tif"))
@@ -359,14 +650,20 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
 
     clean_dem(tmpdem, tmpdem2)
     shutil.move(tmpdem2, tmpdem)
-    gdal.Translate(tmpdem2, tmpdem, metadataOptions=['AREA_OR_POINT=Point'])
+    translate(tmpdem2, tmpdem, metadataOptions=['AREA_OR_POINT=Point'])
     shutil.move(tmpdem2, tmpdem)
 
     # Reproject the DEM file into UTM space
     if demproj != outproj_num:
         logging.info(f"Translating raster file to projected coordinates ({outproj})")
-        gdal.Warp(tmpproj, tmpdem, dstSRS=outproj, xRes=pixsize, yRes=pixsize, resampleAlg="cubic",
-                  srcNodata=-32767, dstNodata=-32767)
+        warp_options = dict(dstSRS=outproj, xRes=pixsize, yRes=pixsize, resampleAlg="cubic", srcNodata=-32767,
+                            dstNodata=-32767)
+        if warp_processes > 1:
+            warp_strips(tmpproj, tmpdem, workers=warp_processes, warp_memory=warp_memory, **warp_options)
+        else:
+            if warp_memory is not None:
+                warp_options['warpMemoryLimit'] = warp_memory * 1024 ** 2
+            warp(tmpproj, tmpdem, **warp_options)
         infile = tmpproj
     else:
         infile = tmpdem
@@ -375,7 +672,7 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
 
     # Snap to posting grid
     if post:
-        snap_to_grid(post, pixsize, infile, outfile)
+        snap_to_grid(post, pixsize, infile, outfile, workers=warp_processes, warp_memory=warp_memory)
     else:
         shutil.copy(infile, outfile)
 
@@ -396,7 +693,7 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
 
     elif dem_type.lower() == 'latlon':
         pixsize = 0.000277777777778
-        gdal.Warp(
+        warp(
             "temp_dem.tif", outfile, dstSRS="EPSG:4326", xRes=pixsize, yRes=pixsize, resampleAlg="cubic",
             dstNodata=-32767
         )
@@ -404,7 +701,7 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
 
     elif dem_type.lower() == 'isce':
         pixsize = 0.000277777777778
-        gdal.Warp("temp_dem.tif", outfile, format="ENVI", dstSRS="EPSG:4326", xRes=pixsize, yRes=pixsize,
+        warp("temp_dem.tif", outfile, format="ENVI", dstSRS="EPSG:4326", xRes=pixsize, yRes=pixsize,
                   resampleAlg="cubic", dstNodata=-32767)
         shutil.move("temp_dem.tif", outfile)
         hdr_name = os.path.splitext(outfile)[0] + ".hdr"
@@ -416,28 +713,294 @@ def get_dem(x_min, y_min, x_max, y_max, outfile, post=None, processes=1, dem_nam
     return demname
 
 
+def get_dems(aois, post=None, processes=1, dem_name=None, dem_type='utm', tile_cache=None):
+    """Create DEMs for many areas of interest, fetching each DEM tile only once
+
+    Tile requirements are planned for the whole batch: the union of the tiles needed is fetched once and mosaicked
+    into one VRT per DEM in a private working directory. Each output DEM is then warped from that shared mosaic with
+    a single warp (see `warp_dem`) in a pool of processes. Nothing other than the output DEMs is written outside the
+    working directory (and the tile cache, if used), so concurrent batches do not collide.
+
+    Args:
+        aois: Iterable of `(x_min, y_min, x_max, y_max, outfile)` tuples, with bounds in geographic coordinates
+        post: Posting, in meters, to snap the bounds of `utm` DEMs to
+        processes: Number of threads fetching tiles, and of processes creating output DEMs
+        dem_name: Name of the DEM to use; by default, the best DEM for each area of interest is used
+        dem_type: One of `utm`, `latlon`, or `isce`
+        tile_cache: A `TileCache` to fetch tiles into; if not provided, one will be used if the
+            `HYP3_DEM_CACHE_DIR` environment variable is set
+
+    Returns:
+        dem_names: Name of the DEM used for each area of interest
+    """
+    if tile_cache is None:
+        tile_cache = TileCache.from_environment()
+
+    dem_list = get_dem_list()
+    plans = []
+    dem_tiles = defaultdict(dict)
+    for x_min, y_min, x_max, y_max, outfile in aois:
+        x_min, y_min, x_max, y_max = check_bounds(x_min, y_min, x_max, y_max)
+        demname, demproj, tile_list, poly_list = get_best_dem(y_min, y_max, x_min, x_max, dem_name=dem_name,
+                                                              dem_list=dem_list)
+        dem_tiles[demname].update(zip(tile_list, poly_list))
+        bounds = buffer_bounds(demname, x_min, y_min, x_max, y_max)
+        plans.append((demname, int(demproj), bounds, os.path.abspath(outfile)))
+
+    with tempfile.TemporaryDirectory(prefix='get_dems_') as work_dir:
+        mosaics = {}
+        batch_tiles = []
+        for demname, tiles in dem_tiles.items():
+            dem = next(dem for dem in dem_list if dem['name'] == demname)
+            tile_list = list(tiles)
+            if tile_cache is None:
+                tile_dir = os.path.join(work_dir, demname)
+                os.mkdir(tile_dir)
+                missing_tiles = tile_list
+            else:
+                tile_dir = str(tile_cache.tile_dir(demname).resolve())
+                missing_tiles = [tile for tile in tile_list if tile_cache.get(demname, tile) is None]
+
+            logging.info(f"Fetching {len(missing_tiles)} of the {len(tile_list)} {demname} tiles needed for the batch")
+            fetch_tiles(dem, missing_tiles, threads=processes, tile_dir=tile_dir, tile_cache=tile_cache)
+            if tile_cache is not None:
+                batch_tiles.extend(tile_cache.path_for(demname, tile) for tile in tile_list)
+
+            mosaics[demname] = os.path.join(work_dir, f'{demname}.vrt')
+            write_vrt(dem['epsg'], get_nodata(demname), tile_list, list(tiles.values()), mosaics[demname],
+                      tile_dir=tile_dir)
+
+        if tile_cache is not None:
+            tile_cache.evict(keep=batch_tiles)
+            logging.info(f"DEM tile cache: {tile_cache.stats()}")
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = []
+            for demname, demproj, bounds, outfile in plans:
+                pixsize, gcssize = get_pixel_sizes(demname)
+                out_epsg = get_output_epsg(demproj, *bounds)
+                futures.append(executor.submit(warp_dem, mosaics[demname], outfile, demname, *bounds, out_epsg,
+                                               pixsize, gcssize, post=post, dem_type=dem_type))
+            for future, (demname, _, _, outfile) in zip(futures, plans):
+                future.result()
+                logging.info(f"Created {outfile} from {demname}")
+
+    return [demname for demname, _, _, _ in plans]
+
+
+def get_output_bounds(x_min, y_min, x_max, y_max, out_epsg, posting, densify=21):
+    """Transform a geographic bounding box into a projection, snapping it outward to a posting
+
+    Args:
+        x_min: minimum longitude
+        y_min: minimum latitude
+        x_max: maximum longitude
+        y_max: maximum latitude
+        out_epsg: EPSG code of the output projection
+        posting: Posting to snap the transformed bounds to
+        densify: Number of points to transform along each edge of the bounding box
+
+    Returns:
+        bounds: `[x_min, y_min, x_max, y_max]` in the output projection
+    """
+    steps = np.linspace(0, 1, densify)
+    lons = np.concatenate([x_min + (x_max - x_min) * steps, np.full(densify, x_max),
+                           x_max - (x_max - x_min) * steps, np.full(densify, x_min)])
+    lats = np.concatenate([np.full(densify, y_min), y_min + (y_max - y_min) * steps,
+                           np.full(densify, y_max), y_max - (y_max - y_min) * steps])
+
+    transformer = Transformer.from_crs('epsg:4326', f'epsg:{out_epsg}', always_xy=True)
+    easts, norths = transformer.transform(lons, lats)
+
+    return [np.floor(np.min(easts) / posting) * posting,
+            np.floor(np.min(norths) / posting) * posting,
+            np.ceil(np.max(easts) / posting) * posting,
+            np.ceil(np.max(norths) / posting) * posting]
+
+
+def _warp_scales(source, warped_vrt):
+    """Resampling factors, in destination pixels per source pixel, of a warp over its whole output grid"""
+    src = gdal.Open(source)
+    dst = gdal.Open(warped_vrt)
+    transformer = gdal.Transformer(src, dst, [])
+    cols, rows = dst.RasterXSize, dst.RasterYSize
+    points = [(x, y) for x in (0, cols / 2, cols) for y in (0, rows / 2, rows)]
+    src_points, _ = transformer.TransformPoints(True, points)
+
+    src_x = [point[0] for point in src_points]
+    src_y = [point[1] for point in src_points]
+    return cols / (max(src_x) - min(src_x)), rows / (max(src_y) - min(src_y))
+
+
+def _read_strip(args):
+    warped_vrt, row, rows = args
+    dataset = gdal.Open(warped_vrt)
+    strip = [dataset.GetRasterBand(band).ReadAsArray(0, row, dataset.RasterXSize, rows)
+             for band in range(1, dataset.RasterCount + 1)]
+    return row, strip
+
+
+def warp_strips(outfile, source, workers=1, warp_memory=None, strip_rows=256, **warp_options):
+    """Warp a raster by splitting the output grid into strips of rows that are warped in parallel
+
+    Each strip is read from a warped VRT of the whole output grid in a pool of processes, and written into a tiled
+    GeoTIFF. So that the output does not depend on how the grid is split, strips are warped with an exact
+    transformer (`errorThreshold=0`) and with resampling factors (`XSCALE`/`YSCALE`) computed once for the whole
+    grid. With `workers=1`, the whole grid is warped at once with these same options, which gives a bit-identical
+    result.
+
+    Args:
+        outfile: Output GeoTIFF
+        source: Input raster; must be readable by other processes, so not in `/vsimem/`
+        workers: Number of processes warping strips
+        warp_memory: Memory, in MB, each process may use for warping
+        strip_rows: Number of rows in each strip; must be a multiple of 16
+        warp_options: Other keyword arguments for `gdal.Warp`, e.g. `dstSRS`, `outputBounds`, and `resampleAlg`
+
+    Returns:
+        dataset: The output dataset
+    """
+    warp_options['errorThreshold'] = 0
+    if warp_memory is not None:
+        warp_options['warpMemoryLimit'] = warp_memory * 1024 ** 2
+    creation_options = ['TILED=YES', 'BLOCKXSIZE=256', f'BLOCKYSIZE={strip_rows}']
+
+    with tempfile.TemporaryDirectory(prefix='warp_strips_') as work_dir:
+        warped_vrt = os.path.join(work_dir, 'warped.vrt')
+        warp(warped_vrt, source, format='VRT', **warp_options)
+        x_scale, y_scale = _warp_scales(source, warped_vrt)
+        warp_options['warpOptions'] = list(warp_options.get('warpOptions', [])) + \
+            [f'XSCALE={x_scale!r}', f'YSCALE={y_scale!r}']
+
+        if workers <= 1:
+            return warp(outfile, source, creationOptions=creation_options, **warp_options)
+
+        warp(warped_vrt, source, format='VRT', **warp_options)
+        vrt = gdal.Open(warped_vrt)
+        rows = vrt.RasterYSize
+        output = gdal.GetDriverByName('GTiff').Create(outfile, vrt.RasterXSize, rows, vrt.RasterCount,
+                                                      vrt.GetRasterBand(1).DataType, creation_options)
+        output.SetGeoTransform(vrt.GetGeoTransform())
+        output.SetProjection(vrt.GetProjection())
+        for band in range(1, vrt.RasterCount + 1):
+            nodata = vrt.GetRasterBand(band).GetNoDataValue()
+            if nodata is not None:
+                output.GetRasterBand(band).SetNoDataValue(nodata)
+        vrt = None
+
+        logging.info(f"Warping {rows} rows in strips of {strip_rows} with {workers} processes")
+        strips = [(warped_vrt, row, min(strip_rows, rows - row)) for row in range(0, rows, strip_rows)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for row, strip in executor.map(_read_strip, strips):
+                for band, data in enumerate(strip, start=1):
+                    output.GetRasterBand(band).WriteArray(data, 0, row)
+
+    output.FlushCache()
+    return output
+
+
+def warp_dem(source_vrt, outfile, demname, x_min, y_min, x_max, y_max, out_epsg, pixsize, gcssize, post=None,
+             dem_type='utm', workers=1, warp_memory=None):
+    """Resample a DEM mosaic onto its final output grid with a single warp
+
+    The output grid (projection, posting, and bounds snapped to `post`) is computed up front, so the mosaic is
+    only resampled once. Intermediates are kept in `/vsimem/`, or as VRTs.
+
+    Args:
+        source_vrt: VRT mosaic of the DEM tiles
+        outfile: Output DEM file
+        demname: Name of the DEM the tiles are from
+        x_min: minimum longitude of the area of interest
+        y_min: minimum latitude of the area of interest
+        x_max: maximum longitude of the area of interest
+        y_max: maximum latitude of the area of interest
+        out_epsg: EPSG code of the output projection for `utm` DEMs
+        pixsize: Output pixel size, in meters, for `utm` DEMs
+        gcssize: Pixel size, in degrees, of the DEM tiles
+        post: Posting, in meters, to snap the bounds of `utm` DEMs to
+        dem_type: One of `utm`, `latlon`, or `isce`
+        workers: Number of processes to warp strips of the output grid with (see `warp_strips`)
+        warp_memory: Memory, in MB, each warp may use
+    """
+    dem_type = dem_type.lower()
+    if dem_type == 'utm':
+        res = pixsize
+        bounds = get_output_bounds(x_min, y_min, x_max, y_max, out_epsg, post if post else pixsize)
+    elif dem_type in ('latlon', 'isce'):
+        out_epsg = 4326
+        res = 0.000277777777778
+        bounds = get_output_bounds(x_min, y_min, x_max, y_max, out_epsg, res)
+    else:
+        raise NotImplementedError(f'Cannot get DEM for unkown type {dem_type}')
+    logging.info(f"Warping DEM onto EPSG:{out_epsg} at {res} with bounds {bounds}")
+
+    warped = f'/vsimem/get_dem_warped_{uuid4().hex}.tif'
+    warp_options = dict(dstSRS=f'EPSG:{out_epsg}', xRes=res, yRes=res, outputBounds=bounds, resampleAlg="cubic",
+                        dstNodata=-32767)
+    with tempfile.TemporaryDirectory(prefix='warp_dem_') as work_dir:
+        source = source_vrt
+        if "NED" in demname:
+            # Shift the mosaic from pixel as area to pixel as point, as in the multi-warp path
+            source = os.path.join(work_dir, 'shifted.vrt')
+            shifted = translate(source, source_vrt, format='VRT')
+            gt = list(shifted.GetGeoTransform())
+            gt[0] += gcssize / 2.0
+            gt[3] -= gcssize / 2.0
+            shifted.SetGeoTransform(gt)
+            shifted = None
+
+        try:
+            if workers > 1:
+                ds = warp_strips(warped, source, workers=workers, warp_memory=warp_memory, **warp_options)
+            else:
+                if warp_memory is not None:
+                    warp_options['warpMemoryLimit'] = warp_memory * 1024 ** 2
+                ds = warp(warped, source, **warp_options)
+            band = ds.GetRasterBand(1)
+            data = band.ReadAsArray()
+            data[data <= -1000] = -32767
+            band.WriteArray(data)
+            ds = None
+
+            out_format = 'ENVI' if dem_type == 'isce' else 'GTiff'
+            translate(outfile, warped, format=out_format, metadataOptions=['AREA_OR_POINT=Point'])
+        finally:
+            gdal.Unlink(warped)
+
+    if dem_type == 'isce':
+        hdr_name = os.path.splitext(outfile)[0] + ".hdr"
+        dem2isce.dem2isce(outfile, hdr_name, f'{outfile}.xml')
+
+
 def report_min(in_dem):
-    (x, y, trans, proj, data) = saa.read_gdal_file(saa.open_gdal_file(in_dem))
-    logging.debug(f"DEM file {in_dem} minimum is {np.min(data)}")
+    dem_min = min(np.min(block.data) for block in saa.read_gdal_blocks(saa.open_gdal_file(in_dem)))
+    logging.debug(f"DEM file {in_dem} minimum is {dem_min}")
 
 
 def clean_dem(in_dem, out_dem):
-    (x, y, trans, proj, data) = saa.read_gdal_file(saa.open_gdal_file(in_dem))
-    logging.info("Replacing values less than -1000 with zero")
-    data[data <= -1000] = -32767
-    logging.info(f"DEM Maximum value: {np.max(data)}")
-    logging.info(f"DEM minimum value: {np.min(data)}")
-
-    if data.dtype == np.float32:
-        saa.write_gdal_file_float(out_dem, trans, proj, data.astype(np.float32))
-    elif data.dtype == np.uint16:
-        saa.write_gdal_file(out_dem, trans, proj, data)
+    raster = saa.Raster(in_dem)
+    if raster.dtype() == np.float32:
+        data_type = gdal.GDT_Float32
+    elif raster.dtype() == np.uint16:
+        data_type = gdal.GDT_Int16
     else:
-        logging.error(f"ERROR: Unknown DEM data type {data.dtype}")
+        logging.error(f"ERROR: Unknown DEM data type {raster.dtype()}")
         sys.exit(1)
 
-
-def snap_to_grid(post, pixsize, infile, outfile):
+    logging.info("Replacing values less than -1000 with zero")
+    dem_min, dem_max = np.inf, -np.inf
+    with saa.GeoTiffWriter(out_dem, raster.xsize, raster.ysize, raster.geotransform, raster.projection,
+                           data_type) as writer:
+        for block in raster.blocks():
+            data = block.data
+            data[data <= -1000] = -32767
+            dem_min, dem_max = min(dem_min, np.min(data)), max(dem_max, np.max(data))
+            writer.write(data, block.window)
+    logging.info(f"DEM Maximum value: {dem_max}")
+    logging.info(f"DEM minimum value: {dem_min}")
+
+
+def snap_to_grid(post, pixsize, infile, outfile, workers=1, warp_memory=None):
     if post:
         logging.info(f"Snapping file to grid at {post} meters")
         coords = gdal.Info(infile, format='json')['cornerCoordinates']
@@ -451,8 +1014,13 @@ def snap_to_grid(post, pixsize, infile, outfile):
                   np.ceil(norths / post).max() * post]
         logging.info(f'New coordinate bounds: {bounds}')
 
-        gdal.Warp(outfile, infile, xRes=pixsize, yRes=pixsize, outputBounds=bounds, resampleAlg="cubic",
-                  dstNodata=-32767)
+        warp_options = dict(xRes=pixsize, yRes=pixsize, outputBounds=bounds, resampleAlg="cubic", dstNodata=-32767)
+        if workers > 1:
+            warp_strips(outfile, infile, workers=workers, warp_memory=warp_memory, **warp_options)
+        else:
+            if warp_memory is not None:
+                warp_options['warpMemoryLimit'] = warp_memory * 1024 ** 2
+            warp(outfile, infile, **warp_options)
     else:
         logging.info("Copying DEM to output file name")
         shutil.copy(infile, outfile)
@@ -484,6 +1052,19 @@ def main():
     parser.add_argument("-l", "--latlon", action='store_true',
                         help="Create output in GCS coordinates (default is native DEM projection)")
     parser.add_argument("-k", "--keep", action='store_true', help="Keep intermediate DEM results")
+    parser.add_argument("-c", "--cache-dir",
+                        help="Directory of a DEM tile cache to share between runs (default: $HYP3_DEM_CACHE_DIR)")
+    parser.add_argument("-s", "--single-warp", action='store_true',
+                        help="Resample the DEM tiles directly onto the output grid with a single warp")
+    parser.add_argument("--stream", action='store_true',
+                        help="Read only the needed windows of HTTP-hosted DEM tiles instead of downloading them")
+    parser.add_argument("--block-cache", type=positive_int, default=DEFAULT_BLOCK_CACHE,
+                        help="Size, in MB, of the GDAL block cache used when streaming DEM tiles")
+    parser.add_argument("-w", "--warp-processes", type=positive_int, default=1,
+                        help="Num of processes to warp strips of the output DEM with")
+    parser.add_argument("--warp-memory", type=positive_int, help="Memory, in MB, each warp may use")
+    parser.add_argument("--cache-size", type=float, default=DEFAULT_CACHE_SIZE / 1024 ** 3,
+                        help="Size, in GB, above which least recently used tiles are evicted from the tile cache")
     args = parser.parse_args()
 
     log_file = f"get_dem_{os.getpid()}.log"
@@ -497,9 +1078,15 @@ def main():
     else:
         dem_type = 'utm'
 
+    tile_cache = None
+    if args.cache_dir:
+        tile_cache = TileCache(args.cache_dir, max_size=int(args.cache_size * 1024 ** 3))
+
     get_dem(
         args.x_min, args.y_min, args.x_max, args.y_max, args.outfile,
-        post=args.posting, leave=args.keep, processes=args.threads, dem_name=args.dem, dem_type=dem_type
+        post=args.posting, leave=args.keep, processes=args.threads, dem_name=args.dem, dem_type=dem_type,
+        tile_cache=tile_cache, single_warp=args.single_warp, stream_tiles=args.stream, block_cache=args.block_cache,
+        warp_processes=args.warp_processes, warp_memory=args.warp_memory,
     )
 
 
@@ -6,7 +6,7 @@ import os
 import zipfile
 import shutil
 from lxml import etree
-from osgeo import gdal
+from hyp3lib import gdal_config
 from hyp3lib.execute import execute
 import argparse
 
@@ -40,8 +40,8 @@ def makeKMZ(infile,outfile):
     fixKmlName(kmlfile,lrgfile)
 
     # scale the PNG image to browse size
-    gdal.Translate("temp.png",pngfile,format="PNG",width=0,height=1024)
-    gdal.Translate("tmpl.png",pngfile,format="PNG",width=0,height=2048)
+    gdal_config.translate("temp.png",pngfile,format="PNG",width=0,height=1024)
+    gdal_config.translate("tmpl.png",pngfile,format="PNG",width=0,height=2048)
     
     shutil.move("temp.png",pngfile)
     shutil.move("tmpl.png",lrgfile)
@@ -56,16 +56,16 @@ def makeKMZ(infile,outfile):
 def create_browse(oldname,pngname,auxname,gcsname,proj,height):
         """Create a browse image"""
         # Use the gcsfile's aux.xml information
-        gdal.Translate(pngname,gcsname,format="PNG",height=height)
+        gdal_config.translate(pngname,gcsname,format="PNG",height=height)
         shutil.move(auxname,"gcs.aux.xml")
 
         # Use the GMT5SAR provided PNG file
-        gdal.Translate(pngname,oldname,format="PNG",height=height)
+        gdal_config.translate(pngname,oldname,format="PNG",height=height)
         shutil.move("gcs.aux.xml",auxname)
 
         # Repoject the PNG file into UTM coordinates
-        gdal.Warp("tmp.vrt",pngname,format="vrt",dstSRS=proj,resampleAlg="cubic",dstNodata=0)
-        gdal.Translate(pngname,"tmp.vrt",format="PNG")
+        gdal_config.warp("tmp.vrt",pngname,format="vrt",dstSRS=proj,resampleAlg="cubic",dstNodata=0)
+        gdal_config.translate(pngname,"tmp.vrt",format="PNG")
         os.remove("tmp.vrt")
 
 
@@ -80,13 +80,13 @@ def convert_files(s1aFlag,proj=None,res=30):
 
     # Create the phase image
     if proj is None:
-        gdal.Translate("phase.tif","filt_topophase.unw.geo",bandList=[2],creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.translate("phase.tif","filt_topophase.unw.geo",bandList=[2],creationOptions = ['COMPRESS=PACKBITS'])
         shutil.copy("phase.tif",gcsname)        
     else:
         print("Creating tmp.tif")
-        gdal.Translate("tmp.tif","filt_topophase.unw.geo.vrt",bandList=[2],creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.translate("tmp.tif","filt_topophase.unw.geo.vrt",bandList=[2],creationOptions = ['COMPRESS=PACKBITS'])
         print("phase.tif")
-        gdal.Warp("phase.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions=['COMPRESS=LZW'])
+        gdal_config.warp("phase.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions=['COMPRESS=LZW'])
         print("mv tmp.tif {}".format(gcsname))
         shutil.copy("tmp.tif",gcsname)
 #        os.remove("tmp.tif")
@@ -103,18 +103,18 @@ def convert_files(s1aFlag,proj=None,res=30):
 
     # Create the amplitude image
     if proj is None:
-        gdal.Translate("amp.tif","filt_topophase.unw.geo",bandList=[1],creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.translate("amp.tif","filt_topophase.unw.geo",bandList=[1],creationOptions = ['COMPRESS=PACKBITS'])
     else:
-        gdal.Translate("tmp.tif","filt_topophase.unw.geo.vrt",bandList=[1],creationOptions = ['COMPRESS=PACKBITS'])
-        gdal.Warp("amp.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions = ['COMPRESS=LZW'])
+        gdal_config.translate("tmp.tif","filt_topophase.unw.geo.vrt",bandList=[1],creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.warp("amp.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions = ['COMPRESS=LZW'])
         os.remove("tmp.tif")
     
     # Create the coherence image
     if proj is None:
-        gdal.Translate("coherence.tif","phsig.cor.geo",creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.translate("coherence.tif","phsig.cor.geo",creationOptions = ['COMPRESS=PACKBITS'])
     else:
-        gdal.Translate("tmp.tif","phsig.cor.geo.vrt",creationOptions = ['COMPRESS=PACKBITS'])
-        gdal.Warp("coherence.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions = ['COMPRESS=LZW'])
+        gdal_config.translate("tmp.tif","phsig.cor.geo.vrt",creationOptions = ['COMPRESS=PACKBITS'])
+        gdal_config.warp("coherence.tif","tmp.tif",dstSRS=proj,xRes=res,yRes=res,resampleAlg="cubic",dstNodata=0,creationOptions = ['COMPRESS=LZW'])
         os.remove("tmp.tif")
 
 
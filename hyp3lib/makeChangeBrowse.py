@@ -6,6 +6,7 @@ import os
 import numpy as np
 from osgeo import gdal
 
+from hyp3lib import gdal_config
 import hyp3lib.saa_func_lib as saa
 from hyp3lib.makeAsfBrowse import makeAsfBrowse
 
@@ -126,7 +127,7 @@ def makeChangeBrowse(geotiff,type="MSCD"):
     outName = geotiff.replace(".tif","_byte.tif")
     pngName = geotiff.replace(".tif","_byte_full.png")
     saa.write_gdal_file_byte(outName,trans,proj,newData.astype(np.byte))
-    gdal.Translate(pngName,outName,format="PNG",outputType=gdal.GDT_Byte,scaleParams=[[0,255]],noData="0 0 0")
+    gdal_config.translate(pngName,outName,format="PNG",outputType=gdal.GDT_Byte,scaleParams=[[0,255]],noData="0 0 0")
     os.remove(outName)
 
     #
@@ -135,7 +136,7 @@ def makeChangeBrowse(geotiff,type="MSCD"):
     outName = geotiff.replace(".tif","_rgb.tif")
     pngName = geotiff.replace(".tif","_rgb_full.png")
     saa.write_gdal_file_rgb(outName,trans,proj,red,green,blue) 
-    gdal.Translate(pngName,outName,format="PNG",outputType=gdal.GDT_Byte,scaleParams=[[0,255]],noData="0 0 0")
+    gdal_config.translate(pngName,outName,format="PNG",outputType=gdal.GDT_Byte,scaleParams=[[0,255]],noData="0 0 0")
 
     #
     # Make the ASF standard browse and kmz images
@@ -6,6 +6,7 @@ import os
 import math
 import numpy as np
 import argparse
+from hyp3lib import gdal_config
 from hyp3lib import saa_func_lib as saa
 import colorsys
 from osgeo import gdal
@@ -57,7 +58,7 @@ def makeColorPhase(inFile,rateReduction=1,shift=0,ampFile=None,scale=0,table='CM
     # If data if too big, resize it
     if x > 4096 or y > 4096:
         phaseTmp = "{}_small.tif".format(os.path.basename(inFile.replace(".tif","")))
-        gdal.Translate(phaseTmp,inFile,height=4096)
+        gdal_config.translate(phaseTmp,inFile,height=4096)
         x,y,trans,proj,data = saa.read_gdal_file(saa.open_gdal_file(phaseTmp))
         print("Created small tif of size {} x {}".format(x, y))
     else:
@@ -146,7 +147,7 @@ def makeColorPhase(inFile,rateReduction=1,shift=0,ampFile=None,scale=0,table='CM
         # If too large, resize the data
         if x1 > 4096 or y1 > 4096:
             ampTmp = "{}_small.tif".format(os.path.basename(ampFile.replace(".tif","")))
-            gdal.Translate(ampTmp,ampFile,height=y,width=x)
+            gdal_config.translate(ampTmp,ampFile,height=y,width=x)
             x1,y1,trans1,proj1,amp = saa.read_gdal_file(saa.open_gdal_file(ampTmp))
         else:
             x1,y1,trans1,proj1,amp = saa.read_gdal_file(saa.open_gdal_file(ampFile))
@@ -192,7 +193,7 @@ def makeColorPhase(inFile,rateReduction=1,shift=0,ampFile=None,scale=0,table='CM
         amp2File = createAmp(ampTmp)
         myrange = get2sigmacutoffs(amp2File)
         newFile = "tmp.tif"
-        gdal.Translate(newFile,amp2File,outputType=gdal.GDT_Byte,scaleParams=[myrange],resampleAlg="average")
+        gdal_config.translate(newFile,amp2File,outputType=gdal.GDT_Byte,scaleParams=[myrange],resampleAlg="average")
         x,y,trans,proj,amp = saa.read_gdal_file(saa.open_gdal_file(newFile))
 #        if ampTmp != ampFile:
 #            os.remove(ampTmp)
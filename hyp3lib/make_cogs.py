@@ -8,7 +8,7 @@ import sys
 from glob import glob
 from tempfile import NamedTemporaryFile
 
-from osgeo import gdal
+from hyp3lib import gdal_config
 
 
 def cogify_dir(directory: str, file_pattern: str = '*.tif'):
@@ -35,7 +35,7 @@ def cogify_file(filename: str):
     creation_options = ['TILED=YES', 'COMPRESS=DEFLATE']
     with NamedTemporaryFile() as temp_file:
         shutil.copy(filename, temp_file.name)
-        gdal.Translate(filename, temp_file.name, format='GTiff', creationOptions=creation_options, noData=0)
+        gdal_config.translate(filename, temp_file.name, format='GTiff', creationOptions=creation_options, noData=0)
 
 
 def main():
@@ -10,6 +10,7 @@ from typing import Union
 import numpy as np
 from osgeo import gdal, osr
 
+from hyp3lib import gdal_config
 import hyp3lib.saa_func_lib as saa
 from hyp3lib.execute import execute
 from hyp3lib.system import gamma_version
@@ -131,7 +132,7 @@ def ps2dem(in_dem: Union[str, Path], out_dem: str, dem_par: str):
 
     tmptif = "temporary_dem_file.tif"
     saa.write_gdal_file_float(tmptif, trans, proj, fdata)
-    gdal.Translate(out_dem, tmptif, format="ENVI")
+    gdal_config.translate(out_dem, tmptif, format="ENVI")
     os.remove(tmptif)
     os.remove(out_dem + ".aux.xml")
     filename, file_extension = os.path.splitext(out_dem)
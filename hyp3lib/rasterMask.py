@@ -6,6 +6,7 @@ import argparse
 import os
 import numpy as np
 from osgeo import gdal
+from hyp3lib import gdal_config
 from hyp3lib.asf_geometry import geotiff2data, data2geotiff
 from hyp3lib.asf_time_series import vector_meta
 
@@ -45,7 +46,7 @@ def rasterMask(inFile, maskFile, aoiFile, maskAoiFile, outFile):
   coords = (extent[0], extent[2], extent[1], extent[3])
 
   ### Generate raster mask
-  gdal.Warp(maskAoiFile, maskFile, format='GTiff', dstSRS=proj, xRes=pixelSize,
+  gdal_config.warp(maskAoiFile, maskFile, format='GTiff', dstSRS=proj, xRes=pixelSize,
     yRes=pixelSize, resampleAlg='cubic', outputBounds=coords,
     outputType=gdal.GDT_Byte, creationOptions=['COMPRESS=LZW'])
 
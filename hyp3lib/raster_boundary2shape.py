@@ -10,7 +10,7 @@ from hyp3lib.asf_time_series import raster_metadata
 
 
 def raster_boundary2shape(inFile, threshold, outShapeFile, use_closing=True, fill_holes = False,
-                          pixel_shift=False):
+                          pixel_shift=False, decimation=1):
     # Extract raster image metadata
     print('Extracting raster information ...')
     (fields, values, spatialRef) = raster_metadata(inFile)
@@ -22,7 +22,7 @@ def raster_boundary2shape(inFile, threshold, outShapeFile, use_closing=True, fil
     # Generate GeoTIFF boundary geometry
     print('Extracting boundary geometry ...')
     (data, colFirst, rowFirst, geoTrans, proj) = \
-        geotiff2boundary_mask(inFile, epsg, threshold,use_closing=use_closing)
+        geotiff2boundary_mask(inFile, epsg, threshold, use_closing=use_closing, decimation=decimation)
     (rows, cols) = data.shape
 
     print("After geotiff2boundary_mask origin {x},{y}".format(x=geoTrans[0],y=geoTrans[3]))
@@ -76,13 +76,16 @@ def main():
              default=True,action='store_false',
              help='Switch to turn off closing operation')
 
+    parser.add_argument('--decimation', default=1, type=int,
+             help='derive the boundary from an image decimated by this factor (read from overviews, if available)')
+
     args = parser.parse_args()
 
     if not os.path.exists(args.input):
         parser.error(f'GeoTIFF file {args.input} does not exist!')
 
     raster_boundary2shape(
-        args.input, args.threshold, args.shape, args.no_closing, args.fill_holes, args.pixel_shift
+        args.input, args.threshold, args.shape, args.no_closing, args.fill_holes, args.pixel_shift, args.decimation
     )
 
 
@@ -0,0 +1,306 @@
+"""Memory-mapped access to raw binary GAMMA and ISCE products
+
+GAMMA and ISCE write their rasters as headerless binaries described by a sidecar file: a GAMMA `.par` file or an ISCE
+`.xml` file. `RawBinary` describes such a raster, parsed from its sidecar, and provides zero-copy `numpy.memmap` views
+of it, windowed reads, and a GDAL VRT so GDAL can read it in place, without converting it to a GeoTIFF first:
+
+    slc = RawBinary.from_gamma_par('20200101_001.slc', '20200101_001.slc.par')
+    burst = slc.read(Window(xoff=0, yoff=1500, xsize=slc.width, ysize=1500))
+    gdal.Open(slc.to_vrt())
+"""
+
+import os
+import re
+import sys
+from typing import Optional, Tuple
+
+import lxml.etree as et
+import numpy as np
+
+from hyp3lib.saa_func_lib import Window
+
+# GAMMA data is always big-endian; SCOMPLEX is a pair of 2-byte integers
+_GAMMA_DTYPES = {
+    'FCOMPLEX': np.dtype('>c8'),
+    'SCOMPLEX': np.dtype([('real', '>i2'), ('imag', '>i2')]),
+    'FLOAT': np.dtype('>f4'),
+    'REAL*4': np.dtype('>f4'),
+    'DOUBLE': np.dtype('>f8'),
+    'REAL*8': np.dtype('>f8'),
+    'SHORT': np.dtype('>i2'),
+    'INTEGER*2': np.dtype('>i2'),
+    'INTEGER*4': np.dtype('>i4'),
+    'BYTE': np.dtype('u1'),
+}
+
+_ISCE_DTYPES = {
+    'BYTE': np.dtype('u1'),
+    'SHORT': np.dtype('i2'),
+    'INT': np.dtype('i4'),
+    'LONG': np.dtype('i8'),
+    'FLOAT': np.dtype('f4'),
+    'DOUBLE': np.dtype('f8'),
+    'CFLOAT': np.dtype('c8'),
+    'CDOUBLE': np.dtype('c16'),
+}
+
+_GDAL_TYPES = {
+    'u1': 'Byte',
+    'i2': 'Int16',
+    'u2': 'UInt16',
+    'i4': 'Int32',
+    'u4': 'UInt32',
+    'f4': 'Float32',
+    'f8': 'Float64',
+    'c8': 'CFloat32',
+    'c16': 'CFloat64',
+}
+
+_SCHEMES = ('BSQ', 'BIL', 'BIP')
+
+
+def parse_gamma_par(par_file: str) -> dict:
+    """Read the `key: value` parameters of a GAMMA `.par` file; values keep their units, e.g. `'5.0 m'`"""
+    parameters = {}
+    with open(par_file) as f:
+        for line in f:
+            key, separator, value = line.partition(':')
+            if separator and key.strip():
+                parameters[key.strip()] = value.strip()
+    return parameters
+
+
+def parse_isce_xml(xml_file: str) -> dict:
+    """Read the `property` values of an ISCE image `.xml` file, keyed by upper case property name
+
+    Properties of top-level components, such as the `Coordinate1` and `Coordinate2` components of geocoded images, are
+    keyed by `COMPONENT.PROPERTY`, e.g. `COORDINATE1.STARTINGVALUE`.
+    """
+    root = et.parse(xml_file).getroot()
+    parameters = {}
+    for prefix, element in [('', root)] + [(f'{c.get("name").upper()}.', c) for c in root.findall('component')]:
+        for prop in element.findall('property'):
+            value = prop.find('value')
+            if value is not None and value.text is not None:
+                parameters[prefix + prop.get('name').upper()] = value.text.strip()
+    return parameters
+
+
+def _number(value: str) -> float:
+    return float(re.split(r'\s+', value.strip())[0])
+
+
+def _gamma_projection(parameters: dict) -> str:
+    """The projection of a GAMMA DEM/UTM `.par` file, or `''` if it isn't in UTM"""
+    if parameters.get('projection_name', '').upper() != 'UTM' or 'projection_zone' not in parameters:
+        return ''
+    zone = int(_number(parameters['projection_zone']))
+    south = _number(parameters.get('false_northing', '0')) >= 10000000
+    return f'EPSG:{(32700 if south else 32600) + zone}'
+
+
+def _isce_geotransform(parameters: dict) -> Optional[Tuple[float, ...]]:
+    """The geotransform of a geocoded ISCE image, from its top-level properties or its coordinate components"""
+    if 'FIRST_LONGITUDE' in parameters:
+        return (float(parameters['FIRST_LONGITUDE']), float(parameters['DELTA_LONGITUDE']), 0.0,
+                float(parameters['FIRST_LATITUDE']), 0.0, float(parameters['DELTA_LATITUDE']))
+
+    keys = ('COORDINATE1.STARTINGVALUE', 'COORDINATE1.DELTA', 'COORDINATE2.STARTINGVALUE', 'COORDINATE2.DELTA')
+    if not all(key in parameters for key in keys):
+        return None
+    x_start, x_delta, y_start, y_delta = (float(parameters[key]) for key in keys)
+    # images in radar geometry have the default coordinates, in pixels
+    if (x_start, x_delta, y_start, y_delta) == (0.0, 1.0, 0.0, 1.0):
+        return None
+    return x_start, x_delta, 0.0, y_start, 0.0, y_delta
+
+
+class RawBinary:
+    """A raw binary raster described by a GAMMA or ISCE sidecar file"""
+
+    def __init__(self, filename: str, width: int, length: int, dtype: np.dtype, bands: int = 1, scheme: str = 'BSQ',
+                 geotransform: Optional[Tuple[float, ...]] = None, projection: str = ''):
+        """
+        Args:
+            filename: The raw binary file
+            width: Number of samples in each line
+            length: Number of lines
+            dtype: Data type of each sample, including its byte order
+            bands: Number of bands
+            scheme: Band interleaving, one of `BSQ`, `BIL`, or `BIP`
+            geotransform: GDAL geotransform of the raster, if it is geocoded
+            projection: Projection of the raster, if it is geocoded
+        """
+        scheme = scheme.upper()
+        if scheme not in _SCHEMES:
+            raise ValueError(f'Unknown band interleaving {scheme}; expected one of {_SCHEMES}')
+        self.filename = filename
+        self.width = width
+        self.length = length
+        self.dtype = np.dtype(dtype)
+        self.bands = bands
+        self.scheme = scheme
+        self.geotransform = geotransform
+        self.projection = projection
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.filename!r}, width={self.width}, length={self.length}, ' \
+               f'dtype={self.dtype!r}, bands={self.bands}, scheme={self.scheme!r})'
+
+    @classmethod
+    def from_gamma_par(cls, filename: str, par_file: Optional[str] = None) -> 'RawBinary':
+        """Describe a GAMMA SLC, MLI, or DEM file from its `.par` file
+
+        DEM `.par` files in UTM (`corner_north`/`corner_east`) or EQA (`corner_lat`/`corner_lon`) give the raster a
+        geotransform and projection.
+
+        Args:
+            filename: The GAMMA binary file
+            par_file: The GAMMA parameter file; defaults to `filename` with `.par` appended
+        """
+        par_file = par_file or f'{filename}.par'
+        parameters = parse_gamma_par(par_file)
+
+        if 'range_samples' in parameters:
+            width = int(_number(parameters['range_samples']))
+            length = int(_number(parameters['azimuth_lines']))
+            data_format = parameters['image_format']
+        elif 'width' in parameters:
+            width = int(_number(parameters['width']))
+            length = int(_number(parameters['nlines']))
+            data_format = parameters['data_format']
+        else:
+            raise ValueError(f'Unable to find the raster dimensions in {par_file}')
+
+        data_format = data_format.split()[0].upper()
+        if data_format not in _GAMMA_DTYPES:
+            raise ValueError(f'Unknown GAMMA data format {data_format} in {par_file}')
+
+        # GAMMA corners are the centers of the upper left pixels
+        geotransform = None
+        projection = ''
+        if 'corner_north' in parameters:
+            post_north = _number(parameters['post_north'])
+            post_east = _number(parameters['post_east'])
+            geotransform = (_number(parameters['corner_east']) - post_east / 2, post_east, 0.0,
+                            _number(parameters['corner_north']) - post_north / 2, 0.0, post_north)
+            projection = _gamma_projection(parameters)
+        elif 'corner_lat' in parameters:
+            post_lat = _number(parameters['post_lat'])
+            post_lon = _number(parameters['post_lon'])
+            geotransform = (_number(parameters['corner_lon']) - post_lon / 2, post_lon, 0.0,
+                            _number(parameters['corner_lat']) - post_lat / 2, 0.0, post_lat)
+            projection = 'EPSG:4326'
+
+        return cls(filename, width, length, _GAMMA_DTYPES[data_format], geotransform=geotransform,
+                   projection=projection)
+
+    @classmethod
+    def from_isce_xml(cls, xml_file: str, filename: Optional[str] = None) -> 'RawBinary':
+        """Describe an ISCE image from its `.xml` file
+
+        Args:
+            xml_file: The ISCE image XML file
+            filename: The ISCE binary file; defaults to `xml_file` without its `.xml` extension
+        """
+        parameters = parse_isce_xml(xml_file)
+        if filename is None:
+            filename = xml_file[:-len('.xml')] if xml_file.endswith('.xml') else parameters['FILE_NAME']
+
+        data_type = parameters['DATA_TYPE'].upper()
+        if data_type not in _ISCE_DTYPES:
+            raise ValueError(f'Unknown ISCE data type {data_type} in {xml_file}')
+        byte_order = '>' if parameters.get('BYTE_ORDER', 'l').lower().startswith('b') else '<'
+        dtype = _ISCE_DTYPES[data_type].newbyteorder(byte_order)
+
+        geotransform = _isce_geotransform(parameters)
+        projection = 'EPSG:4326' if geotransform is not None else ''
+
+        return cls(filename, int(parameters['WIDTH']), int(parameters['LENGTH']), dtype,
+                   bands=int(parameters.get('NUMBER_BANDS', 1)), scheme=parameters.get('SCHEME', 'BIP'),
+                   geotransform=geotransform, projection=projection)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of `memmap`: (length, width) for a single band, otherwise interleaved as in the file"""
+        if self.bands == 1:
+            return self.length, self.width
+        return {
+            'BSQ': (self.bands, self.length, self.width),
+            'BIL': (self.length, self.bands, self.width),
+            'BIP': (self.length, self.width, self.bands),
+        }[self.scheme]
+
+    def memmap(self, mode: str = 'r') -> np.memmap:
+        """A zero-copy view of the file, in its own data type and byte order"""
+        return np.memmap(self.filename, dtype=self.dtype, mode=mode, shape=self.shape)
+
+    def band_view(self, band: int = 1) -> np.ndarray:
+        """A zero-copy (length, width) view of one band of the file"""
+        data = self.memmap()
+        if self.bands == 1:
+            return data
+        index = band - 1
+        if self.scheme == 'BSQ':
+            return data[index]
+        if self.scheme == 'BIL':
+            return data[:, index, :]
+        return data[:, :, index]
+
+    def read(self, window: Optional[Window] = None, band: int = 1) -> np.ndarray:
+        """Read a band, or a window of it, into memory in native byte order; SCOMPLEX data is read as complex64"""
+        data = self.band_view(band)
+        if window is not None:
+            data = data[window.yoff:window.yoff + window.ysize, window.xoff:window.xoff + window.xsize]
+        if self.dtype.names:
+            return data['real'].astype(np.float32) + 1j * data['imag'].astype(np.float32)
+        return data.astype(self.dtype.newbyteorder('='))
+
+    def _gdal_type(self) -> str:
+        if self.dtype.names:
+            return 'CInt16'
+        return _GDAL_TYPES[self.dtype.kind + str(self.dtype.itemsize)]
+
+    def _offsets(self, band: int) -> Tuple[int, int, int]:
+        itemsize = self.dtype.itemsize
+        index = band - 1
+        if self.scheme == 'BSQ':
+            return index * self.length * self.width * itemsize, itemsize, self.width * itemsize
+        if self.scheme == 'BIL':
+            return index * self.width * itemsize, itemsize, self.bands * self.width * itemsize
+        return index * itemsize, self.bands * itemsize, self.bands * self.width * itemsize
+
+    def to_vrt(self, vrt_file: Optional[str] = None) -> str:
+        """Describe the file as a GDAL VRT of raw raster bands, so GDAL can read it in place
+
+        Args:
+            vrt_file: Where to write the VRT; if not provided, only the VRT XML is returned
+
+        Returns:
+            vrt: The VRT XML, which can be opened directly with `gdal.Open`, or `vrt_file` if provided
+        """
+        dataset = et.Element('VRTDataset', rasterXSize=str(self.width), rasterYSize=str(self.length))
+        if self.projection:
+            et.SubElement(dataset, 'SRS').text = self.projection
+        if self.geotransform is not None:
+            et.SubElement(dataset, 'GeoTransform').text = ', '.join(repr(float(v)) for v in self.geotransform)
+
+        sample_dtype = self.dtype['real'] if self.dtype.names else self.dtype
+        big_endian = sample_dtype.byteorder == '>' or (sample_dtype.byteorder == '=' and sys.byteorder == 'big')
+        byte_order = 'MSB' if big_endian else 'LSB'
+        for band in range(1, self.bands + 1):
+            image_offset, pixel_offset, line_offset = self._offsets(band)
+            raster_band = et.SubElement(dataset, 'VRTRasterBand', dataType=self._gdal_type(), band=str(band),
+                                        subClass='VRTRawRasterBand')
+            et.SubElement(raster_band, 'SourceFilename', relativeToVRT='0').text = os.path.abspath(self.filename)
+            et.SubElement(raster_band, 'ImageOffset').text = str(image_offset)
+            et.SubElement(raster_band, 'PixelOffset').text = str(pixel_offset)
+            et.SubElement(raster_band, 'LineOffset').text = str(line_offset)
+            et.SubElement(raster_band, 'ByteOrder').text = byte_order
+
+        vrt = et.tostring(dataset, pretty_print=True).decode()
+        if vrt_file is None:
+            return vrt
+        with open(vrt_file, 'w') as f:
+            f.write(vrt)
+        return vrt_file
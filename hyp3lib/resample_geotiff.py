@@ -10,6 +10,8 @@ import lxml.etree as et
 from osgeo import gdal
 from osgeo.gdalconst import GRIORA_Cubic, GRIORA_NearestNeighbour
 
+from hyp3lib import gdal_config
+
 
 def resample_geotiff(geotiff, width, outFormat, outFile, use_nn = False):
 
@@ -51,34 +53,34 @@ def resample_geotiff(geotiff, width, outFormat, outFile, use_nn = False):
       resampleFile = outFile.replace(orgExt, tmpExt)
       tmpExt2 = ('_resamp2{0}.png'.format(os.getpid()))
       resampleFile2 = outFile.replace(orgExt, tmpExt2)
-      gdal.Translate(resampleFile,raster,format='PNG',noData='0 0 0')
-      gdal.Translate(resampleFile2,resampleFile, resampleAlg=resampleMethod, format='PNG',
+      gdal_config.translate(resampleFile,raster,format='PNG',noData='0 0 0')
+      gdal_config.translate(resampleFile2,resampleFile, resampleAlg=resampleMethod, format='PNG',
         xRes=pixelWidth, yRes=pixelHeight, noData="0 0 0")
       raster = gdal.Open(resampleFile2)
     else:
       tmpExt = ('_resamp{0}.tif'.format(os.getpid()))
       resampleFile = outFile.replace(orgExt, tmpExt)
-      gdal.Translate(resampleFile, raster, resampleAlg=resampleMethod,
+      gdal_config.translate(resampleFile, raster, resampleAlg=resampleMethod,
           xRes=pixelWidth, yRes=pixelHeight, noData="0")
       raster = gdal.Open(resampleFile)
 
   # Resample image using cubic interpolation
   # Save it in the various image formats
   if outFormat.upper() == 'GEOTIFF':
-    gdal.Translate(outFile, raster, resampleAlg=resampleMethod, width=width)
+    gdal_config.translate(outFile, raster, resampleAlg=resampleMethod, width=width)
   elif outFormat.upper() == 'JPEG' or outFormat.upper() == 'JPG':
     if colorTable is None:
-      gdal.Translate(outFile, raster, format='JPEG', resampleAlg=resampleMethod,
+      gdal_config.translate(outFile, raster, format='JPEG', resampleAlg=resampleMethod,
         width=width)
     else:
-      gdal.Translate(outFile, raster, format='JPEG', resampleAlg=resampleMethod,
+      gdal_config.translate(outFile, raster, format='JPEG', resampleAlg=resampleMethod,
         width=width, rgbExpand='RGB')
   elif outFormat.upper() == 'PNG':
     if bandCount == 1:
-      gdal.Translate(outFile, raster, format='PNG', resampleAlg=resampleMethod,
+      gdal_config.translate(outFile, raster, format='PNG', resampleAlg=resampleMethod,
         width=width, noData='0')
     elif bandCount == 3:
-      gdal.Translate(outFile, raster, format='PNG', resampleAlg=resampleMethod,
+      gdal_config.translate(outFile, raster, format='PNG', resampleAlg=resampleMethod,
         width=width, noData='0 0 0')
   elif outFormat.upper() == 'KML':
 
@@ -88,24 +90,24 @@ def resample_geotiff(geotiff, width, outFormat, outFile, use_nn = False):
     rgbFile = None
     if bandCount == 1:
       if colorTable is None:
-        gdal.Warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
+        gdal_config.warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
           srcNodata='0', dstSRS='EPSG:4326', dstAlpha=True)
       else:
         rgbExt = ('_rgb{0}.tif'.format(os.getpid()))
         rgbFile = outFile.replace(orgExt, rgbExt)
-        gdal.Translate(rgbFile, raster, rgbExpand='RGBA')
+        gdal_config.translate(rgbFile, raster, rgbExpand='RGBA')
         raster = gdal.Open(rgbFile)
-        gdal.Warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
+        gdal_config.warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
           srcNodata='0', dstSRS='EPSG:4326', dstAlpha=True)
     elif bandCount == 3:
-      gdal.Warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
+      gdal_config.warp(tmpFile, raster, resampleAlg=GRIORA_Cubic, width=width,
         srcNodata='0 0 0', dstSRS='EPSG:4326', dstAlpha=True)
     raster = None
 
     # Convert GeoTIFF to PNG - since warp cannot do that in one step
     raster = gdal.Open(tmpFile)
     pngFile = outFile.replace(orgExt, '.png')
-    gdal.Translate(pngFile, raster, format='PNG', resampleAlg=resampleMethod)
+    gdal_config.translate(pngFile, raster, format='PNG', resampleAlg=resampleMethod)
 
     # Extract metadata from GeoTIFF to fill into the KML
     gt = raster.GetGeoTransform()
@@ -8,9 +8,18 @@
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 import math
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
-from osgeo import gdal
+import scipy.fft
+from numpy.lib.stride_tricks import sliding_window_view
+from osgeo import gdal, gdal_array
+from scipy.ndimage import uniform_filter1d
+
+from hyp3lib import gdal_config
 
 
 def open_gdal_file(filename):
@@ -28,21 +37,13 @@ def read_gdal_metadata(filehandle):
 
 
 def read_gdal_file(filehandle, band=1, gcps=False):
-    geotransform = filehandle.GetGeoTransform()
-    geoproj = filehandle.GetProjection()
-    banddata = filehandle.GetRasterBand(band)
-    # type = gdal.GetDataTypeName(banddata.DataType).lower()
-    min = banddata.GetMinimum()
-    max = banddata.GetMaximum()
-    if min is None or max is None:
-        (min, max) = banddata.ComputeRasterMinMax(1)
-    data = banddata.ReadAsArray()
+    raster = Raster(filehandle)
+    data = raster.read(band)
     if gcps == False:
-        return filehandle.RasterXSize, filehandle.RasterYSize, geotransform, geoproj, data
+        return raster.xsize, raster.ysize, raster.geotransform, raster.projection, data
     else:
-        gcp = filehandle.GetGCPs()
-        gcpproj = filehandle.GetGCPProjection()
-        return filehandle.RasterXSize, filehandle.RasterYSize, geotransform, geoproj, gcp, gcpproj, data
+        return (raster.xsize, raster.ysize, raster.geotransform, raster.projection, raster.gcps,
+                raster.gcp_projection, data)
 
 
 def read_gdal_file_small(filehandle, band, xsize, ysize):
@@ -71,24 +72,258 @@ def read_gdal_file_byscanline(filehandle, xsize, ysize, xoff, yoff, band=1):
     return data
 
 
+DEFAULT_WINDOW_PIXELS = 4 * 1024 ** 2
+
+
+class Window(NamedTuple):
+    """A rectangular window of a raster, in pixels"""
+    xoff: int
+    yoff: int
+    xsize: int
+    ysize: int
+
+    def expand(self, halo: int, xsize: int, ysize: int) -> 'Window':
+        """Grow the window by `halo` pixels on every side, clipped to a raster of size `xsize` by `ysize`"""
+        xoff = max(self.xoff - halo, 0)
+        yoff = max(self.yoff - halo, 0)
+        return Window(xoff, yoff,
+                      min(self.xoff + self.xsize + halo, xsize) - xoff,
+                      min(self.yoff + self.ysize + halo, ysize) - yoff)
+
+    def slices_in(self, outer: 'Window') -> Tuple[slice, slice]:
+        """Row and column slices selecting this window from an array read over `outer`"""
+        row = self.yoff - outer.yoff
+        col = self.xoff - outer.xoff
+        return slice(row, row + self.ysize), slice(col, col + self.xsize)
+
+
+class Block(NamedTuple):
+    """Data read over a window plus its halo; `data[core]` selects just the window"""
+    window: Window
+    data: np.ndarray
+    core: Tuple[slice, slice]
+
+
+def block_windows(filehandle, band=1, max_pixels=DEFAULT_WINDOW_PIXELS) -> Iterator[Window]:
+    """Windows covering a raster, aligned to the native block layout of its band
+
+    Whole native blocks (tiles or strips) are grouped, across the full width of the raster first, into windows of at
+    most `max_pixels` pixels, so each block is read exactly once; a window is never smaller than one native block.
+
+    Args:
+        filehandle: An open GDAL dataset
+        band: The band whose block layout to follow
+        max_pixels: The largest number of pixels to put in one window
+
+    Yields:
+        window: The next window, in row-major order
+    """
+    xsize, ysize = filehandle.RasterXSize, filehandle.RasterYSize
+    block_xsize, block_ysize = filehandle.GetRasterBand(band).GetBlockSize()
+    blocks_per_window = max(1, max_pixels // (block_xsize * block_ysize))
+    x_blocks = min(math.ceil(xsize / block_xsize), blocks_per_window)
+    y_blocks = max(1, blocks_per_window // x_blocks)
+
+    window_xsize = x_blocks * block_xsize
+    window_ysize = y_blocks * block_ysize
+    for yoff in range(0, ysize, window_ysize):
+        for xoff in range(0, xsize, window_xsize):
+            yield Window(xoff, yoff, min(window_xsize, xsize - xoff), min(window_ysize, ysize - yoff))
+
+
+def read_gdal_blocks(filehandle, band=1, halo=0, max_pixels=DEFAULT_WINDOW_PIXELS) -> Iterator[Block]:
+    """Read a band window by window, with an optional halo of neighboring pixels for neighborhood filters
+
+    Windows follow `block_windows`. Each window is read along with up to `halo` pixels on every side (fewer at the
+    edges of the raster), so a filter of radius `halo` applied to `block.data` is exact over `block.data[block.core]`.
+
+    Args:
+        filehandle: An open GDAL dataset
+        band: The band to read
+        halo: Number of extra pixels to read around each window
+        max_pixels: The largest number of pixels in a window, excluding its halo
+
+    Yields:
+        block: The next window and its data
+    """
+    banddata = filehandle.GetRasterBand(band)
+    for window in block_windows(filehandle, band, max_pixels):
+        outer = window.expand(halo, filehandle.RasterXSize, filehandle.RasterYSize)
+        yield Block(window, banddata.ReadAsArray(*outer), window.slices_in(outer))
+
+
+def write_gdal_block(filehandle, window: Window, data: np.ndarray, band=1):
+    """Write an array over a window of a band; `data` must have the window's shape"""
+    if data.shape != (window.ysize, window.xsize):
+        raise ValueError(f'Data of shape {data.shape} does not match window {window}')
+    filehandle.GetRasterBand(band).WriteArray(data, window.xoff, window.yoff)
+
+
+def write_gdal_blocks(filehandle, blocks: Iterable[Tuple[Window, np.ndarray]], band=1):
+    """Write a stream of (window, data) pairs, such as processed blocks from `read_gdal_blocks`, to a band
+
+    Example:
+        >>> blocks = read_gdal_blocks(src, halo=2)
+        >>> write_gdal_blocks(dst, ((b.window, median_filter(b.data, 5)[b.core]) for b in blocks))
+    """
+    for window, data in blocks:
+        write_gdal_block(filehandle, window, data, band)
+    filehandle.FlushCache()
+
+
+class Raster:
+    """A lazily opened raster with cached metadata
+
+    The dataset is opened once, on first use, and its geotransform, projection, and each band's data type and nodata
+    value are read once and cached. Statistics are only computed on request by `statistics`, and are persisted by
+    GDAL to a `.aux.xml` sidecar file so they are not recomputed for the same file.
+    """
+    __slots__ = ('filename', '_handle', '_geotransform', '_projection', '_dtypes', '_nodata')
+
+    def __init__(self, source: Union[str, gdal.Dataset]):
+        """
+        Args:
+            source: A raster file name, or an open GDAL dataset
+        """
+        if isinstance(source, gdal.Dataset):
+            self.filename = source.GetDescription()
+            self._handle = source
+        else:
+            self.filename = str(source)
+            self._handle = None
+        self._geotransform = None
+        self._projection = None
+        self._dtypes = {}
+        self._nodata = {}
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.filename!r})'
+
+    @property
+    def handle(self) -> gdal.Dataset:
+        if self._handle is None:
+            self._handle = gdal.Open(self.filename)
+            if self._handle is None:
+                raise IOError(f'Unable to open {self.filename}')
+        return self._handle
+
+    @property
+    def xsize(self) -> int:
+        return self.handle.RasterXSize
+
+    @property
+    def ysize(self) -> int:
+        return self.handle.RasterYSize
+
+    @property
+    def band_count(self) -> int:
+        return self.handle.RasterCount
+
+    @property
+    def geotransform(self) -> Tuple[float, ...]:
+        if self._geotransform is None:
+            self._geotransform = self.handle.GetGeoTransform()
+        return self._geotransform
+
+    @property
+    def projection(self) -> str:
+        if self._projection is None:
+            self._projection = self.handle.GetProjection()
+        return self._projection
+
+    @property
+    def gcps(self):
+        return self.handle.GetGCPs()
+
+    @property
+    def gcp_projection(self) -> str:
+        return self.handle.GetGCPProjection()
+
+    @property
+    def corners(self) -> Tuple[float, float, float, float]:
+        """The (upper left x, lower right x, lower right y, upper left y) coordinates of the raster"""
+        t = self.geotransform
+        return t[0], t[0] + self.xsize * t[1], t[3] + self.ysize * t[5], t[3]
+
+    def dtype(self, band=1) -> np.dtype:
+        if band not in self._dtypes:
+            self._dtypes[band] = np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(
+                self.handle.GetRasterBand(band).DataType))
+        return self._dtypes[band]
+
+    def nodata(self, band=1) -> Optional[float]:
+        if band not in self._nodata:
+            self._nodata[band] = self.handle.GetRasterBand(band).GetNoDataValue()
+        return self._nodata[band]
+
+    def read(self, band=1, window: Optional[Window] = None) -> np.ndarray:
+        """Read a band, or a window of it"""
+        banddata = self.handle.GetRasterBand(band)
+        if window is None:
+            return banddata.ReadAsArray()
+        return banddata.ReadAsArray(*window)
+
+    def blocks(self, band=1, halo=0, max_pixels=DEFAULT_WINDOW_PIXELS) -> Iterator[Block]:
+        """Read a band window by window, see `read_gdal_blocks`"""
+        return read_gdal_blocks(self.handle, band, halo, max_pixels)
+
+    def statistics(self, band=1, approx=False) -> Tuple[float, float, float, float]:
+        """The minimum, maximum, mean, and standard deviation of a band, ignoring nodata
+
+        Statistics already stored for the band (e.g. in its `.aux.xml` file) are reused; approximate statistics are
+        only reused when `approx` is True. Newly computed statistics are written to the `.aux.xml` file.
+
+        Args:
+            band: The band to compute statistics for
+            approx: Whether statistics may be computed from overviews or a subset of blocks, rather than every pixel
+        """
+        banddata = self.handle.GetRasterBand(band)
+        stored = banddata.GetMetadata()
+        keys = ('STATISTICS_MINIMUM', 'STATISTICS_MAXIMUM', 'STATISTICS_MEAN', 'STATISTICS_STDDEV')
+        if all(key in stored for key in keys) and (approx or stored.get('STATISTICS_APPROXIMATE') != 'YES'):
+            return tuple(float(stored[key]) for key in keys)
+
+        stats = tuple(banddata.ComputeStatistics(approx))
+        self.handle.FlushCache()
+        return stats
+
+    def close(self):
+        self._handle = None
+
+
 def read_gdal_file_geo(filehandle, band=1):
-    geotransform = filehandle.GetGeoTransform()
-    geoproj = filehandle.GetProjection()
-    return filehandle.RasterXSize, filehandle.RasterYSize, geotransform, geoproj
+    raster = Raster(filehandle)
+    return raster.xsize, raster.ysize, raster.geotransform, raster.projection
+
+
+@lru_cache(maxsize=256)
+def _raster_geometry(filename: str, mtime_ns: int, size: int) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    raster = Raster(filename)
+    geometry = raster.corners, raster.geotransform
+    raster.close()
+    return geometry
+
+
+def _cached_geometry(fi) -> Tuple[Tuple[float, ...], Tuple[float, ...]]:
+    if isinstance(fi, gdal.Dataset):
+        raster = Raster(fi)
+        return raster.corners, raster.geotransform
+    stat = os.stat(fi)
+    return _raster_geometry(os.path.realpath(fi), stat.st_mtime_ns, stat.st_size)
 
 
 def getCorners(fi):
-    (x1, y1, t1, p1) = read_gdal_file_geo(open_gdal_file(fi))
-    ullon1 = t1[0]
-    ullat1 = t1[3]
-    lrlon1 = t1[0] + x1 * t1[1]
-    lrlat1 = t1[3] + y1 * t1[5]
-    return (ullon1, lrlon1, lrlat1, ullat1)
+    """The (upper left x, lower right x, lower right y, upper left y) coordinates of a raster
+
+    The geometry is cached per file (and invalidated when the file changes), so repeated calls don't reopen it.
+    Callers reading more than the geometry of a file should hold a `Raster` instead.
+    """
+    return _cached_geometry(fi)[0]
 
 
 def getPixSize(fi):
-    (x1, y1, t1, p1) = read_gdal_file_geo(open_gdal_file(fi))
-    return (t1[1])
+    """The x pixel size of a raster, cached per file like `getCorners`"""
+    return _cached_geometry(fi)[1][1]
 
 
 # Get the UTM zone
@@ -115,7 +350,7 @@ def reproject_gcs_to_utm(infile, outfile, pixSize):
     proj = get_utm_proj(lon_min, lon_max, lat_min, lat_max)
     print("Using pixel size {}".format(pixSize))
     print("Translating {} to make {}".format(infile, outfile))
-    gdal.Warp(outfile, infile, dstSRS=proj, xRes=pixSize, yRes=pixSize, creationOptions=['COMPRESS=LZW'])
+    gdal_config.warp(outfile, infile, dstSRS=proj, xRes=pixSize, yRes=pixSize, creationOptions=['COMPRESS=LZW'])
 
 
 # Subroutine for generating All corners
@@ -150,125 +385,215 @@ def write_gdal_file_byscanline(driver, xoff, yoff, data, band=1):
     driver.GetRasterBand(band).WriteArray(data, xoff, yoff)
 
 
-def write_gdal_file(filename, geotransform, geoproj, data, gcps='', gcpproj=''):
-    (x, y) = data.shape
-    format = "GTiff"
-    driver = gdal.GetDriverByName(format)
-    dst_datatype = gdal.GDT_Int16
-    dst_ds = driver.Create(filename, y, x, 1, dst_datatype)
-    northing = geotransform[0]
-    weres = geotransform[1]
-    rotation = geotransform[2]
-    easting = geotransform[3]
-    rotation = geotransform[4]
-    nsres = geotransform[5]
-
-    dst_ds.GetRasterBand(1).WriteArray(data)
-    dst_ds.SetGeoTransform([northing, weres, rotation, easting, rotation, nsres])
-    dst_ds.SetProjection(geoproj)
-    if gcps != '' and gcpproj != '':
-        dst_ds.SetGCPs(gcps, gcpproj)
+DEFAULT_TIFF_BLOCK_SIZE = 512
+
+
+def _compression_options(compress: str, data_type: int) -> List[str]:
+    compress = compress.upper()
+    if compress == 'NONE':
+        return []
+    if compress == 'ZSTD' and 'ZSTD' not in gdal.GetDriverByName('GTiff').GetMetadataItem('DMD_CREATIONOPTIONLIST'):
+        compress = 'DEFLATE'
+
+    options = [f'COMPRESS={compress}']
+    if compress in ('DEFLATE', 'ZSTD', 'LZW', 'LZMA'):
+        if data_type in (gdal.GDT_Float32, gdal.GDT_Float64):
+            options.append('PREDICTOR=3')
+        elif not gdal.DataTypeIsComplex(data_type):
+            options.append('PREDICTOR=2')
+    return options
+
+
+class GeoTiffWriter:
+    """Write a tiled, compressed GeoTIFF in its final layout, from whole arrays or a stream of windows
+
+    The file is tiled from the start, compressed with a predictor suited to its data type, and written as a BigTIFF
+    when it might otherwise exceed 4 GB. Overviews, if requested, are built when the writer is closed, so a product
+    only needs to be written once.
+
+    Example:
+        >>> with GeoTiffWriter('out.tif', xsize, ysize, geotransform, projection, gdal.GDT_Float32) as writer:
+        ...     writer.write_blocks((b.window, np.sqrt(b.data)) for b in read_gdal_blocks(src))
+    """
+
+    def __init__(self, filename: str, xsize: int, ysize: int, geotransform, projection: str,
+                 data_type: int = gdal.GDT_Float32, bands: int = 1, nodata: Optional[float] = None,
+                 compress: str = 'DEFLATE', block_size: int = DEFAULT_TIFF_BLOCK_SIZE,
+                 overviews: Optional[Union[str, List[int]]] = None, metadata: Optional[dict] = None,
+                 gcps=None, gcp_projection: str = ''):
+        """
+        Args:
+            filename: The GeoTIFF to create
+            xsize: Width of the raster, in pixels
+            ysize: Height of the raster, in pixels
+            geotransform: GDAL geotransform of the raster
+            projection: Projection of the raster, as WKT
+            data_type: GDAL data type of the bands
+            bands: Number of bands
+            nodata: Nodata value to set on every band
+            compress: `DEFLATE`, `ZSTD` (falling back to `DEFLATE` if GDAL lacks it), `LZW`, or `NONE`
+            block_size: Width and height of the tiles
+            overviews: Overview decimation factors, or `auto` for factors of 2 until the overview fits in one tile
+            metadata: Dataset metadata to set
+            gcps: Ground control points to set, with `gcp_projection`
+            gcp_projection: Projection of `gcps`, as WKT
+        """
+        self.filename = filename
+        self.overviews = overviews
+        options = ['TILED=YES', f'BLOCKXSIZE={block_size}', f'BLOCKYSIZE={block_size}', 'BIGTIFF=IF_SAFER']
+        options += _compression_options(compress, data_type)
+        num_threads = gdal_config.get_profile().num_threads
+        if num_threads is not None:
+            options.append(f'NUM_THREADS={num_threads}')
+
+        self.dataset = gdal.GetDriverByName('GTiff').Create(filename, xsize, ysize, bands, data_type, options)
+        if self.dataset is None:
+            raise IOError(f'Unable to create {filename}')
+        self.dataset.SetGeoTransform(list(geotransform))
+        self.dataset.SetProjection(projection)
+        if gcps:
+            self.dataset.SetGCPs(gcps, gcp_projection)
+        if metadata is not None:
+            self.dataset.SetMetadata(metadata)
+        if nodata is not None:
+            for band in range(1, bands + 1):
+                self.dataset.GetRasterBand(band).SetNoDataValue(nodata)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(build_overviews=exc_type is None)
+
+    def write(self, data: np.ndarray, window: Optional[Window] = None, band=1):
+        """Write a whole band, or a window of it"""
+        if window is None:
+            self.dataset.GetRasterBand(band).WriteArray(data)
+        else:
+            write_gdal_block(self.dataset, window, data, band)
+
+    def write_blocks(self, blocks: Iterable[Tuple[Window, np.ndarray]], band=1):
+        """Write a stream of (window, data) pairs to a band, see `write_gdal_blocks`"""
+        for window, data in blocks:
+            write_gdal_block(self.dataset, window, data, band)
+
+    def close(self, build_overviews: bool = True):
+        if self.dataset is None:
+            return
+        if build_overviews and self.overviews:
+            self.dataset.BuildOverviews('AVERAGE', self._overview_factors())
+        self.dataset.FlushCache()
+        self.dataset = None
+
+    def _overview_factors(self) -> List[int]:
+        if self.overviews != 'auto':
+            return list(self.overviews)
+        block_size = self.dataset.GetRasterBand(1).GetBlockSize()[0]
+        factors = []
+        factor = 2
+        while max(self.dataset.RasterXSize, self.dataset.RasterYSize) / (factor // 2) > block_size:
+            factors.append(factor)
+            factor *= 2
+        return factors
+
+
+def write_geotiff(filename: str, geotransform, projection: str, data: Union[np.ndarray, List[np.ndarray]],
+                  data_type: Optional[int] = None, **kwargs):
+    """Write arrays to a tiled, compressed GeoTIFF, see `GeoTiffWriter`
+
+    Args:
+        filename: The GeoTIFF to create
+        geotransform: GDAL geotransform of the raster
+        projection: Projection of the raster, as WKT
+        data: A 2-D array for a single band, or a 3-D array or list of 2-D arrays with one entry per band
+        data_type: GDAL data type of the bands; defaults to the type of `data`
+        kwargs: Other keyword arguments for `GeoTiffWriter`
+    """
+    bands = [data] if isinstance(data, np.ndarray) and data.ndim == 2 else list(data)
+    if data_type is None:
+        data_type = gdal_array.NumericTypeCodeToGDALTypeCode(bands[0].dtype)
+    ysize, xsize = bands[0].shape
+    with GeoTiffWriter(filename, xsize, ysize, geotransform, projection, data_type, len(bands), **kwargs) as writer:
+        for band, band_data in enumerate(bands, start=1):
+            writer.write(band_data, band=band)
 
+
+def write_gdal_file(filename, geotransform, geoproj, data, gcps='', gcpproj=''):
+    if gcps == '' or gcpproj == '':
+        gcps, gcpproj = None, ''
+    write_geotiff(filename, geotransform, geoproj, data, gdal.GDT_Int16, gcps=gcps, gcp_projection=gcpproj)
     return 1
 
 
 def write_gdal_file_float(filename, geotransform, geoproj, data, nodata=None):
-    (x, y) = data.shape
-    format = "GTiff"
-    driver = gdal.GetDriverByName(format)
-    dst_datatype = gdal.GDT_Float32
-    dst_ds = driver.Create(filename, y, x, 1, dst_datatype)
-    northing = geotransform[0]
-    weres = geotransform[1]
-    rotation = geotransform[2]
-    easting = geotransform[3]
-    rotation = geotransform[4]
-    nsres = geotransform[5]
-
-    dst_ds.GetRasterBand(1).WriteArray(data)
-    if nodata is not None:
-        dst_ds.GetRasterBand(1).SetNoDataValue(nodata)
-    # dst_ds.SetGeoTransform(geotransform)
-    dst_ds.SetGeoTransform([northing, weres, rotation, easting, rotation, nsres])
-    dst_ds.SetProjection(geoproj)
+    write_geotiff(filename, geotransform, geoproj, data, gdal.GDT_Float32, nodata=nodata)
     return 1
 
 
 def write_gdal_file_byte(filename, geotransform, geoproj, data, nodata=None):
-    (x, y) = data.shape
-    format = "GTiff"
-    driver = gdal.GetDriverByName(format)
-    dst_datatype = gdal.GDT_Byte
-    dst_ds = driver.Create(filename, y, x, 1, dst_datatype)
-    geotransform = [item for item in geotransform]
-    dst_ds.SetGeoTransform(geotransform)
-    dst_ds.GetRasterBand(1).WriteArray(data)
-    if nodata is not None:
-        dst_ds.GetRasterBand(1).SetNoDataValue(nodata)
-    dst_ds.SetProjection(geoproj)
-
+    write_geotiff(filename, geotransform, geoproj, data, gdal.GDT_Byte, nodata=nodata)
     return 1
 
 
 def write_gdal_file_rgb(filename, geotransform, geoproj, b1, b2, b3, metadata=None):
-    options = []
-    (x, y) = b1.shape
-    format = "GTiff"
-    driver = gdal.GetDriverByName(format)
-    dst_datatype = gdal.GDT_Byte
-    dst_ds = driver.Create(filename, y, x, 3, dst_datatype, options)
-    dst_ds.SetGeoTransform(geotransform)
-    dst_ds.SetProjection(geoproj)
-    if metadata is not None:
-        dst_ds.SetMetadata(metadata)
-    dst_ds.GetRasterBand(1).WriteArray(b1)
-    dst_ds.GetRasterBand(2).WriteArray(b2)
-    dst_ds.GetRasterBand(3).WriteArray(b3)
-
+    write_geotiff(filename, geotransform, geoproj, [b1, b2, b3], gdal.GDT_Byte, metadata=metadata)
     return 1
 
 
 def write_gdal_file_rgba(filename, geotransform, geoproj, b1, b2, b3, b4):
-    options = []
-    (x, y) = b1.shape
-    format = "GTiff"
-    driver = gdal.GetDriverByName(format)
-    dst_datatype = gdal.GDT_Byte
-    dst_ds = driver.Create(filename, y, x, 4, dst_datatype, options)
-    dst_ds.SetGeoTransform(geotransform)
-    dst_ds.SetProjection(geoproj)
-    dst_ds.GetRasterBand(1).WriteArray(b1)
-    dst_ds.GetRasterBand(2).WriteArray(b2)
-    dst_ds.GetRasterBand(3).WriteArray(b3)
-    dst_ds.GetRasterBand(4).WriteArray(b4)
-
+    write_geotiff(filename, geotransform, geoproj, [b1, b2, b3, b4], gdal.GDT_Byte)
     return 1
 
 
-def boxcar_y(image, bsize):
-    (y, x) = image.shape
-    # outimage = np.zeros([y,x],dtype=float32)
-    outimage = image
-    w = np.ones(bsize)
-    # edge = int((bsize - 1) / 2)
-    for i in range(0, y):
-        gdal.TermProgress_nocb(float(i) / float(y))
-        outimage[i, :] = np.convolve(w / w.sum(), image[i, :], mode='same')
-    print('100')
-    return outimage
-
-
-def boxcar_x(image, bsize):
-    (y, x) = image.shape
-    # outimage = np.zeros([y,x],dtype=float32)
-    outimage = image
-    w = np.ones(bsize)
-    # edge = int((bsize - 1) / 2)
-    for j in range(0, x):
-        gdal.TermProgress_nocb(float(j) / float(x))
-        outimage[:, j] = np.convolve(w / w.sum(), image[:, j], mode='same')
-    print('100')
-    return outimage
+def _boxcar_rows(image: np.ndarray, out: np.ndarray, ysize: int, xsize: int, start: int, stop: int):
+    lo = max(start - ysize // 2, 0)
+    hi = min(stop + (ysize - 1) // 2, image.shape[0])
+    chunk = image[lo:hi].astype(np.float32)
+    if ysize > 1:
+        uniform_filter1d(chunk, ysize, axis=0, output=chunk, mode='constant')
+    if xsize > 1:
+        uniform_filter1d(chunk, xsize, axis=1, output=chunk, mode='constant')
+    out[start:stop] = chunk[start - lo:stop - lo]
+
+
+def boxcar(image: np.ndarray, ysize: int, xsize: int, workers: int = 1, chunk_rows: int = 1024) -> np.ndarray:
+    """Separable boxcar (moving average) filter of a 2-D image, in float32
+
+    Pixels beyond the edges of the image count as zeros. The image is filtered in chunks of rows, each read with the
+    halo of neighboring rows its filter window needs, so chunks can be filtered in parallel by a pool of threads with
+    results identical to filtering the whole image at once.
+
+    Args:
+        image: The image to filter; it is not modified
+        ysize: Height of the boxcar, in rows; 1 to not filter along columns
+        xsize: Width of the boxcar, in columns; 1 to not filter along rows
+        workers: Number of threads to filter chunks with
+        chunk_rows: Number of rows in each chunk, excluding its halo
+
+    Returns:
+        filtered: The filtered image
+    """
+    rows = image.shape[0]
+    out = np.empty(image.shape, dtype=np.float32)
+    if workers <= 1:
+        chunk_rows = rows
+    bounds = [(start, min(start + chunk_rows, rows)) for start in range(0, rows, max(chunk_rows, 1))]
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        futures = [executor.submit(_boxcar_rows, image, out, ysize, xsize, start, stop) for start, stop in bounds]
+        for future in futures:
+            future.result()
+    return out
+
+
+def boxcar_y(image, bsize, workers=1):
+    # smooths each row, i.e. along x
+    return boxcar(image, 1, bsize, workers=workers)
+
+
+def boxcar_x(image, bsize, workers=1):
+    # smooths each column, i.e. along y
+    return boxcar(image, bsize, 1, workers=workers)
 
 
 def lee(image):
@@ -301,3 +626,135 @@ def calcTranslation(master, slave):
     snr = shiftsnr
 
     return xloc, yloc, snr, shiftmax
+
+
+class Offsets(NamedTuple):
+    """Offsets of reference chips relative to secondary chips, as estimated by phase correlation
+
+    `row` and `col` are the integer offsets, `row_subpixel` and `col_subpixel` the offsets refined from the correlation
+    next to the peak, `snr` the ratio of the peak to the mean correlation magnitude, and `peak` the height of
+    the correlation peak; each is an array with one entry per chip.
+    """
+    row: np.ndarray
+    col: np.ndarray
+    row_subpixel: np.ndarray
+    col_subpixel: np.ndarray
+    snr: np.ndarray
+    peak: np.ndarray
+
+
+def _subpixel_peak(before: np.ndarray, peak: np.ndarray, after: np.ndarray) -> np.ndarray:
+    # Foroosh et al. (2002): the fraction of the correlation in the larger neighbor of the peak
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(after > before, after / (after + peak), -before / (before + peak))
+    return np.clip(np.nan_to_num(delta), -0.5, 0.5)
+
+
+@lru_cache(maxsize=16)
+def _hann_taper(rows: int, cols: int) -> np.ndarray:
+    taper = np.outer(np.hanning(rows), np.hanning(cols)).astype(np.float32)
+    taper.flags.writeable = False
+    return taper
+
+
+def _phase_correlate_batch(references: np.ndarray, secondaries: np.ndarray, apodize: bool) -> Offsets:
+    n, rows, cols = references.shape
+    references = references.astype(np.float32)
+    secondaries = secondaries.astype(np.float32)
+    references -= references.mean(axis=(1, 2), keepdims=True)
+    secondaries -= secondaries.mean(axis=(1, 2), keepdims=True)
+    if apodize:
+        taper = _hann_taper(rows, cols)
+        references *= taper
+        secondaries *= taper
+
+    cross = scipy.fft.rfft2(references) * np.conjugate(scipy.fft.rfft2(secondaries))
+    magnitude = np.abs(cross)
+    # bins with (next to) no energy carry no phase information and are dropped; the DC bin left after mean removal
+    # is one of them, but its phase is zero for any shift, so it is set to unit magnitude to keep the correlation
+    # surface free of a constant offset that would bias the sub-pixel peak
+    empty = magnitude <= np.finfo(np.float32).eps * magnitude.max(axis=(1, 2), keepdims=True)
+    cross = np.where(empty, 0, cross / np.where(empty, 1, magnitude))
+    cross[:, 0, 0] = 1
+    correlation = scipy.fft.irfft2(cross, s=(rows, cols))
+
+    flat = correlation.reshape(n, -1)
+    peak_index = np.argmax(flat, axis=1)
+    peak = flat[np.arange(n), peak_index]
+    snr = peak / np.abs(flat).mean(axis=1)
+
+    row, col = np.unravel_index(peak_index, (rows, cols))
+    chip = np.arange(n)
+    row_delta = _subpixel_peak(correlation[chip, (row - 1) % rows, col], peak, correlation[chip, (row + 1) % rows, col])
+    col_delta = _subpixel_peak(correlation[chip, row, (col - 1) % cols], peak, correlation[chip, row, (col + 1) % cols])
+
+    # wrap the peak location into signed offsets
+    row = np.where(row > rows // 2, row - rows, row)
+    col = np.where(col > cols // 2, col - cols, col)
+    return Offsets(row, col, row + row_delta, col + col_delta, snr, peak)
+
+
+def estimate_offsets(references: np.ndarray, secondaries: np.ndarray, apodize: bool = True, batch_size: int = 256,
+                     workers: int = 1, use_processes: bool = False) -> Offsets:
+    """Estimate the offsets between stacks of image chips by phase correlation
+
+    A batched, vectorized counterpart to `calcTranslation` using real FFTs, with optional Hann apodization, signed
+    offsets, and sub-pixel refinement. If `reference = np.roll(secondary, (dy, dx), axis=(0, 1))`, the offset of the
+    pair is `(dy, dx)`.
+
+    The Hann taper is built once per chip shape and shared by every batch and call. FFT plans are deliberately left to
+    `scipy.fft`, which caches the plans of recently used transform shapes itself, so batches of a fixed chip size
+    reuse the same plans without any plan handling here.
+
+    Args:
+        references: Stack of reference chips, of shape (chips, rows, columns)
+        secondaries: Stack of secondary chips, the same shape as `references`
+        apodize: Whether to taper the chips with a Hann window before correlating them
+        batch_size: Number of chip pairs to correlate at once
+        workers: Number of threads, or processes, to correlate batches with
+        use_processes: Whether to correlate batches in a pool of processes rather than threads
+
+    Returns:
+        offsets: The offsets of each chip pair
+    """
+    if references.shape != secondaries.shape or references.ndim != 3:
+        raise ValueError(f'Chip stacks must be 3-D and the same shape, not {references.shape} and {secondaries.shape}')
+
+    batches = range(0, references.shape[0], batch_size)
+    if workers <= 1:
+        results = [_phase_correlate_batch(references[ii:ii + batch_size], secondaries[ii:ii + batch_size], apodize)
+                   for ii in batches]
+    else:
+        pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with pool(max_workers=workers) as executor:
+            results = list(executor.map(_phase_correlate_batch,
+                                        (references[ii:ii + batch_size] for ii in batches),
+                                        (secondaries[ii:ii + batch_size] for ii in batches),
+                                        (apodize for _ in batches)))
+
+    if not results:
+        return Offsets(*(np.empty(0) for _ in Offsets._fields))
+    return Offsets(*(np.concatenate(field) for field in zip(*results)))
+
+
+def offset_grid(reference: np.ndarray, secondary: np.ndarray, chip_size: int = 64, step: int = 32,
+                **kwargs) -> Offsets:
+    """Estimate a dense grid of offsets between two images from chips on a regular grid
+
+    Args:
+        reference: The reference image
+        secondary: The secondary image, the same shape as `reference`
+        chip_size: Width and height of each chip
+        step: Spacing between the upper left corners of neighboring chips
+        kwargs: Other keyword arguments for `estimate_offsets`
+
+    Returns:
+        offsets: The offsets of each chip, as arrays of shape (chip rows, chip columns)
+    """
+    reference_chips = sliding_window_view(reference, (chip_size, chip_size))[::step, ::step]
+    secondary_chips = sliding_window_view(secondary, (chip_size, chip_size))[::step, ::step]
+    grid_shape = reference_chips.shape[:2]
+
+    offsets = estimate_offsets(reference_chips.reshape(-1, chip_size, chip_size),
+                               secondary_chips.reshape(-1, chip_size, chip_size), **kwargs)
+    return Offsets(*(field.reshape(grid_shape) for field in offsets))
@@ -0,0 +1,223 @@
+"""A shared, size-capped on-disk cache for DEM tiles"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import requests
+
+from hyp3lib.fetch import download_file
+
+DEFAULT_CACHE_SIZE = 20 * 1024 ** 3
+DEFAULT_MIN_AGE = 3600
+CACHE_DIR_ENV = 'HYP3_DEM_CACHE_DIR'
+CACHE_SIZE_ENV = 'HYP3_DEM_CACHE_SIZE'
+
+_CHECKSUM_SUFFIX = '.sha256'
+_PARTIAL_PREFIX = '.part-'
+
+
+def _sha256(file_name: Union[Path, str], block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TileCache:
+    """An LRU cache of DEM tiles shared between processes
+
+    Tiles are stored as `<directory>/<dem_name>/<tile>.tif` alongside a `.sha256` sidecar recording the size and
+    checksum of the tile when it was written. A tile without a sidecar, or whose size (or, with `verify`, contents)
+    no longer matches it, is treated as a miss and fetched again. Tiles are written to a temporary file and
+    atomically renamed into place, so concurrent readers never see a partially written tile. Every cache hit
+    refreshes the tile's modification time, and the least recently used tiles are evicted once the cache grows beyond
+    `max_size` bytes. Tiles used within the last `min_age` seconds are never evicted, so tiles another process is
+    still reading are kept; the cache may stay above `max_size` until they age.
+    """
+
+    def __init__(self, directory: Union[Path, str], max_size: int = DEFAULT_CACHE_SIZE, verify: bool = False,
+                 min_age: float = DEFAULT_MIN_AGE):
+        """
+        Args:
+            directory: Root directory of the cache; created if it does not exist
+            max_size: Size, in bytes, above which least recently used tiles are evicted
+            verify: Whether to checksum a cached tile's contents before each use, instead of only checking its size
+            min_age: Time, in seconds, since a tile was last used before it may be evicted
+        """
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.verify = verify
+        self.min_age = min_age
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls) -> Optional['TileCache']:
+        """Create a cache configured by the `HYP3_DEM_CACHE_DIR` and `HYP3_DEM_CACHE_SIZE` environment variables
+
+        Returns:
+            cache: The configured cache, or None if `HYP3_DEM_CACHE_DIR` is not set
+        """
+        directory = os.getenv(CACHE_DIR_ENV)
+        if not directory:
+            return None
+        max_size = int(os.getenv(CACHE_SIZE_ENV, DEFAULT_CACHE_SIZE))
+        return cls(directory, max_size=max_size)
+
+    def __getstate__(self):
+        # counters are tracked by the process doing lookups, not by pool workers filling misses
+        state = self.__dict__.copy()
+        state.update(hits=0, misses=0, bytes_saved=0)
+        return state
+
+    def tile_dir(self, dem_name: str) -> Path:
+        return self.directory / dem_name
+
+    def path_for(self, dem_name: str, tile_name: str) -> Path:
+        return self.tile_dir(dem_name) / f'{tile_name}.tif'
+
+    def get(self, dem_name: str, tile_name: str) -> Optional[str]:
+        """Look up a tile in the cache
+
+        Args:
+            dem_name: Name of the DEM the tile belongs to
+            tile_name: Name of the tile, without extension
+
+        Returns:
+            tile_path: Location of the cached tile, or None on a miss
+        """
+        tile_path = self.path_for(dem_name, tile_name)
+        size = self._verified_size(tile_path)
+        if size is None:
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(tile_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.bytes_saved += size
+        return str(tile_path)
+
+    def put(self, dem_name: str, tile_name: str, source: str, session: Optional[requests.Session] = None,
+            evict: bool = True) -> str:
+        """Copy or download a tile into the cache
+
+        Args:
+            dem_name: Name of the DEM the tile belongs to
+            tile_name: Name of the tile, without extension
+            source: Local path or URL of the tile
+            session: A session to download the tile with, see `hyp3lib.fetch.get_session`
+            evict: Whether to evict least recently used tiles afterwards, keeping this one; when fetching several
+                tiles for one request, pass False and call `evict` once with all of them to keep
+
+        Returns:
+            tile_path: Location of the cached tile
+        """
+        tile_path = self.path_for(dem_name, tile_name)
+        tile_path.parent.mkdir(parents=True, exist_ok=True)
+
+        staging_dir = tempfile.mkdtemp(prefix=_PARTIAL_PREFIX, dir=tile_path.parent)
+        try:
+            if source.startswith('http'):
+                staged = download_file(source, directory=staging_dir, session=session)
+            else:
+                staged = shutil.copy(source, staging_dir)
+
+            checksum = f'{os.path.getsize(staged)} {_sha256(staged)}\n'
+            os.replace(staged, tile_path)
+            checksum_file = Path(staging_dir) / 'checksum'
+            checksum_file.write_text(checksum)
+            os.replace(checksum_file, f'{tile_path}{_CHECKSUM_SUFFIX}')
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        if evict:
+            self.evict(keep=[tile_path])
+        return str(tile_path)
+
+    def fetch(self, dem_name: str, tile_name: str, source: str, session: Optional[requests.Session] = None) -> str:
+        """Return a cached tile, copying or downloading it into the cache on a miss"""
+        tile_path = self.get(dem_name, tile_name)
+        if tile_path is None:
+            tile_path = self.put(dem_name, tile_name, source, session=session)
+        return tile_path
+
+    def size(self) -> int:
+        return sum(tile.stat().st_size for tile in self._tiles())
+
+    def evict(self, keep: Iterable[Union[Path, str]] = ()):
+        """Remove least recently used tiles until the cache is no larger than `max_size`
+
+        Args:
+            keep: Paths of tiles not to evict, e.g. those of an in-flight request; tiles used within the last
+                `min_age` seconds are kept as well
+        """
+        keep = {Path(tile).resolve() for tile in keep}
+        newest = time.time() - self.min_age
+        with self._lock():
+            tiles = []
+            for tile in self._tiles():
+                try:
+                    stat = tile.stat()
+                except FileNotFoundError:
+                    continue
+                tiles.append((stat.st_mtime, stat.st_size, tile))
+
+            total = sum(size for _, size, _ in tiles)
+            for mtime, size, tile in sorted(tiles):
+                if total <= self.max_size or mtime > newest:
+                    break
+                if tile.resolve() in keep:
+                    continue
+                logging.info(f'Evicting {tile} from DEM tile cache')
+                for file_name in (f'{tile}{_CHECKSUM_SUFFIX}', tile):
+                    try:
+                        os.remove(file_name)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'bytes_saved': self.bytes_saved}
+
+    def _tiles(self):
+        return self.directory.glob('*/*.tif')
+
+    def _verified_size(self, tile_path: Path) -> Optional[int]:
+        try:
+            size, checksum = Path(f'{tile_path}{_CHECKSUM_SUFFIX}').read_text().split()
+            size = int(size)
+            if tile_path.stat().st_size != size:
+                raise ValueError(f'size mismatch for {tile_path}')
+            if self.verify and _sha256(tile_path) != checksum:
+                raise ValueError(f'checksum mismatch for {tile_path}')
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            logging.warning(f'Discarding invalid cached DEM tile: {e}')
+            return None
+        return size
+
+    @contextmanager
+    def _lock(self):
+        with open(self.directory / '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
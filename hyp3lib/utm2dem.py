@@ -6,6 +6,7 @@ import os
 import numpy as np
 from osgeo import gdal, osr, gdalconst
 
+from hyp3lib import gdal_config
 import hyp3lib.saa_func_lib as saa
 from hyp3lib.execute import execute
 
@@ -103,7 +104,7 @@ def utm2dem(inDem,outDem,demPar,dataType="float"):
         saa.write_gdal_file_float(tmptif,trans,proj,data.astype(np.float32))
     elif "int16" in dataType:
         saa.write_gdal_file(tmptif,trans,proj,data)
-    gdal.Translate(outDem,tmptif,format="ENVI")
+    gdal_config.translate(outDem,tmptif,format="ENVI")
     os.remove(tmptif)
     os.remove(outDem + ".aux.xml")
     filename, file_extension = os.path.splitext(outDem)
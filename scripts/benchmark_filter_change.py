@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Benchmark asf_time_series.filter_change against its original per-pixel implementation"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from hyp3lib.asf_time_series import filter_change
+
+
+def filter_change_loops(image, kernelSize, iterations):
+    """The original, per-pixel filter_change, with its `noChange` bug fixed so results are comparable"""
+    (rows, cols) = image.shape
+    positiveChange = np.zeros((rows, cols), dtype=np.uint8)
+    negativeChange = np.zeros((rows, cols), dtype=np.uint8)
+    valid = np.zeros((rows, cols), dtype=np.uint8)
+    for ii in range(rows):
+        for kk in range(cols):
+            if image[ii, kk] == 1:
+                negativeChange[ii, kk] = 1
+                valid[ii, kk] = 1
+            elif image[ii, kk] == 2:
+                valid[ii, kk] = 1
+            elif image[ii, kk] == 3:
+                positiveChange[ii, kk] = 1
+                valid[ii, kk] = 1
+    positiveChange = ndimage.binary_opening(positiveChange, iterations=iterations,
+                                            structure=np.ones(kernelSize)).astype(np.uint8)
+    negativeChange = ndimage.binary_opening(negativeChange, iterations=iterations,
+                                            structure=np.ones(kernelSize)).astype(np.uint8)
+    change = np.full((rows, cols), 2, dtype=np.uint8)
+    for ii in range(rows):
+        for kk in range(cols):
+            if negativeChange[ii, kk] == 1:
+                change[ii, kk] = 1
+            elif positiveChange[ii, kk] == 1:
+                change[ii, kk] = 3
+    change *= valid
+    return change
+
+
+def change_map(size, seed=0):
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 4, (size // 10 + 1, size // 10 + 1), dtype=np.uint8)
+    image = np.kron(blocks, np.ones((10, 10), dtype=np.uint8))[:size, :size]
+    speckle = rng.random(image.shape) < 0.05
+    image[speckle] = rng.integers(0, 4, np.count_nonzero(speckle), dtype=np.uint8)
+    return image
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1000, help='Width and height of the change map')
+    parser.add_argument('--kernel', type=int, default=3, help='Width and height of the opening kernel')
+    parser.add_argument('--iterations', type=int, default=1, help='Iterations of the opening')
+    parser.add_argument('--workers', type=int, default=4, help='Threads for the windowed run')
+    args = parser.parse_args()
+
+    image = change_map(args.size)
+    kernel = (args.kernel, args.kernel)
+
+    expected, loop_time = timed(filter_change_loops, image, kernel, args.iterations)
+    vectorized, vectorized_time = timed(filter_change, image, kernel, args.iterations)
+    windowed, windowed_time = timed(filter_change, image, kernel, args.iterations, workers=args.workers,
+                                    chunkRows=max(args.size // (4 * args.workers), 1))
+
+    assert np.array_equal(vectorized, expected)
+    assert np.array_equal(windowed, expected)
+    print(f'{args.size}x{args.size} change map')
+    print(f'  per-pixel loops:            {loop_time:8.3f} s')
+    print(f'  vectorized:                 {vectorized_time:8.3f} s ({loop_time / vectorized_time:.0f}x)')
+    print(f'  windowed, {args.workers} threads:      {windowed_time:8.3f} s ({loop_time / windowed_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""Benchmark asf_geometry.union_geometries against the original one-at-a-time Union fold"""
+
+import argparse
+import time
+
+import numpy as np
+from osgeo import ogr
+
+from hyp3lib.asf_geometry import union_geometries
+
+
+def union_fold(geometries):
+    """The original union_geometries: fold each geometry into the result with one Union call at a time"""
+    combine = ogr.Geometry(ogr.wkbMultiPolygon)
+    for geometry in geometries:
+        combine = combine.Union(geometry)
+    return combine
+
+
+def footprints(count, seed=0):
+    """Overlapping, slightly rotated granule-like footprints along a few parallel tracks"""
+    rng = np.random.default_rng(seed)
+    tracks = max(count // 50, 1)
+    geometries = []
+    for ii in range(count):
+        track = ii % tracks
+        x0 = track * 2.0 + rng.normal(0, 0.05)
+        y0 = (ii // tracks) * 0.8 + rng.normal(0, 0.05)
+        angle = np.radians(rng.normal(10, 1))
+        corners = np.array([[0, 0], [2.5, 0], [2.5, 1.7], [0, 1.7]])
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        corners = corners @ rotation.T + [x0, y0]
+        ring = ogr.Geometry(ogr.wkbLinearRing)
+        for x, y in np.vstack([corners, corners[:1]]):
+            ring.AddPoint_2D(float(x), float(y))
+        polygon = ogr.Geometry(ogr.wkbPolygon)
+        polygon.AddGeometry(ring)
+        geometries.append(polygon)
+    return geometries
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 500, 2000],
+                        help='Numbers of footprints to union')
+    parser.add_argument('--processes', type=int, default=4, help='Processes for the parallel run')
+    args = parser.parse_args()
+
+    for count in args.counts:
+        geometries = footprints(count)
+        expected, fold_time = timed(union_fold, geometries)
+        cascaded, cascaded_time = timed(union_geometries, geometries)
+        parallel, parallel_time = timed(union_geometries, geometries, processes=args.processes,
+                                        chunkSize=max(count // args.processes, 1))
+
+        for result in (cascaded, parallel):
+            assert np.isclose(result.GetArea(), expected.GetArea())
+            assert result.SymDifference(expected).GetArea() < 1e-9 * expected.GetArea()
+        print(f'{count} footprints')
+        print(f'  one-at-a-time fold:         {fold_time:8.3f} s')
+        print(f'  cascaded:                   {cascaded_time:8.3f} s ({fold_time / cascaded_time:.0f}x)')
+        print(f'  cascaded, {args.processes} processes:    {parallel_time:8.3f} s ({fold_time / parallel_time:.0f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+from osgeo import gdal, ogr, osr
+from scipy import ndimage
+
+from hyp3lib import GeometryError, asf_geometry
+
+
+def _make_geotiff(filename, data, noData=0):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(32606)
+    ds = gdal.GetDriverByName('GTiff').Create(str(filename), data.shape[1], data.shape[0], 1, gdal.GDT_Float32)
+    ds.SetGeoTransform([400000, 30, 0, 7000000, 0, -30])
+    ds.SetProjection(srs.ExportToWkt())
+    ds.GetRasterBand(1).SetNoDataValue(noData)
+    ds.GetRasterBand(1).WriteArray(data)
+    ds = None
+    return str(filename)
+
+
+def test_edge_band_closing():
+    data = np.zeros((300, 400), dtype=np.float32)
+    data[20:280, 50:390] = 1
+    data[np.random.rand(*data.shape) < 0.02] = 0
+    data[150:155, :] = 0
+
+    expected = ndimage.binary_closing(data, iterations=10, structure=np.ones((3, 3)))
+    assert np.array_equal(asf_geometry.edge_band_closing(data, tileSize=64), expected)
+
+
+def test_cut_blackfill():
+    data = np.zeros((50, 60), dtype=np.float32)
+    data[10:20, 5:40] = 1
+    data[30:35, 20:25] = 1
+
+    cut, colFirst, rowFirst, geoTrans = asf_geometry.cut_blackfill(data, (1000, 30, 0, 5000, 0, -30))
+    assert (colFirst, rowFirst) == (5, 10)
+    assert cut.shape == (25, 35)
+    assert geoTrans == (1150, 30, 0, 4700, 0, -30)
+
+    with pytest.raises(GeometryError):
+        asf_geometry.cut_blackfill(np.zeros((5, 5)), (0, 1, 0, 0, 0, -1))
+
+
+def test_geotiff2boundary_mask_decimation(tmp_path):
+    data = np.zeros((400, 600), dtype=np.float32)
+    data[40:360, 100:580] = np.random.rand(320, 480) + 1
+    inFile = _make_geotiff(tmp_path / 'image.tif', data)
+
+    mask, colFirst, rowFirst, geoTrans, _ = asf_geometry.geotiff2boundary_mask(inFile, 32606, None)
+    assert mask.shape == (320, 480)
+    assert geoTrans == (403000, 30, 0, 6998800, 0, -30)
+
+    mask, colFirst, rowFirst, geoTrans, _ = asf_geometry.geotiff2boundary_mask(inFile, 32606, None, decimation=4)
+    assert mask.shape == (80, 120)
+    assert geoTrans == (403000, 120, 0, 6998800, 0, -120)
+
+
+def test_spatial_query(tmp_path):
+    tileFile = str(tmp_path / 'tiles.shp')
+    asf_geometry.generate_tile_shape(tileFile, -2, 3, 10, 15, 1)
+
+    fields = [{'name': 'granule', 'type': ogr.OFTString, 'width': 254}]
+    values = [
+        {'granule': 'inside', 'geometry': ogr.CreateGeometryFromWkt('POLYGON ((10.2 0.2, 11.5 0.2, 11.5 0.8, '
+                                                                    '10.2 0.8, 10.2 0.2))')},
+        {'granule': 'touching', 'geometry': ogr.CreateGeometryFromWkt('POLYGON ((15 -2, 16 -2, 16 -1, 15 -1, '
+                                                                      '15 -2))')},
+    ]
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    granuleFile = str(tmp_path / 'granules.shp')
+    asf_geometry.geometry2shape(fields, values, srs, False, granuleFile)
+
+    multipolygon, tiles = asf_geometry.spatial_query(granuleFile, tileFile, 'intersects')
+    assert tiles == ['N00E010', 'N00E011']
+    assert multipolygon.GetGeometryCount() == 2
+
+
+def test_envelope_candidates():
+    geometries = [ogr.CreateGeometryFromWkt(f'POINT ({x} {y})') for x in range(10) for y in range(10)]
+    index = asf_geometry.envelope_index(geometries)
+
+    query = ogr.CreateGeometryFromWkt('POLYGON ((2.5 2.5, 4 2.5, 4 3.5, 2.5 3.5, 2.5 2.5))')
+    assert asf_geometry.envelope_candidates(index, query) == [33, 43]
+
+
+def _square(x, y, size):
+    return ogr.CreateGeometryFromWkt(f'POLYGON (({x} {y}, {x + size} {y}, {x + size} {y + size}, {x} {y + size}, '
+                                     f'{x} {y}))')
+
+
+def test_union_geometries():
+    squares = [_square(x, y, 2) for x in range(0, 20, 1) for y in range(0, 10, 5)]
+    squares.append(ogr.CreateGeometryFromWkt('MULTIPOLYGON (((30 0, 31 0, 31 1, 30 1, 30 0)), '
+                                             '((40 0, 41 0, 41 1, 40 1, 40 0)))'))
+
+    combine = asf_geometry.union_geometries(squares)
+    assert np.isclose(combine.GetArea(), 2 * 21 * 2 + 2)
+    assert combine.GetGeometryCount() == 4
+
+    parallel = asf_geometry.union_geometries(squares, processes=2, chunkSize=7)
+    assert np.isclose(parallel.SymDifference(combine).GetArea(), 0)
+
+    assert asf_geometry.union_geometries([]).IsEmpty()
+
+
+def test_union_geometries_collections():
+    collection = ogr.CreateGeometryFromWkt('GEOMETRYCOLLECTION (POLYGON ((0 0, 2 0, 2 2, 0 2, 0 0)), '
+                                           'MULTIPOLYGON (((1 0, 3 0, 3 2, 1 2, 1 0))))')
+    multipolygon = ogr.CreateGeometryFromWkt('MULTIPOLYGON Z (((10 0 5, 11 0 5, 11 1 5, 10 1 5, 10 0 5)))')
+
+    combine = asf_geometry.union_geometries([collection, multipolygon, _square(2, 0, 2)])
+    assert np.isclose(combine.GetArea(), 2 * 4 + 1)
+    assert combine.GetGeometryCount() == 2
+
+    line = ogr.CreateGeometryFromWkt('LINESTRING (20 0, 21 0)')
+    combine = asf_geometry.union_geometries([collection, line])
+    assert np.isclose(combine.GetArea(), 2 * 3)
+    assert combine.GetGeometryCount() == 2
+
+
+def test_overlap_mask(tmp_path):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    fields = [{'name': 'name', 'type': ogr.OFTString, 'width': 10}]
+    values = [
+        {'name': 'land', 'geometry': _square(-147.5, 64.5, 0.2)},
+        {'name': 'lake', 'geometry': _square(-147.2, 64.6, 0.05)},
+        {'name': 'far', 'geometry': _square(10, 10, 1)},
+    ]
+    maskShape = str(tmp_path / 'mask.shp')
+    asf_geometry.geometry2shape(fields, values, srs, False, maskShape)
+
+    boundary = ogr.Geometry(ogr.wkbMultiPolygon)
+    boundary.AddGeometry(_square(-147.6, 64.4, 0.5))
+    meta = {'pixelSize': 30, 'epsg': 32606, 'boundary': boundary, 'rows': 10000, 'cols': 10000}
+
+    mask, maskGeoTrans = asf_geometry.overlapMask(meta, maskShape, False, None)
+    localFile = str(tmp_path / 'mask.gpkg')
+    local, localGeoTrans = asf_geometry.overlapMask(meta, maskShape, False, None, localFile=localFile)
+    assert (tmp_path / 'mask.gpkg').exists()
+    assert localGeoTrans == maskGeoTrans
+    assert np.array_equal(local, mask, equal_nan=True)
+
+    utm = osr.SpatialReference()
+    utm.ImportFromEPSG(32606)
+    for spatialRef in (srs, utm):
+        spatialRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    expected = asf_geometry.union_geometries([values[0]['geometry'], values[1]['geometry']]).Clone()
+    expected.Transform(osr.CoordinateTransformation(srs, utm))
+    assert np.isclose(np.count_nonzero(mask == 1) * 30 ** 2, expected.GetArea(), rtol=0.01)
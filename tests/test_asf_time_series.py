@@ -0,0 +1,263 @@
+from datetime import datetime, timedelta
+
+import netCDF4 as nc
+import numpy as np
+import pytest
+from osgeo import gdal, osr
+
+from hyp3lib import asf_time_series
+
+
+def test_filter_change():
+    image = np.full((12, 20), 2, dtype=np.uint8)
+    image[2:8, 2:8] = 1
+    image[4, 15] = 1
+    image[6:11, 12:19] = 3
+    image[0, 10] = 3
+    image[11, :5] = 0
+
+    expected = np.full(image.shape, 2, dtype=np.uint8)
+    expected[2:8, 2:8] = 1
+    expected[6:11, 12:19] = 3
+    expected[11, :5] = 0
+
+    change = asf_time_series.filter_change(image, (3, 3), 1)
+    assert np.array_equal(change, expected)
+    assert np.array_equal(asf_time_series.filter_change(image, (3, 3), 1, workers=3, chunkRows=4), change)
+
+
+def _meta(rows=50, cols=70, pixelSize=30.0):
+    return {
+        'institution': 'Alaska Satellite Facility',
+        'title': 'test time series',
+        'source': 'Sentinel-1',
+        'comment': 'test',
+        'reference': 'test',
+        'cols': cols,
+        'rows': rows,
+        'refTime': '2020-01-01 00:00:00',
+        'epsg': 32606,
+        'imgLongName': 'backscatter',
+        'imgUnits': 'amplitude',
+        'imgNoData': np.nan,
+        'minX': 400000.0,
+        'maxX': 400000.0 + cols * pixelSize,
+        'minY': 7000000.0 - rows * pixelSize,
+        'maxY': 7000000.0,
+        'pixelSize': pixelSize,
+    }
+
+
+def _images(count, rows=50, cols=70):
+    start = datetime(2020, 1, 1)
+    images = [np.random.rand(rows, cols).astype(np.float32) for _ in range(count)]
+    granules = [f'S1A_{ii:03d}' for ii in range(count)]
+    times = [start + timedelta(days=12 * ii) for ii in range(count)]
+    return images, granules, times
+
+
+def test_netcdf_stack_writer(tmp_path):
+    ncFile = str(tmp_path / 'stack.nc')
+    asf_time_series.initializeNetcdf(ncFile, _meta(), layout='pixel', timeChunk=4, complevel=6)
+    images, granules, times = _images(10)
+
+    with asf_time_series.NetcdfStackWriter(ncFile) as writer:
+        assert writer.bufferSize == 16
+        for image, granule, time in zip(images, granules, times):
+            writer.add(image, granule, time)
+    asf_time_series.addImage2netcdf(images[0], ncFile, 'S1A_extra', times[-1] + timedelta(days=12))
+
+    with nc.Dataset(ncFile) as dataset:
+        image = dataset.variables['image']
+        assert image.chunking() == [4, 32, 32]
+        assert image.filters()['complevel'] == 6
+        assert image.filters()['shuffle']
+        assert np.array_equal(image[:10], np.stack(images))
+        assert list(nc.chartostring(dataset.variables['granule'][:])) == granules + ['S1A_extra']
+        assert dataset.variables['time'][1] == 12 * 24 * 3600
+
+
+def test_netcdf_stack_writer_default_layout(tmp_path):
+    ncFile = str(tmp_path / 'stack.nc')
+    asf_time_series.initializeNetcdf(ncFile, _meta())
+    images, granules, times = _images(20)
+
+    with asf_time_series.NetcdfStackWriter(ncFile) as writer:
+        assert writer.bufferSize == 16
+        for image, granule, time in zip(images, granules, times):
+            writer.add(image, granule, time)
+        assert len(writer.images) == 4
+
+    with asf_time_series.NetcdfStackWriter(ncFile, bufferMemory=3 * 50 * 70 * 4) as writer:
+        assert writer.bufferSize == 3
+
+    with nc.Dataset(ncFile) as dataset:
+        assert dataset.variables['image'].chunking() == [1, 50, 70]
+        assert np.array_equal(dataset.variables['image'][:], np.stack(images))
+        assert list(nc.chartostring(dataset.variables['granule'][:])) == granules
+
+
+def _cube(tmp_path, count=6, **kwargs):
+    ncFile = str(tmp_path / 'cube.nc')
+    meta = _meta()
+    asf_time_series.initializeNetcdf(ncFile, meta, **kwargs)
+    images, granules, times = _images(count)
+    with asf_time_series.NetcdfStackWriter(ncFile) as writer:
+        for image, granule, time in zip(images, granules, times):
+            writer.add(image, granule, time)
+    return ncFile, meta, np.stack(images)
+
+
+def test_time_series_reader_points(tmp_path):
+    ncFile, meta, cube = _cube(tmp_path)
+    rows = np.random.randint(0, meta['rows'], 1000)
+    cols = np.random.randint(0, meta['cols'], 1000)
+
+    with asf_time_series.TimeSeriesReader(ncFile, stripRows=7) as reader:
+        x = meta['minX'] + cols * meta['pixelSize']
+        y = meta['maxY'] - rows * meta['pixelSize']
+        assert np.array_equal(reader.extract(x, y), cube[:, rows, cols])
+        assert np.array_equal(reader.extract(cols, rows, 'pixel'), cube[:, rows, cols])
+        assert reader.timestamps[1] == datetime(2020, 1, 13)
+
+        with pytest.raises(ValueError):
+            reader.extract([meta['minX'] - 1000], [meta['maxY']])
+
+
+def test_time_series_reader_posting(tmp_path):
+    ncFile = str(tmp_path / 'cube.nc')
+    meta = _meta(rows=400, cols=30, pixelSize=10.1)
+    asf_time_series.initializeNetcdf(ncFile, meta)
+    images, granules, times = _images(2, rows=400, cols=30)
+    with asf_time_series.NetcdfStackWriter(ncFile) as writer:
+        for image, granule, time in zip(images, granules, times):
+            writer.add(image, granule, time)
+
+    rows = np.arange(400)
+    with asf_time_series.TimeSeriesReader(ncFile) as reader:
+        assert np.isclose(reader.posting[1], -10.1, rtol=1e-4)
+        assert np.array_equal(reader.indices(np.zeros(400), meta['maxY'] - rows * 10.1)[0], rows)
+
+
+def test_time_series_reader_polygons(tmp_path):
+    ncFile, meta, cube = _cube(tmp_path)
+    x0, y0, size = meta['minX'], meta['maxY'], meta['pixelSize']
+    square = f'POLYGON (({x0} {y0}, {x0 + 4 * size} {y0}, {x0 + 4 * size} {y0 - 2 * size}, {x0} {y0 - 2 * size}, ' \
+             f'{x0} {y0}))'
+
+    with asf_time_series.TimeSeriesReader(ncFile) as reader:
+        (values,) = reader.extract_polygons([square])
+    assert values.shape == (6, 8)
+    assert np.array_equal(values, cube[:, :2, :4].reshape(6, -1))
+
+
+def test_zonal_reductions():
+    values = np.array([[1.0, 2.0, 3.0, np.nan, 5.0],
+                       [np.nan, 4.0, 6.0, 8.0, 1.0]])
+    labels = np.array([1, 1, 1, 3, 3])
+
+    statistics = asf_time_series.zonal_reductions(values, labels, 3)
+    assert statistics['count'].tolist() == [[3, 2], [0, 0], [1, 2]]
+    assert np.array_equal(statistics['mean'], [[2.0, 5.0], [np.nan, np.nan], [5.0, 4.5]], equal_nan=True)
+    assert np.array_equal(statistics['median'], [[2.0, 5.0], [np.nan, np.nan], [5.0, 4.5]], equal_nan=True)
+
+    unzoned = asf_time_series.zonal_reductions(np.hstack([values, [[0.0, -7.0], [9.0, 0.0]]]),
+                                               np.append(labels, [0, 0]), 3)
+    for key, value in statistics.items():
+        assert np.array_equal(unzoned[key], value, equal_nan=True)
+
+    with pytest.raises(ValueError):
+        asf_time_series.zonal_reductions(values, labels, 2)
+
+
+def test_zonal_statistics(tmp_path):
+    ncFile, meta, cube = _cube(tmp_path)
+    x0, y0, size = meta['minX'], meta['maxY'], meta['pixelSize']
+    squares = [f'POLYGON (({x0 + c0 * size} {y0 - r0 * size}, {x0 + c1 * size} {y0 - r0 * size}, '
+               f'{x0 + c1 * size} {y0 - r1 * size}, {x0 + c0 * size} {y0 - r1 * size}, '
+               f'{x0 + c0 * size} {y0 - r0 * size}))'
+               for (r0, r1, c0, c1) in [(0, 2, 0, 4), (10, 15, 20, 23)]]
+
+    csvFile = str(tmp_path / 'zones.csv')
+    table = asf_time_series.zonal_statistics(ncFile, squares, csvFile=csvFile)
+    assert len(table) == 2 * 6
+    row = table[(1, datetime(2020, 1, 13))]
+    assert row['count'] == 15
+    assert np.isclose(row['mean'], cube[1, 10:15, 20:23].mean())
+    assert np.isclose(row['median'], np.median(cube[1, 10:15, 20:23]))
+    with open(csvFile) as f:
+        assert len(f.readlines()) == 1 + 2 * 6
+
+
+def test_gap_fill_weights():
+    timeRef = datetime(2020, 1, 1)
+    timestamps = [timeRef + timedelta(days=days, hours=6) for days in (0, 12, 48, 60)]
+    values = np.array([1.0, 2.0, 5.0, 6.0])
+
+    refDates, refType, lower, upper, weight = asf_time_series.gap_fill_weights(timestamps, timeRef)
+    assert refType == ['acquired', 'acquired', 'interpolated', 'interpolated', 'acquired', 'acquired']
+    filled = asf_time_series.fill_gaps(values, lower, upper, weight)
+    assert filled[[0, 1, 4, 5]].tolist() == [1.0, 2.0, 5.0, 6.0]
+    assert np.allclose(filled[2:4], np.interp([24 * 86400, 36 * 86400], [12.25 * 86400, 48.25 * 86400], [2, 5]))
+
+
+def test_smooth_time_series(tmp_path):
+    ncFile, meta, cube = _cube(tmp_path, count=8)
+    outFile = str(tmp_path / 'smooth.nc')
+
+    refDates, refType = asf_time_series.smooth_time_series(ncFile, outFile, frac=0.5, chunkRows=16, processes=2)
+    assert len(refDates) == 8
+    assert set(refType) == {'acquired'}
+
+    smoothing = asf_time_series.lowess_weights(8, frac=0.5)
+    with nc.Dataset(outFile) as dataset:
+        assert np.array_equal(dataset.variables['xgrid'][:], np.arange(meta['cols']) * meta['pixelSize'] + meta['minX'])
+        assert np.allclose(dataset.variables['image'][:], np.tensordot(smoothing, cube, axes=(1, 0)), atol=1e-5)
+
+
+def test_netcdf2boundary_mask(tmp_path):
+    ncFile = str(tmp_path / 'cube.nc')
+    meta = _meta()
+    asf_time_series.initializeNetcdf(ncFile, meta, validityMask=True)
+    first = np.zeros((meta['rows'], meta['cols']), dtype=np.float32)
+    first[10:20, 5:45] = 1
+    second = np.zeros_like(first)
+    second[10:40, 5:45] = 1
+    with asf_time_series.NetcdfStackWriter(ncFile) as writer:
+        writer.add(first, 'S1A_000', datetime(2020, 1, 1))
+        writer.add(second, 'S1A_001', datetime(2020, 1, 13))
+
+    size = meta['pixelSize']
+    boundary, _ = asf_time_series.netcdf2boundary_mask(ncFile, False)
+    assert np.isclose(boundary.GetArea(), 10 * 40 * size ** 2)
+
+    asf_time_series.add_validity_mask(ncFile, chunkRows=7)
+    boundary, _ = asf_time_series.netcdf2boundary_mask(ncFile, False, useValidity=True)
+    assert np.isclose(boundary.GetArea(), 30 * 40 * size ** 2)
+
+
+def test_geotiffs2netcdf(tmp_path):
+    meta = _meta()
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(meta['epsg'])
+    images, granules, times = _images(5, rows=60, cols=90)
+    inFiles = []
+    for image, granule in zip(images, granules):
+        inFile = str(tmp_path / f'{granule}.tif')
+        ds = gdal.GetDriverByName('GTiff').Create(inFile, 90, 60, 1, gdal.GDT_Float32)
+        ds.SetGeoTransform([meta['minX'] - 300, 30, 0, meta['maxY'] + 150, 0, -30])
+        ds.SetProjection(srs.ExportToWkt())
+        ds.GetRasterBand(1).WriteArray(image)
+        ds = None
+        inFiles.append(inFile)
+
+    ncFile = str(tmp_path / 'cube.nc')
+    order = [3, 0, 4, 1, 2]
+    added = asf_time_series.geotiffs2netcdf([inFiles[ii] for ii in order], [times[ii] for ii in order], ncFile, meta,
+                                            processes=2, resampling='near', validityMask=True)
+    assert added == granules
+
+    with nc.Dataset(ncFile) as dataset:
+        assert np.array_equal(dataset.variables['image'][:], np.stack(images)[:, 5:55, 10:80])
+        assert list(nc.chartostring(dataset.variables['granule'][:])) == granules
+        assert dataset.variables['validity'][:].all()
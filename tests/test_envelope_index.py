@@ -0,0 +1,23 @@
+from hyp3lib.envelope_index import EnvelopeIndex
+
+
+def test_candidates():
+    envelopes = [(x, x + 1, y, y + 1) for x in range(10) for y in range(10)]
+    index = EnvelopeIndex(envelopes)
+    assert index.cell_size == 1.0
+    assert len(index) == 100
+
+    assert index.candidates((2.5, 2.7, 3.2, 3.4)) == [23]
+    assert index.candidates((2.5, 3.5, 3.2, 3.4)) == [23, 33]
+    assert index.candidates((20, 21, 20, 21)) == []
+
+    everything = index.candidates((-100, 100, -100, 100))
+    assert everything == list(range(100))
+
+
+def test_points_and_empty():
+    index = EnvelopeIndex([(x, x, y, y) for x in range(10) for y in range(10)])
+    assert index.cell_size == 1.0
+    assert index.candidates((2.5, 4, 2.5, 3.5)) == [33, 43]
+
+    assert EnvelopeIndex([]).candidates((0, 1, 0, 1)) == []
@@ -65,3 +65,23 @@ def test_download_file_in_chunks(safe_data, tmp_path):
 def test_download_file_none():
     with pytest.raises(requests.exceptions.InvalidURL):
         _ = fetch.download_file(url=None)
+
+
+@responses.activate
+def test_download_file_with_session(safe_data, tmp_path):
+    with open(os.path.join(safe_data, 'granule_name.txt')) as f:
+        text = f.read()
+
+    responses.add(
+        responses.GET, 'http://hyp3.asf.alaska.edu/foobar.txt', body=text,
+        status=200,
+    )
+
+    with fetch.get_session() as session:
+        download_path = fetch.download_file('http://hyp3.asf.alaska.edu/foobar.txt', directory=tmp_path,
+                                            session=session)
+        assert session.adapters['http://'] is session.adapters['https://']
+
+    assert download_path == os.path.join(tmp_path, 'foobar.txt')
+    with open(download_path) as f:
+        assert f.read() == text
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+from osgeo import gdal
+
+from hyp3lib import gdal_config
+from hyp3lib.gdal_config import GdalProfile
+
+
+def test_from_environment(monkeypatch):
+    for name in ('HYP3_GDAL_NUM_THREADS', 'HYP3_GDAL_CACHEMAX', 'HYP3_GDAL_WARP_MEMORY', 'HYP3_GDAL_VSI_CACHE_SIZE',
+                 'HYP3_GDAL_HTTP_CACHE_SIZE', 'HYP3_GDAL_CREATION_OPTIONS'):
+        monkeypatch.delenv(name, raising=False)
+    profile = GdalProfile.from_environment()
+    assert profile.config_options() == {}
+    assert profile.warp_kwargs('out.tif', {}) == {}
+
+    monkeypatch.setenv('HYP3_GDAL_NUM_THREADS', 'ALL_CPUS')
+    monkeypatch.setenv('HYP3_GDAL_CACHEMAX', '512')
+    monkeypatch.setenv('HYP3_GDAL_VSI_CACHE_SIZE', '64')
+    monkeypatch.setenv('HYP3_GDAL_CREATION_OPTIONS', 'TILED=YES,COMPRESS=DEFLATE')
+    profile = GdalProfile.from_environment()
+    assert profile.num_threads == 'ALL_CPUS'
+    assert profile.cache_max == 512
+    assert profile.creation_options == ['TILED=YES', 'COMPRESS=DEFLATE']
+    assert profile.config_options() == {
+        'GDAL_NUM_THREADS': 'ALL_CPUS',
+        'GDAL_CACHEMAX': '512',
+        'VSI_CACHE': 'TRUE',
+        'VSI_CACHE_SIZE': str(64 * 1024 ** 2),
+    }
+
+
+def test_warp_kwargs():
+    profile = GdalProfile(num_threads=4, warp_memory=256, creation_options=['COMPRESS=DEFLATE'])
+
+    assert profile.warp_kwargs('out.tif', {'xRes': 30}) == {
+        'xRes': 30,
+        'creationOptions': ['COMPRESS=DEFLATE'],
+        'warpOptions': ['NUM_THREADS=4'],
+        'multithread': True,
+        'warpMemoryLimit': 256 * 1024 ** 2,
+    }
+
+    explicit = {
+        'creationOptions': ['COMPRESS=LZW'],
+        'warpOptions': ['NUM_THREADS=1'],
+        'multithread': False,
+        'warpMemoryLimit': 1024,
+    }
+    assert profile.warp_kwargs('out.tif', explicit) == explicit
+
+
+def test_translate_kwargs():
+    profile = GdalProfile(creation_options=['TILED=YES'])
+
+    assert profile.translate_kwargs('out.tif', {}) == {'creationOptions': ['TILED=YES']}
+    assert profile.translate_kwargs('', {'format': 'GTiff'}) == {'format': 'GTiff', 'creationOptions': ['TILED=YES']}
+    assert profile.translate_kwargs('out.png', {}) == {}
+    assert profile.translate_kwargs('', {'format': 'VRT'}) == {'format': 'VRT'}
+
+
+def test_use_profile():
+    previous = gdal_config.get_profile()
+
+    with gdal_config.use_profile(num_threads=2) as profile:
+        assert gdal_config.get_profile() is profile
+        assert profile.num_threads == 2
+
+    assert gdal_config.get_profile() is previous
+
+
+def test_config_options_are_thread_local():
+    barrier = Barrier(2)
+
+    def read_option(value):
+        with gdal_config.config_options({'HYP3_TEST_OPTION': value}):
+            barrier.wait()
+            seen = gdal.GetConfigOption('HYP3_TEST_OPTION')
+            barrier.wait()
+        return seen
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(read_option, ['a', 'b'])) == ['a', 'b']
+    assert gdal.GetConfigOption('HYP3_TEST_OPTION') is None
+
+
+def test_config_options_only_grow_the_cache():
+    cache_max = gdal.GetCacheMax()
+    with gdal_config.config_options({'GDAL_CACHEMAX': '1'}):
+        assert gdal.GetCacheMax() == cache_max
+
+    size = cache_max // 1024 ** 2 + 1
+    with gdal_config.config_options({'GDAL_CACHEMAX': str(size)}):
+        assert gdal.GetCacheMax() == size * 1024 ** 2
+    assert gdal.GetCacheMax() == size * 1024 ** 2
+    gdal.SetCacheMax(cache_max)
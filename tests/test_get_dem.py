@@ -1,10 +1,70 @@
 from filecmp import cmp
 from os import chdir
 
+import numpy as np
 import pytest
+from osgeo import gdal, ogr, osr
 
-from hyp3lib import DemError
-from hyp3lib.get_dem import get_dem, get_best_dem
+from hyp3lib import DemError, asf_geometry
+from hyp3lib import get_dem as get_dem_module
+from hyp3lib.get_dem import (CoverageIndex, coverage_signature, get_best_dem, get_coverage_index, get_dem, get_dems,
+                             get_output_bounds, snap_to_grid, warp_strips)
+
+
+def _box(x_min, y_min, x_max, y_max):
+    return f'POLYGON (({x_min} {y_min},{x_max} {y_min},{x_max} {y_max},{x_min} {y_max},{x_min} {y_min}))'
+
+
+def test_coverage_index(tmp_path):
+    tiles = [f'tile{x}_{y}' for x in range(-5, 5) for y in range(-5, 5)]
+    wkts = [_box(x, y, x + 1, y + 1) for x in range(-5, 5) for y in range(-5, 5)]
+    index = CoverageIndex(tiles, wkts)
+    assert index.cell_size == 1.0
+
+    query = ogr.CreateGeometryFromWkt(_box(0.5, 0.5, 1.5, 2.5))
+    assert [tiles[ii] for ii in index.candidates(query)] == \
+        ['tile0_0', 'tile0_1', 'tile0_2', 'tile1_0', 'tile1_1', 'tile1_2']
+    matches = index.intersecting(query)
+    assert [tile for tile, _, _ in matches] == ['tile0_0', 'tile0_1', 'tile0_2', 'tile1_0', 'tile1_1', 'tile1_2']
+    assert sum(area for _, _, area in matches) == pytest.approx(2.0)
+
+    # a query covering more cells than there are tiles falls back to a full scan
+    query = ogr.CreateGeometryFromWkt(_box(-100, -100, 100, 100))
+    assert len(index.intersecting(query)) == 100
+
+    index_file = tmp_path / 'index.json'
+    index.save(index_file)
+    loaded = CoverageIndex.load(index_file)
+    assert loaded.tiles == index.tiles
+    assert loaded.wkts == index.wkts
+
+
+def _coverage_shapefile(shape_file, tiles):
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(4326)
+    fields = [{'name': 'tile', 'type': ogr.OFTString, 'width': 10}]
+    values = [{'tile': tile, 'geometry': ogr.CreateGeometryFromWkt(_box(ii, 0, ii + 1, 1))}
+              for ii, tile in enumerate(tiles)]
+    asf_geometry.geometry2shape(fields, values, srs, False, shape_file)
+
+
+def test_coverage_index_out_of_date(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_dem_module, '_coverage_indexes', {})
+    shape_file = str(tmp_path / 'test_coverage.shp')
+    dem = {'name': 'TEST', 'coverage': shape_file}
+    index_dir = str(tmp_path / 'index')
+
+    _coverage_shapefile(shape_file, ['tile0'])
+    assert get_coverage_index(dem, index_dir=index_dir).tiles == ['tile0']
+    assert CoverageIndex.load(tmp_path / 'index' / 'test_coverage.json').source == coverage_signature(shape_file)
+
+    monkeypatch.setattr(get_dem_module, '_coverage_indexes', {})
+    assert get_coverage_index(dem, index_dir=index_dir).tiles == ['tile0']
+
+    monkeypatch.setattr(get_dem_module, '_coverage_indexes', {})
+    _coverage_shapefile(shape_file, ['tile0', 'tile1'])
+    assert get_coverage_index(dem, index_dir=index_dir).tiles == ['tile0', 'tile1']
+    assert CoverageIndex.load(tmp_path / 'index' / 'test_coverage.json').tiles == ['tile0', 'tile1']
 
 
 def test_get_best_dem_no_coverage():
@@ -127,3 +187,79 @@ def test_get_dem_srtmgl1_antimeridian(tmp_path, test_data_folder):
     assert name == 'SRTMGL1'
     assert output_file.exists()
     assert cmp(output_file, test_data_folder / 'test_srtmgl1_antimeridian_dem.tif')
+
+
+def test_get_output_bounds():
+    assert get_output_bounds(-0.6, 0.1, 0.6, 0.9, 4326, 0.25) == [-0.75, 0.0, 0.75, 1.0]
+
+    bounds = get_output_bounds(-123.02, 37.99, -123.01, 37.999, 32610, 30.0)
+    assert all(coordinate % 30.0 == 0 for coordinate in bounds)
+    assert 497000 < bounds[0] < bounds[2] < 500000
+    assert 4204000 < bounds[1] < bounds[3] < 4206000
+
+
+def test_get_dem_single_warp(tmp_path):
+    chdir(tmp_path)
+    output_file = tmp_path / 'dem.tif'
+    name = get_dem(y_min=37.99, y_max=37.999, x_min=-123.02, x_max=-123.01, outfile=str(output_file), post=30.0,
+                   single_warp=True)
+    assert name == 'NED13'
+    assert output_file.exists()
+    assert not (tmp_path / 'xxyyzz_img.tif').exists()
+
+
+def test_get_dem_stream_tiles(tmp_path, test_data_folder):
+    chdir(tmp_path)
+    output_file = tmp_path / 'dem.tif'
+    name = get_dem(y_min=37.99, y_max=37.999, x_min=-123.02, x_max=-123.01, outfile=str(output_file), post=30.0,
+                   stream_tiles=True)
+    assert name == 'NED13'
+    assert not (tmp_path / 'DEM').exists()
+    assert cmp(output_file, test_data_folder / 'test_ned13_dem.tif')
+
+
+def test_get_dems(tmp_path):
+    chdir(tmp_path)
+    aois = [
+        (-123.02, 37.99, -123.01, 37.999, str(tmp_path / 'dem1.tif')),
+        (-123.03, 37.98, -123.02, 37.989, str(tmp_path / 'dem2.tif')),
+        (27.2, -6.8, 27.21, -6.79, str(tmp_path / 'dem3.tif')),
+    ]
+    names = get_dems(aois, post=30.0, processes=2)
+    assert names == ['NED13', 'NED13', 'SRTMGL1']
+    for aoi in aois:
+        assert (tmp_path / aoi[-1]).exists()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['dem1.tif', 'dem2.tif', 'dem3.tif']
+
+
+def test_warp_strips(tmp_path):
+    source = str(tmp_path / 'source.tif')
+    ds = gdal.GetDriverByName('GTiff').Create(source, 600, 500, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform([-123.1, 0.0002, 0, 38.1, 0, -0.0002])
+    ds.SetProjection('EPSG:4326')
+    ds.GetRasterBand(1).WriteArray(np.random.default_rng(0).random((500, 600), dtype=np.float32) * 1000)
+    ds = None
+
+    warp_options = dict(dstSRS='EPSG:32610', xRes=10.0, yRes=10.0, resampleAlg='cubic', dstNodata=-32767)
+    single = warp_strips(str(tmp_path / 'single.tif'), source, workers=1, **warp_options).ReadAsArray()
+    strips = warp_strips(str(tmp_path / 'strips.tif'), source, workers=3, strip_rows=64, **warp_options).ReadAsArray()
+
+    assert single.shape == strips.shape
+    assert np.array_equal(single, strips)
+
+
+def test_snap_to_grid_processes(tmp_path):
+    source = str(tmp_path / 'source.tif')
+    ds = gdal.GetDriverByName('GTiff').Create(source, 600, 500, 1, gdal.GDT_Float32)
+    ds.SetGeoTransform([500012.3, 10, 0, 4200007.1, 0, -10])
+    ds.SetProjection('EPSG:32610')
+    ds.GetRasterBand(1).WriteArray(np.random.default_rng(0).random((500, 600), dtype=np.float32) * 1000)
+    ds = None
+
+    snap_to_grid(30, 10, source, str(tmp_path / 'default.tif'))
+    snap_to_grid(30, 10, source, str(tmp_path / 'strips.tif'), workers=3)
+
+    default = gdal.Open(str(tmp_path / 'default.tif'))
+    strips = gdal.Open(str(tmp_path / 'strips.tif'))
+    assert default.GetGeoTransform() == strips.GetGeoTransform()
+    assert np.allclose(default.ReadAsArray(), strips.ReadAsArray(), rtol=1e-4)
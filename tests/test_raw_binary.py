@@ -0,0 +1,143 @@
+import numpy as np
+from osgeo import gdal
+
+from hyp3lib.raw_binary import RawBinary
+from hyp3lib.saa_func_lib import Window
+
+
+def test_gamma_slc(tmp_path):
+    slc = (np.random.rand(20, 30) + 1j * np.random.rand(20, 30)).astype('>c8')
+    slc_file = str(tmp_path / '20200101_001.slc')
+    slc.tofile(slc_file)
+    (tmp_path / '20200101_001.slc.par').write_text(
+        'title:     S1A_IW_SLC\n'
+        'image_format:               FCOMPLEX\n'
+        'range_samples:                   30\n'
+        'azimuth_lines:                   20\n'
+    )
+
+    raw = RawBinary.from_gamma_par(slc_file)
+    assert raw.shape == (20, 30)
+    assert np.array_equal(raw.memmap(), slc)
+    assert np.array_equal(raw.read(Window(2, 3, 5, 4)), slc[3:7, 2:7])
+
+    ds = gdal.Open(raw.to_vrt())
+    assert ds.GetRasterBand(1).DataType == gdal.GDT_CFloat32
+    assert np.array_equal(ds.GetRasterBand(1).ReadAsArray(), slc)
+
+
+def test_gamma_dem(tmp_path):
+    dem = np.arange(12, dtype='>f4').reshape(3, 4)
+    dem_file = str(tmp_path / 'dem')
+    dem.tofile(dem_file)
+    (tmp_path / 'dem_par').write_text(
+        'data_format:          REAL*4\n'
+        'width:                     4\n'
+        'nlines:                    3\n'
+        'corner_north:   100.000  m\n'
+        'corner_east:     50.000  m\n'
+        'post_north:     -10.000  m\n'
+        'post_east:       10.000  m\n'
+        'projection_name:     UTM\n'
+        'projection_zone:      6\n'
+        'false_northing:   10000000.000   m\n'
+    )
+
+    raw = RawBinary.from_gamma_par(dem_file, str(tmp_path / 'dem_par'))
+    assert raw.geotransform == (45.0, 10.0, 0.0, 105.0, 0.0, -10.0)
+    assert raw.projection == 'EPSG:32706'
+    assert raw.read().dtype.isnative
+    assert np.array_equal(raw.read(), dem)
+
+
+def test_gamma_eqa_dem(tmp_path):
+    dem = np.arange(12, dtype='>f4').reshape(3, 4)
+    dem_file = str(tmp_path / 'dem')
+    dem.tofile(dem_file)
+    (tmp_path / 'dem_par').write_text(
+        'DEM_projection:     EQA\n'
+        'data_format:        REAL*4\n'
+        'width:                   4\n'
+        'nlines:                  3\n'
+        'corner_lat:     60.0000000  decimal degrees\n'
+        'corner_lon:   -150.0000000  decimal degrees\n'
+        'post_lat:       -0.5000000  decimal degrees\n'
+        'post_lon:        0.5000000  decimal degrees\n'
+    )
+
+    raw = RawBinary.from_gamma_par(dem_file, str(tmp_path / 'dem_par'))
+    assert raw.geotransform == (-150.25, 0.5, 0.0, 60.25, 0.0, -0.5)
+
+    ds = gdal.Open(raw.to_vrt())
+    assert ds.GetSpatialRef().GetAuthorityCode(None) == '4326'
+    assert ds.GetGeoTransform() == raw.geotransform
+
+
+def test_isce_bil(tmp_path):
+    data = np.random.rand(6, 2, 5).astype('<f4')
+    data_file = str(tmp_path / 'filt_topophase.unw.geo')
+    data.tofile(data_file)
+    (tmp_path / 'filt_topophase.unw.geo.xml').write_text(
+        '<imageFile>'
+        '<property name="WIDTH"><value>5</value></property>'
+        '<property name="LENGTH"><value>6</value></property>'
+        '<property name="NUMBER_BANDS"><value>2</value></property>'
+        '<property name="DATA_TYPE"><value>FLOAT</value></property>'
+        '<property name="SCHEME"><value>BIL</value></property>'
+        '<property name="BYTE_ORDER"><value>l</value></property>'
+        '<property name="FIRST_LONGITUDE"><value>-150.0</value></property>'
+        '<property name="DELTA_LONGITUDE"><value>0.1</value></property>'
+        '<property name="FIRST_LATITUDE"><value>60.0</value></property>'
+        '<property name="DELTA_LATITUDE"><value>-0.1</value></property>'
+        '</imageFile>'
+    )
+
+    raw = RawBinary.from_isce_xml(f'{data_file}.xml')
+    assert raw.filename == data_file
+    assert np.array_equal(raw.read(band=2), data[:, 1, :])
+
+    vrt_file = raw.to_vrt(str(tmp_path / 'unw.vrt'))
+    ds = gdal.Open(vrt_file)
+    assert ds.RasterCount == 2
+    assert ds.GetGeoTransform() == (-150.0, 0.1, 0.0, 60.0, 0.0, -0.1)
+    assert np.array_equal(ds.GetRasterBand(2).ReadAsArray(), data[:, 1, :])
+
+
+def test_isce_coordinate_components(tmp_path):
+    data = np.random.rand(6, 5).astype('<f4')
+    data_file = str(tmp_path / 'phsig.cor.geo')
+    data.tofile(data_file)
+
+    def coordinate(name, start, delta, size):
+        return (f'<component name="{name}">'
+                f'<factorymodule>isceobj.Image</factorymodule>'
+                f'<factoryname>createCoordinate</factoryname>'
+                f'<property name="startingvalue"><value>{start}</value></property>'
+                f'<property name="delta"><value>{delta}</value></property>'
+                f'<property name="size"><value>{size}</value></property>'
+                f'</component>')
+
+    (tmp_path / 'phsig.cor.geo.xml').write_text(
+        '<imageFile>'
+        '<property name="width"><value>5</value></property>'
+        '<property name="length"><value>6</value></property>'
+        '<property name="data_type"><value>FLOAT</value></property>'
+        '<property name="scheme"><value>BIL</value></property>'
+        + coordinate('coordinate1', -150.0, 0.1, 5) + coordinate('coordinate2', 60.0, -0.1, 6) +
+        '</imageFile>'
+    )
+
+    raw = RawBinary.from_isce_xml(f'{data_file}.xml')
+    assert raw.geotransform == (-150.0, 0.1, 0.0, 60.0, 0.0, -0.1)
+    assert raw.projection == 'EPSG:4326'
+    assert np.array_equal(raw.read(), data)
+
+    (tmp_path / 'phsig.cor.geo.xml').write_text(
+        '<imageFile>'
+        '<property name="width"><value>5</value></property>'
+        '<property name="length"><value>6</value></property>'
+        '<property name="data_type"><value>FLOAT</value></property>'
+        + coordinate('coordinate1', 0.0, 1, 5) + coordinate('coordinate2', 0.0, 1, 6) +
+        '</imageFile>'
+    )
+    assert RawBinary.from_isce_xml(f'{data_file}.xml').geotransform is None
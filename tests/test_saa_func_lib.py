@@ -0,0 +1,198 @@
+import os
+
+import numpy as np
+from osgeo import gdal
+
+from hyp3lib import saa_func_lib as saa
+
+
+def _make_raster(filename, data, creation_options=()):
+    ds = gdal.GetDriverByName('GTiff').Create(str(filename), data.shape[1], data.shape[0], 1, gdal.GDT_Float32,
+                                              list(creation_options))
+    ds.SetGeoTransform([0, 1, 0, 0, 0, -1])
+    ds.GetRasterBand(1).WriteArray(data)
+    ds.FlushCache()
+    return ds
+
+
+def test_block_windows(tmp_path):
+    data = np.arange(100 * 70, dtype=np.float32).reshape(100, 70)
+    ds = _make_raster(tmp_path / 'tiled.tif', data, ['TILED=YES', 'BLOCKXSIZE=32', 'BLOCKYSIZE=32'])
+
+    windows = list(saa.block_windows(ds, max_pixels=2 * 32 * 32))
+    assert windows[:3] == [saa.Window(0, 0, 64, 32), saa.Window(64, 0, 6, 32), saa.Window(0, 32, 64, 32)]
+    assert windows[-1] == saa.Window(64, 96, 6, 4)
+    assert sum(w.xsize * w.ysize for w in windows) == data.size
+
+    ds = _make_raster(tmp_path / 'striped.tif', data)
+    block_ysize = ds.GetRasterBand(1).GetBlockSize()[1]
+    for window in saa.block_windows(ds, max_pixels=1):
+        assert window.xsize == 70
+        assert window.yoff % block_ysize == 0
+
+
+def test_read_gdal_blocks(tmp_path):
+    data = np.arange(100 * 70, dtype=np.float32).reshape(100, 70)
+    ds = _make_raster(tmp_path / 'tiled.tif', data, ['TILED=YES', 'BLOCKXSIZE=32', 'BLOCKYSIZE=32'])
+
+    for block in saa.read_gdal_blocks(ds, halo=3, max_pixels=32 * 32):
+        w = block.window
+        assert np.array_equal(block.data[block.core], data[w.yoff:w.yoff + w.ysize, w.xoff:w.xoff + w.xsize])
+        assert block.data.shape[0] <= w.ysize + 6
+        assert block.data.shape[1] <= w.xsize + 6
+
+
+def test_write_gdal_blocks(tmp_path):
+    data = np.random.rand(100, 70).astype(np.float32)
+    src = _make_raster(tmp_path / 'src.tif', data, ['TILED=YES', 'BLOCKXSIZE=32', 'BLOCKYSIZE=32'])
+    dst = _make_raster(tmp_path / 'dst.tif', np.zeros_like(data))
+
+    blocks = saa.read_gdal_blocks(src, halo=1, max_pixels=32 * 32)
+    saa.write_gdal_blocks(dst, ((block.window, block.data[block.core] * 2) for block in blocks))
+
+    assert np.array_equal(dst.GetRasterBand(1).ReadAsArray(), data * 2)
+
+
+def test_raster(tmp_path):
+    data = np.arange(100 * 70, dtype=np.float32).reshape(100, 70)
+    ds = _make_raster(tmp_path / 'raster.tif', data)
+    ds.GetRasterBand(1).SetNoDataValue(-1)
+    ds = None
+
+    raster = saa.Raster(tmp_path / 'raster.tif')
+    assert raster.xsize == 70
+    assert raster.ysize == 100
+    assert raster.geotransform == (0, 1, 0, 0, 0, -1)
+    assert raster.corners == (0, 70, -100, 0)
+    assert raster.dtype() == np.float32
+    assert raster.nodata() == -1
+    assert np.array_equal(raster.read(window=saa.Window(10, 20, 5, 5)), data[20:25, 10:15])
+
+    assert saa.read_gdal_file(raster.handle)[4].shape == (100, 70)
+    assert saa.getCorners(str(tmp_path / 'raster.tif')) == raster.corners
+
+
+def test_cached_geometry(tmp_path):
+    filename = str(tmp_path / 'raster.tif')
+    _make_raster(filename, np.zeros((100, 70), dtype=np.float32))
+
+    hits = saa._raster_geometry.cache_info().hits
+    assert saa.getCorners(filename) == (0, 70, -100, 0)
+    assert saa.getPixSize(filename) == 1
+    assert saa._raster_geometry.cache_info().hits == hits + 1
+
+    _make_raster(filename, np.zeros((50, 30), dtype=np.float32))
+    assert saa.getCorners(filename) == (0, 30, -50, 0)
+
+
+def test_cached_geometry_relative_path(tmp_path, monkeypatch):
+    for ii, directory in enumerate(['a', 'b']):
+        (tmp_path / directory).mkdir()
+        ds = _make_raster(tmp_path / directory / 'raster.tif', np.zeros((10, 10), dtype=np.float32))
+        ds.SetGeoTransform([ii * 100, 1, 0, 0, 0, -1])
+        ds = None
+        os.utime(tmp_path / directory / 'raster.tif', ns=(0, 0))
+
+    monkeypatch.chdir(tmp_path / 'a')
+    assert saa.getCorners('raster.tif') == (0, 10, -10, 0)
+    monkeypatch.chdir(tmp_path / 'b')
+    assert saa.getCorners('raster.tif') == (100, 110, -10, 0)
+
+
+def test_raster_statistics(tmp_path):
+    data = np.arange(100 * 70, dtype=np.float32).reshape(100, 70)
+    _make_raster(tmp_path / 'raster.tif', data)
+
+    raster = saa.Raster(str(tmp_path / 'raster.tif'))
+    minimum, maximum, mean, _ = raster.statistics()
+    assert (minimum, maximum) == (0, data.max())
+    assert np.isclose(mean, data.mean())
+    raster.close()
+
+    assert (tmp_path / 'raster.tif.aux.xml').exists()
+    assert saa.Raster(str(tmp_path / 'raster.tif')).statistics()[:2] == (0, data.max())
+
+
+def test_write_geotiff(tmp_path):
+    data = np.random.rand(1200, 1100).astype(np.float32)
+    out_file = str(tmp_path / 'out.tif')
+    saa.write_geotiff(out_file, [0, 1, 0, 0, 0, -1], '', data, nodata=-1, overviews='auto')
+
+    ds = gdal.Open(out_file)
+    band = ds.GetRasterBand(1)
+    assert band.GetBlockSize() == [512, 512]
+    assert ds.GetMetadataItem('COMPRESSION', 'IMAGE_STRUCTURE') == 'DEFLATE'
+    assert ds.GetMetadataItem('PREDICTOR', 'IMAGE_STRUCTURE') == '3'
+    assert band.GetNoDataValue() == -1
+    assert band.GetOverviewCount() == 2
+    assert np.array_equal(band.ReadAsArray(), data)
+
+
+def test_geotiff_writer_stream(tmp_path):
+    data = np.arange(100 * 70, dtype=np.float32).reshape(100, 70)
+    src = _make_raster(tmp_path / 'src.tif', data)
+
+    out_file = str(tmp_path / 'out.tif')
+    with saa.GeoTiffWriter(out_file, 70, 100, src.GetGeoTransform(), src.GetProjection(), gdal.GDT_Int16,
+                           block_size=32) as writer:
+        writer.write_blocks((block.window, block.data) for block in saa.read_gdal_blocks(src, max_pixels=700))
+
+    ds = gdal.Open(out_file)
+    assert ds.GetRasterBand(1).DataType == gdal.GDT_Int16
+    assert ds.GetMetadataItem('PREDICTOR', 'IMAGE_STRUCTURE') == '2'
+    assert np.array_equal(ds.GetRasterBand(1).ReadAsArray(), data)
+
+
+def test_write_gdal_file_rgb(tmp_path):
+    bands = [np.full((10, 20), value, dtype=np.uint8) for value in (1, 2, 3)]
+    out_file = str(tmp_path / 'rgb.tif')
+    saa.write_gdal_file_rgb(out_file, [0, 1, 0, 0, 0, -1], '', *bands, metadata={'KEY': 'VALUE'})
+
+    ds = gdal.Open(out_file)
+    assert ds.RasterCount == 3
+    assert ds.GetMetadataItem('KEY') == 'VALUE'
+    for ii, band in enumerate(bands, start=1):
+        assert np.array_equal(ds.GetRasterBand(ii).ReadAsArray(), band)
+
+
+def test_boxcar():
+    image = np.random.rand(301, 257)
+
+    expected = image.copy()
+    for ii in range(image.shape[0]):
+        expected[ii, :] = np.convolve(np.ones(5) / 5, image[ii, :], mode='same')
+    assert np.allclose(saa.boxcar_y(image, 5), expected, atol=1e-6)
+
+    expected = image.copy()
+    for jj in range(image.shape[1]):
+        expected[:, jj] = np.convolve(np.ones(4) / 4, image[:, jj], mode='same')
+    assert np.allclose(saa.boxcar_x(image, 4), expected, atol=1e-6)
+
+    filtered = saa.boxcar(image, 15, 9)
+    assert filtered.dtype == np.float32
+    assert np.array_equal(saa.boxcar(image, 15, 9, workers=4, chunk_rows=37), filtered)
+
+
+def test_estimate_offsets():
+    secondaries = np.random.default_rng(13).random((10, 64, 48))
+    references = np.roll(secondaries, (3, -5), axis=(1, 2))
+
+    offsets = saa.estimate_offsets(references, secondaries, apodize=False, batch_size=3)
+    assert np.array_equal(offsets.row, [3] * 10)
+    assert np.array_equal(offsets.col, [-5] * 10)
+    assert np.allclose(offsets.row_subpixel, 3)
+    assert np.allclose(offsets.col_subpixel, -5)
+    assert (offsets.snr > 10).all()
+
+    threaded = saa.estimate_offsets(references, secondaries, apodize=False, batch_size=3, workers=2)
+    assert np.array_equal(threaded.snr, offsets.snr)
+
+
+def test_offset_grid():
+    secondary = np.random.default_rng(13).random((256, 256))
+    reference = np.roll(secondary, (-2, 1), axis=(0, 1))
+
+    offsets = saa.offset_grid(reference, secondary, chip_size=64, step=32)
+    assert offsets.row.shape == (7, 7)
+    assert np.median(offsets.row) == -2
+    assert np.median(offsets.col) == 1
@@ -0,0 +1,82 @@
+import os
+
+from hyp3lib.tile_cache import TileCache
+
+
+def _make_tile(directory, name, size):
+    tile = directory / f'{name}.tif'
+    tile.write_bytes(os.urandom(size))
+    return tile
+
+
+def test_fetch_hit_and_miss(tmp_path):
+    source = _make_tile(tmp_path, 'N00E000', 100)
+    cache = TileCache(tmp_path / 'cache')
+
+    assert cache.get('SRTMGL1', 'N00E000') is None
+    tile_path = cache.fetch('SRTMGL1', 'N00E000', str(source))
+    assert tile_path == str(tmp_path / 'cache' / 'SRTMGL1' / 'N00E000.tif')
+    assert cache.stats() == {'hits': 0, 'misses': 2, 'bytes_saved': 0}
+
+    assert cache.fetch('SRTMGL1', 'N00E000', str(source)) == tile_path
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'bytes_saved': 100}
+
+
+def test_corrupt_tile_is_a_miss(tmp_path):
+    source = _make_tile(tmp_path, 'N00E000', 100)
+    cache = TileCache(tmp_path / 'cache')
+    tile_path = cache.put('SRTMGL1', 'N00E000', str(source))
+
+    with open(tile_path, 'r+b') as f:
+        f.write(b'corrupt')
+    assert cache.get('SRTMGL1', 'N00E000') == tile_path
+    assert TileCache(tmp_path / 'cache', verify=True).get('SRTMGL1', 'N00E000') is None
+
+    with open(tile_path, 'ab') as f:
+        f.write(b'truncated download')
+    assert cache.get('SRTMGL1', 'N00E000') is None
+
+    os.remove(f'{tile_path}.sha256')
+    assert cache.get('SRTMGL1', 'N00E000') is None
+
+
+def test_lru_eviction(tmp_path):
+    cache = TileCache(tmp_path / 'cache', max_size=250, min_age=0)
+    for ii, name in enumerate(['N00E000', 'N00E001']):
+        cache.put('SRTMGL1', name, str(_make_tile(tmp_path, name, 100)))
+        os.utime(cache.path_for('SRTMGL1', name), (ii, ii))
+
+    assert cache.get('SRTMGL1', 'N00E000') is not None
+    cache.put('SRTMGL1', 'N00E002', str(_make_tile(tmp_path, 'N00E002', 100)))
+
+    assert cache.size() == 200
+    assert cache.get('SRTMGL1', 'N00E000') is not None
+    assert cache.get('SRTMGL1', 'N00E001') is None
+    assert cache.get('SRTMGL1', 'N00E002') is not None
+
+
+def test_from_environment(tmp_path, monkeypatch):
+    monkeypatch.delenv('HYP3_DEM_CACHE_DIR', raising=False)
+    assert TileCache.from_environment() is None
+
+    monkeypatch.setenv('HYP3_DEM_CACHE_DIR', str(tmp_path))
+    monkeypatch.setenv('HYP3_DEM_CACHE_SIZE', '1000')
+    cache = TileCache.from_environment()
+    assert cache.directory == tmp_path
+    assert cache.max_size == 1000
+
+
+def test_eviction_keeps_in_flight_tiles(tmp_path):
+    cache = TileCache(tmp_path / 'cache', max_size=150, min_age=0)
+    for ii, name in enumerate(['N00E000', 'N00E001', 'N00E002']):
+        cache.put('SRTMGL1', name, str(_make_tile(tmp_path, name, 100)), evict=False)
+        os.utime(cache.path_for('SRTMGL1', name), (ii, ii))
+
+    cache.evict(keep=[cache.path_for('SRTMGL1', 'N00E000')])
+    assert cache.get('SRTMGL1', 'N00E000') is not None
+    assert cache.get('SRTMGL1', 'N00E001') is None
+    assert cache.get('SRTMGL1', 'N00E002') is None
+
+    cache = TileCache(tmp_path / 'cache', max_size=0)
+    cache.put('SRTMGL1', 'N00E001', str(tmp_path / 'N00E001.tif'))
+    assert cache.size() == 200